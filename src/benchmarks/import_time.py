@@ -0,0 +1,81 @@
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules that are imported directly, either as a CLI entry point or by callers
+ENTRY_POINTS = (
+    "instrumentation",
+    "pipeline",
+    "ocr",
+    "ocr.main",
+    "ocr.get_output",
+    "ocr.server",
+    "report_generator.blood_analysis_extractor",
+    "report_generator.multi_blood_analysis",
+    "report_generator.rule_extractor",
+    "report_generator.batch_scoring",
+    "plots.plot_seperate_params",
+    "plots.plot_health_score",
+    "plots.trends",
+    "benchmarks.run",
+)
+
+
+def _heaviest(importtime_output, top):
+    # "import time: self [us] | cumulative | imported package"; top-level
+    # imports are the ones without indentation in the last column
+    imports = []
+    for line in importtime_output.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|", 2)
+        if not cumulative.strip().isdigit() or name.startswith("  "):
+            continue
+        imports.append((name.strip(), int(cumulative) / 1000))
+    return sorted(imports, key=lambda item: -item[1])[:top]
+
+
+def measure_import(module, repeats=3, top=5):
+    """
+    Times "import module" in fresh interpreters started from src.
+
+    Returns:
+        dict: {"module", "wall_ms" (best of repeats), "heaviest": [(name, ms)],
+            "error": stderr tail if the import failed}
+    """
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        process = subprocess.run([sys.executable, "-c", f"import {module}"], cwd=SRC_DIR,
+                                 capture_output=True, text=True)
+        elapsed = (time.perf_counter() - start) * 1000
+        if process.returncode != 0:
+            return {"module": module, "wall_ms": None, "heaviest": [],
+                    "error": process.stderr.strip().splitlines()[-1]}
+        best = elapsed if best is None else min(best, elapsed)
+
+    process = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], cwd=SRC_DIR,
+                             capture_output=True, text=True)
+    return {"module": module, "wall_ms": best, "heaviest": _heaviest(process.stderr, top), "error": None}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure the import time of every entry module.")
+    parser.add_argument("modules", nargs="*", default=list(ENTRY_POINTS))
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    baseline = measure_import("os", args.repeats)["wall_ms"]
+    print(f"{'module':<45} {'ms':>8}  heaviest imports")
+    print(f"{'(interpreter start-up)':<45} {baseline:>8.0f}")
+    for module in args.modules:
+        result = measure_import(module, args.repeats)
+        if result["error"]:
+            print(f"{module:<45} {'failed':>8}  {result['error']}")
+            continue
+        heaviest = ", ".join(f"{name} {ms:.0f}" for name, ms in result["heaviest"])
+        print(f"{module:<45} {result['wall_ms']:>8.0f}  {heaviest}")
@@ -0,0 +1,356 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from .sheets import generate_dataset
+
+RESULTS_DIR = "benchmarks/results"
+THRESHOLDS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "thresholds.json")
+
+
+def _percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def _normalize_line(line):
+    return " ".join(line.split())
+
+
+def _value_accuracy(truth_parameters, extracted_parameters):
+    """
+    Share of ground-truth parameters extracted with the right name and value.
+    """
+    extracted = {p["name"]: p.get("value") for p in extracted_parameters}
+    correct = sum(1 for p in truth_parameters
+                  if isinstance(extracted.get(p["name"]), (int, float))
+                  and abs(extracted[p["name"]] - p["value"]) < 1e-6)
+    return correct / len(truth_parameters) if truth_parameters else 1.0
+
+
+def bench_ocr(samples):
+    from ocr.ocr_reader import get_reader, read_text
+    from ocr.utils import easyocr_to_json
+    from report_generator.rule_extractor import extract_parameters
+
+    start = time.perf_counter()
+    try:
+        reader = get_reader(['ru'])
+    except ImportError as e:
+        return {"status": "skipped", "reason": f"OCR dependencies missing: {e}"}
+    load_s = time.perf_counter() - start
+
+    latencies, accuracies = [], []
+    start = time.perf_counter()
+    for image, truth, _ in samples:
+        t = time.perf_counter()
+        result = read_text(reader, image)
+        latencies.append(time.perf_counter() - t)
+        extracted, _, _ = extract_parameters(ocr_json=easyocr_to_json(result))
+        accuracies.append(_value_accuracy(truth["parameters"], extracted["parameters"]))
+    elapsed = time.perf_counter() - start
+    return {
+        "status": "ok",
+        "reader_load_s": load_s,
+        "p50_s": _percentile(latencies, 0.5),
+        "p95_s": _percentile(latencies, 0.95),
+        "images_per_s": len(samples) / elapsed,
+        "value_accuracy": sum(accuracies) / len(accuracies),
+    }
+
+
+def bench_layout(samples, seed=0):
+    """
+    Rebuilds text lines from the ground-truth word boxes in random order.
+
+    This isolates layout reconstruction and rule extraction from OCR errors.
+    """
+    from ocr.utils import easyocr_to_structured_text
+    from report_generator.rule_extractor import extract_parameters
+
+    rng = random.Random(seed)
+    matched = total = 0
+    accuracies, dates, layout_time, extract_time = [], 0, 0.0, 0.0
+    for _, truth, _ in samples:
+        ocr_result = [(box["bbox"], box["text"], box["confidence"]) for box in truth["boxes"]]
+        rng.shuffle(ocr_result)
+
+        start = time.perf_counter()
+        text = easyocr_to_structured_text(ocr_result)
+        layout_time += time.perf_counter() - start
+
+        produced = {}
+        for line in text.splitlines():
+            line = _normalize_line(line)
+            produced[line] = produced.get(line, 0) + 1
+        for line in truth["lines"]:
+            total += 1
+            if produced.get(line, 0):
+                produced[line] -= 1
+                matched += 1
+
+        start = time.perf_counter()
+        extracted, _, _ = extract_parameters(text)
+        extract_time += time.perf_counter() - start
+        accuracies.append(_value_accuracy(truth["parameters"], extracted["parameters"]))
+        dates += extracted["report_date"] == truth["report_date"]
+    return {
+        "status": "ok",
+        "line_accuracy": matched / total,
+        "date_accuracy": dates / len(samples),
+        "layout_ms_per_sheet": layout_time / len(samples) * 1000,
+        "rules_value_accuracy": sum(accuracies) / len(accuracies),
+        "rules_ms_per_sheet": extract_time / len(samples) * 1000,
+    }
+
+
+def bench_scoring(n_reports=20000, seed=0):
+    from report_generator.batch_scoring import batch_health_scores
+    from report_generator.benchmark_scoring import synthetic_reports
+    from report_generator.blood_analysis_extractor import compute_health_score
+
+    reports = synthetic_reports(n_reports, seed)
+    start = time.perf_counter()
+    scalar = [compute_health_score(parameters) for parameters in reports]
+    scalar_s = time.perf_counter() - start
+    start = time.perf_counter()
+    batch = batch_health_scores(reports)
+    batch_s = time.perf_counter() - start
+    return {
+        "status": "ok",
+        "reports": n_reports,
+        "scalar_s": scalar_s,
+        "batch_s": batch_s,
+        "batch_speedup": scalar_s / batch_s,
+        "mismatches": sum(1 for a, b in zip(scalar, batch) if a != b),
+    }
+
+
+def bench_plotting(samples, workers=None):
+    from plots.plot_seperate_params import plot_parameters_separately
+
+    names = sorted({p["name"] for _, truth, _ in samples for p in truth["parameters"]})
+    ordered = sorted((truth for _, truth, _ in samples), key=lambda t: t["report_date"])
+    param_dict = {name: [next((p["value"] for p in t["parameters"] if p["name"] == name), "-")
+                         for t in ordered] for name in names}
+    dates = [t["report_date"] for t in ordered]
+    genders = [t["gender"] for t in ordered]
+
+    output_dir = tempfile.mkdtemp(prefix="pd_bench_plots_")
+    # One pool for both runs, as a caller rendering repeatedly would keep
+    pool = ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1) if workers != 1 else None
+    try:
+        start = time.perf_counter()
+        cold = plot_parameters_separately(param_dict, dates, genders, output_dir, workers=workers, executor=pool)
+        cold_s = time.perf_counter() - start
+        start = time.perf_counter()
+        plot_parameters_separately(param_dict, dates, genders, output_dir, workers=workers, executor=pool)
+        warm_s = time.perf_counter() - start
+    finally:
+        if pool is not None:
+            pool.shutdown()
+        shutil.rmtree(output_dir, ignore_errors=True)
+    return {"status": "ok", "charts": cold["rendered"], "cold_s": cold_s, "warm_s": warm_s}
+
+
+def bench_llm_extraction(samples, port=8019, latency=0.05, concurrency=8):
+    """
+    Runs the LLM extraction path against the stub server, which answers
+    every prompt with the ground truth of the sheet it contains.
+    """
+    from report_generator.blood_analysis_extractor import analyze_blood_reports_async
+    from report_generator.llm_client import AsyncLLMClient, HTTPBackend
+    from report_generator.stub_llm_server import serve
+
+    texts = ["\n".join(truth["lines"]) for _, truth, _ in samples]
+    answers = [{k: truth[k] for k in ("report_date", "gender", "parameters")} for _, truth, _ in samples]
+
+    def responder(payload):
+        prompt = payload["messages"][-1]["content"]
+        for text, answer in zip(texts, answers):
+            if text in prompt:
+                return dict(answer, summary="Stub response")
+        return {"parameters": [], "summary": "Unknown report"}
+
+    server = serve(port, latency, responder=responder)
+    try:
+        client = AsyncLLMClient(HTTPBackend(f"http://127.0.0.1:{port}/v1"), concurrency=concurrency)
+        start = time.perf_counter()
+        results = asyncio.run(analyze_blood_reports_async(texts, client))
+        elapsed = time.perf_counter() - start
+    finally:
+        server.shutdown()
+    accuracies = [_value_accuracy(answer["parameters"], r.get("parameters", [])) if isinstance(r, dict) else 0.0
+                  for answer, r in zip(answers, results)]
+    stats = client.stats()
+    return {
+        "status": "ok",
+        "reports_per_s": len(texts) / elapsed,
+        "p95_request_s": stats["p95_latency"],
+        "failures": sum(1 for r in results if not isinstance(r, dict)),
+        "value_accuracy": sum(accuracies) / len(accuracies),
+    }
+
+
+# Lines a real lab sheet repeats on every page around the results table
+BOILERPLATE_HEADER = [
+    'ООО "Медицинская лаборатория"        Лицензия № ЛО-77-01-012345',
+    'Адрес: г. Москва, ул. Ленина, д. 1        тел.: +7 (495) 123-45-67        www.lab.ru',
+]
+BOILERPLATE_FOOTER = [
+    'Результаты исследований не являются диагнозом, необходима консультация врача',
+    'Врач клинической лабораторной диагностики:            Петрова И. И.            подпись',
+]
+
+
+def bench_compaction(samples):
+    """
+    Compacts two-page structured OCR texts with lab boilerplate.
+
+    Each sheet is laid out from its ground-truth boxes, then split into two
+    pages that both carry the lab header, sheet header and footer. Rule
+    extraction must find the same values, date and sex after compaction.
+    """
+    from ocr.utils import easyocr_to_structured_text
+    from report_generator.compaction import compact_text
+    from report_generator.rule_extractor import extract_parameters
+
+    ratios, accuracies, kept_headers, compact_time = [], [], 0, 0.0
+    for _, truth, _ in samples:
+        ocr_result = [(box["bbox"], box["text"], box["confidence"]) for box in truth["boxes"]]
+        lines = easyocr_to_structured_text(ocr_result).splitlines()
+        n_header = len(truth["lines"]) - len(truth["parameters"])
+        header, rows = lines[:n_header], lines[n_header:]
+        half = len(rows) // 2
+        pages = [BOILERPLATE_HEADER + header + part + BOILERPLATE_FOOTER + [f"Страница {n} из 2"]
+                 for n, part in enumerate((rows[:half], rows[half:]), 1)]
+        text = "\n".join(line for page in pages for line in page)
+
+        start = time.perf_counter()
+        compacted, stats = compact_text(text)
+        compact_time += time.perf_counter() - start
+        ratios.append(stats["tokens_saved"] / stats["tokens_before"])
+
+        extracted, _, _ = extract_parameters(compacted)
+        accuracies.append(_value_accuracy(truth["parameters"], extracted["parameters"]))
+        kept_headers += (extracted["report_date"] == truth["report_date"]
+                         and extracted["gender"] == truth["gender"])
+    return {
+        "status": "ok",
+        "tokens_saved_share": sum(ratios) / len(ratios),
+        "rules_value_accuracy": sum(accuracies) / len(accuracies),
+        "header_accuracy": kept_headers / len(samples),
+        "compact_ms_per_sheet": compact_time / len(samples) * 1000,
+    }
+
+
+def bench_imports():
+    from .import_time import ENTRY_POINTS, measure_import
+
+    results = {"status": "ok"}
+    for module in ENTRY_POINTS:
+        measured = measure_import(module)
+        if measured["error"] is None:
+            results[module] = measured["wall_ms"]
+    return results
+
+
+BENCHMARKS = ("ocr", "layout", "scoring", "plotting", "llm", "compaction", "imports")
+
+
+def check_thresholds(results, thresholds):
+    """
+    Compares results with {"section.metric": {"min": x, "max": y}} thresholds.
+
+    Metrics of skipped sections are not checked.
+
+    Returns:
+        list: One {"metric", "value", "min", "max", "ok"} dict per threshold
+    """
+    checks = []
+    for metric, bounds in thresholds.items():
+        section, name = metric.split(".", 1)
+        value = results.get(section, {}).get(name)
+        if value is None:
+            continue
+        ok = ("min" not in bounds or value >= bounds["min"]) and ("max" not in bounds or value <= bounds["max"])
+        checks.append({"metric": metric, "value": value, **bounds, "ok": ok})
+    return checks
+
+
+def run_benchmarks(selected=BENCHMARKS, n_sheets=12, seed=0, output_dir=RESULTS_DIR, thresholds_path=THRESHOLDS_PATH,
+                   sheets_dir=None):
+    """
+    Runs the selected benchmarks and writes results and threshold checks.
+
+    Returns:
+        dict: The report that was written to output_dir/latest.json
+    """
+    start = time.perf_counter()
+    samples = generate_dataset(n_sheets, seed, output_dir=sheets_dir)
+    generate_s = time.perf_counter() - start
+
+    runners = {
+        "ocr": lambda: bench_ocr(samples),
+        "layout": lambda: bench_layout(samples, seed),
+        "scoring": lambda: bench_scoring(seed=seed),
+        "plotting": lambda: bench_plotting(samples),
+        "llm": lambda: bench_llm_extraction(samples),
+        "compaction": lambda: bench_compaction(samples),
+        "imports": bench_imports,
+    }
+    results = {}
+    for name in selected:
+        print(f"Running {name} benchmark...")
+        results[name] = runners[name]()
+
+    thresholds = {}
+    if thresholds_path and os.path.exists(thresholds_path):
+        with open(thresholds_path, "r", encoding="utf-8") as f:
+            thresholds = json.load(f)
+    checks = check_thresholds(results, thresholds)
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {"sheets": n_sheets, "seed": seed, "generate_s": generate_s},
+        "results": results,
+        "checks": checks,
+        "passed": all(check["ok"] for check in checks),
+    }
+    os.makedirs(output_dir, exist_ok=True)
+    for filename in (f"results_{time.strftime('%Y%m%d_%H%M%S')}.json", "latest.json"):
+        with open(os.path.join(output_dir, filename), "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark OCR, layout, extraction, scoring and plotting "
+                                                 "on synthetic Russian blood test sheets.")
+    parser.add_argument("--only", nargs="+", choices=BENCHMARKS, default=list(BENCHMARKS))
+    parser.add_argument("--sheets", type=int, default=12, help="Number of synthetic sheets")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output-dir", default=RESULTS_DIR)
+    parser.add_argument("--thresholds", default=THRESHOLDS_PATH)
+    parser.add_argument("--save-sheets", help="Also write the sheets and their ground truth to this directory")
+    args = parser.parse_args()
+
+    report = run_benchmarks(args.only, args.sheets, args.seed, args.output_dir, args.thresholds, args.save_sheets)
+    for name, result in report["results"].items():
+        print(f"{name}: " + ", ".join(f"{k}={v:.4g}" if isinstance(v, float) else f"{k}={v}"
+                                      for k, v in result.items()))
+    for check in report["checks"]:
+        if not check["ok"]:
+            print(f"REGRESSION {check['metric']} = {check['value']:.4g} "
+                  f"(min {check.get('min')}, max {check.get('max')})")
+    sys.exit(0 if report["passed"] else 1)
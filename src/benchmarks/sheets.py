@@ -0,0 +1,220 @@
+import json
+import math
+import os
+import random
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+from report_generator.blood_analysis_extractor import NORMAL_RANGES
+from report_generator.rule_extractor import PARAMETER_ALIASES
+from report_generator.units import RUSSIAN_UNITS
+
+FONT_CANDIDATES = (
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+    "/usr/share/fonts/dejavu/DejaVuSans.ttf",
+    "/Library/Fonts/Arial Unicode.ttf",
+    "arial.ttf",
+)
+
+
+def find_font(font_path=None):
+    """
+    Returns the path of a TrueType font with Cyrillic glyphs.
+    """
+    for candidate in ((font_path,) if font_path else FONT_CANDIDATES):
+        try:
+            ImageFont.truetype(candidate, size=12)
+            return candidate
+        except OSError:
+            continue
+    raise OSError("No Cyrillic TrueType font found; pass font_path (e.g. DejaVuSans.ttf)")
+
+
+def _label(name):
+    # First alias is the Russian name used on the sheets
+    return PARAMETER_ALIASES[name][0].capitalize()
+
+
+def _decimals(info):
+    sd = info["sd"] or 1.0
+    return max(0, min(3, 1 - int(math.floor(math.log10(sd)))))
+
+
+def random_parameters(rng, min_count=8, max_count=None):
+    """
+    Picks random parameters with values around their reference means.
+
+    Returns:
+        list: {"name", "value", "unit"} dicts in NORMAL_RANGES order
+    """
+    names = list(NORMAL_RANGES)
+    chosen = set(rng.sample(names, rng.randint(min_count, max_count or len(names))))
+    parameters = []
+    for name in names:
+        if name not in chosen:
+            continue
+        info = NORMAL_RANGES[name]
+        if info["sd"] == 0:
+            value = float(rng.choice([0, 0, 0, 1]))
+        else:
+            value = max(0.0, rng.gauss(info["mean"], info["sd"] * 1.5))
+        parameters.append({"name": name, "value": round(value, _decimals(info)), "unit": info["unit"]})
+    return parameters
+
+
+def _format_value(value, decimals):
+    return f"{value:.{decimals}f}".replace(".", ",")
+
+
+def _sheet_rows(parameters, report_date, gender, birth_date):
+    year, month, day = report_date.split("-")
+    birth_year, birth_month, birth_day = birth_date.split("-")
+    header = [
+        ["Клинический", "анализ", "крови"],
+        ["Пол:", "Женский" if gender == "Female" else "Мужской"],
+        # An earlier labelled date that must not be taken for the report date
+        ["Дата", "рождения:", f"{birth_day}.{birth_month}.{birth_year}"],
+        ["Дата", "взятия:", f"{day}.{month}.{year}"],
+        ["Показатель", "Результат", "Ед.", "изм.", "Референсные", "значения"],
+    ]
+    rows = []
+    for p in parameters:
+        info = NORMAL_RANGES[p["name"]]
+        decimals = _decimals(info)
+        low = max(0.0, info["mean"] - 2 * info["sd"])
+        high = info["mean"] + 2 * info["sd"]
+        rows.append({
+            "columns": [_label(p["name"]).split(), [_format_value(p["value"], decimals)],
+                        [RUSSIAN_UNITS[p["unit"]]],
+                        [f"{_format_value(low, decimals)}-{_format_value(high, decimals)}"]],
+            "parameter": p,
+        })
+    return header, rows
+
+
+def _rotate_points(points, angle, size, new_size):
+    # PIL rotates counter-clockwise about the centre; with expand=True the
+    # canvas grows and the centre moves to the new canvas centre
+    theta = math.radians(angle)
+    cos, sin = math.cos(theta), math.sin(theta)
+    cx, cy = size[0] / 2, size[1] / 2
+    ncx, ncy = new_size[0] / 2, new_size[1] / 2
+    return [[ncx + (x - cx) * cos + (y - cy) * sin, ncy - (x - cx) * sin + (y - cy) * cos]
+            for x, y in points]
+
+
+def render_sheet(parameters, report_date="2025-03-04", gender="Female", scale=1.0, noise=0.0, rotation=0.0,
+                 font_path=None, seed=0, birth_date="1980-02-01"):
+    """
+    Renders a synthetic Russian blood test sheet.
+
+    Args:
+        parameters (list): {"name", "value", "unit"} dicts
+        report_date (str): YYYY-MM-DD
+        gender (str): "Male" or "Female"
+        scale (float): Resolution factor; 1.0 is about 1240 px wide (A4 at 150 dpi)
+        noise (float): Standard deviation of Gaussian pixel noise
+        rotation (float): Counter-clockwise rotation in degrees
+        font_path (str): Cyrillic TrueType font, see find_font
+        seed (int): Seed for the noise
+        birth_date (str): YYYY-MM-DD patient birth date printed above the
+            sampling date
+
+    Returns:
+        tuple: (RGB array, truth) where truth holds report_date, gender,
+            parameters, the expected text lines and word boxes in
+            easyocr_to_json format
+    """
+    font = ImageFont.truetype(find_font(font_path), size=max(8, int(22 * scale)))
+    column_x = [int(x * scale) for x in (60, 640, 820, 980)]
+    line_height = int(40 * scale)
+    header, rows = _sheet_rows(parameters, report_date, gender, birth_date)
+    size = (int(1240 * scale), int(120 * scale) + line_height * (len(header) + len(rows)))
+
+    image = Image.new("RGB", size, "white")
+    draw = ImageDraw.Draw(image)
+    space = draw.textlength(" ", font=font)
+    boxes, lines = [], []
+
+    def draw_words(words, x, y):
+        for word in words:
+            left, top, right, bottom = draw.textbbox((x, y), word, font=font)
+            draw.text((x, y), word, fill="black", font=font)
+            boxes.append({"text": word, "bbox": [[left, top], [right, top], [right, bottom], [left, bottom]]})
+            x = right + space
+
+    y = int(60 * scale)
+    for words in header:
+        if words[0] == "Показатель":
+            draw_words(words[:1], column_x[0], y)
+            draw_words(words[1:2], column_x[1], y)
+            draw_words(words[2:4], column_x[2], y)
+            draw_words(words[4:], column_x[3], y)
+        else:
+            draw_words(words, column_x[0], y)
+        lines.append(" ".join(words))
+        y += line_height
+    for row in rows:
+        for words, x in zip(row["columns"], column_x):
+            draw_words(words, x, y)
+        lines.append(" ".join(" ".join(words) for words in row["columns"]))
+        y += line_height
+
+    if rotation:
+        rotated = image.rotate(rotation, resample=Image.BICUBIC, expand=True, fillcolor="white")
+        for box in boxes:
+            box["bbox"] = _rotate_points(box["bbox"], rotation, image.size, rotated.size)
+        image = rotated
+
+    pixels = np.asarray(image, dtype=np.float32)
+    if noise:
+        pixels = pixels + np.random.default_rng(seed).normal(0, noise, pixels.shape)
+    pixels = np.clip(pixels, 0, 255).astype(np.uint8)
+
+    for box in boxes:
+        box["bbox"] = [[int(round(x)), int(round(y))] for x, y in box["bbox"]]
+        box["confidence"] = 1.0
+    truth = {
+        "report_date": report_date,
+        "gender": gender,
+        "parameters": parameters,
+        "lines": lines,
+        "boxes": boxes,
+    }
+    return pixels, truth
+
+
+def generate_dataset(n_sheets=20, seed=0, scales=(0.6, 1.0, 1.5), noises=(0.0, 8.0, 20.0),
+                     rotations=(0.0, 1.5, -3.0), font_path=None, output_dir=None):
+    """
+    Renders n_sheets sheets cycling through resolution, noise and rotation.
+
+    Args:
+        output_dir (str): If given, every sheet is also written as
+            sheet_NNN.png with its ground truth in sheet_NNN.json
+
+    Returns:
+        list: (RGB array, truth, settings) per sheet
+    """
+    rng = random.Random(seed)
+    font_path = find_font(font_path)
+    samples = []
+    for i in range(n_sheets):
+        settings = {
+            "scale": scales[i % len(scales)],
+            "noise": noises[(i // len(scales)) % len(noises)],
+            "rotation": rotations[(i // (len(scales) * len(noises))) % len(rotations)],
+        }
+        report_date = f"20{rng.randint(20, 25)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+        gender = rng.choice(["Male", "Female"])
+        image, truth = render_sheet(random_parameters(rng), report_date, gender, font_path=font_path,
+                                    seed=seed + i, **settings)
+        samples.append((image, truth, settings))
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+            stem = os.path.join(output_dir, f"sheet_{i:03d}")
+            Image.fromarray(image).save(f"{stem}.png")
+            with open(f"{stem}.json", "w", encoding="utf-8") as f:
+                json.dump(dict(truth, settings=settings), f, ensure_ascii=False, indent=2)
+    return samples
@@ -0,0 +1,284 @@
+import argparse
+import atexit
+import json
+import os
+import threading
+import time
+import tracemalloc
+from collections import defaultdict
+from functools import wraps
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Set to a path to trace every process started with this environment
+TRACE_ENV = "PD_TRACE"
+METRICS_ENV = "PD_METRICS"
+OWNER_ENV = "PD_TRACE_OWNER"
+
+
+class _State:
+    enabled = False
+    fd = None
+    metrics_path = None
+    lock = threading.Lock()
+
+
+_state = _State()
+
+
+def _peak_rss_mb():
+    if resource is None:
+        return None
+    # ru_maxrss is in KiB on Linux
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def _emit(record):
+    record["pid"] = os.getpid()
+    line = (json.dumps(record, ensure_ascii=False, default=str) + "\n").encode("utf-8")
+    # One O_APPEND write per line keeps lines whole across processes
+    os.write(_state.fd, line)
+
+
+def enable(trace_path="trace.jsonl", metrics_path=None, trace_python_memory=False):
+    """
+    Starts writing spans, counters and memory samples to a JSON-lines file.
+
+    The settings are also exported through the environment so that worker
+    processes started afterwards trace into the same file.
+
+    Args:
+        trace_path (str): JSON-lines trace file, appended to
+        metrics_path (str): Prometheus text dump written at exit
+        trace_python_memory (bool): Also report tracemalloc peaks (slow)
+    """
+    directory = os.path.dirname(trace_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with _state.lock:
+        if _state.fd is not None:
+            os.close(_state.fd)
+        _state.fd = os.open(trace_path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        _state.metrics_path = metrics_path
+        _state.enabled = True
+    os.environ[TRACE_ENV] = trace_path
+    os.environ.setdefault(OWNER_ENV, str(os.getpid()))
+    if metrics_path:
+        os.environ[METRICS_ENV] = metrics_path
+        atexit.register(disable)
+    if trace_python_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+def disable():
+    """
+    Stops tracing and writes the Prometheus dump if one was requested.
+    """
+    with _state.lock:
+        if not _state.enabled:
+            return
+        _state.enabled = False
+        os.close(_state.fd)
+        _state.fd = None
+        metrics_path = _state.metrics_path
+    trace_path = os.environ.pop(TRACE_ENV, None)
+    os.environ.pop(METRICS_ENV, None)
+    os.environ.pop(OWNER_ENV, None)
+    if metrics_path and trace_path:
+        write_prometheus(trace_path, metrics_path)
+
+
+def enabled():
+    return _state.enabled
+
+
+class _NoopSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+class _Span:
+    def __init__(self, name, attrs):
+        self.name = name
+        self.attrs = attrs
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        self.start = time.time()
+        self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        record = {
+            "type": "span",
+            "name": self.name,
+            "start": self.start,
+            "duration_s": time.perf_counter() - self._t0,
+            "thread": threading.current_thread().name,
+            "rss_peak_mb": _peak_rss_mb(),
+        }
+        if tracemalloc.is_tracing():
+            record["py_peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 1)
+        if exc_type is not None:
+            record["error"] = exc_type.__name__
+        if self.attrs:
+            record["attrs"] = self.attrs
+        _emit(record)
+        return False
+
+
+def span(name, **attrs):
+    """
+    Times a block:
+
+        with span("llm.request", model=model) as s:
+            ...
+            s.set(tokens=n)
+
+    Returns a shared no-op context manager while tracing is disabled.
+    """
+    if not _state.enabled:
+        return _NOOP
+    return _Span(name, attrs)
+
+
+def traced(name):
+    """
+    Decorator form of span for whole functions.
+    """
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _state.enabled:
+                return fn(*args, **kwargs)
+            with _Span(name, {}):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def count(name, value=1, **labels):
+    """
+    Adds value to a counter such as boxes per image or cache hits.
+    """
+    if not _state.enabled:
+        return
+    record = {"type": "counter", "name": name, "value": value}
+    if labels:
+        record["labels"] = labels
+    _emit(record)
+
+
+def sample_memory(name):
+    """
+    Records the peak RSS (and tracemalloc peak if enabled) at this point.
+    """
+    if not _state.enabled:
+        return
+    record = {"type": "memory", "name": name, "rss_peak_mb": _peak_rss_mb()}
+    if tracemalloc.is_tracing():
+        record["py_peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 1)
+    _emit(record)
+
+
+def summarize(trace_path):
+    """
+    Aggregates a trace file from any number of processes.
+
+    Returns:
+        dict: {"spans": name -> {"count", "total_s", "max_s"},
+            "counters": (name, labels) -> total, "rss_peak_mb": max}
+    """
+    spans = defaultdict(lambda: {"count": 0, "total_s": 0.0, "max_s": 0.0})
+    counters = defaultdict(float)
+    rss_peak = {}
+    with open(trace_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if record.get("rss_peak_mb") is not None:
+                rss_peak[record["pid"]] = max(rss_peak.get(record["pid"], 0), record["rss_peak_mb"])
+            if record["type"] == "span":
+                s = spans[record["name"]]
+                s["count"] += 1
+                s["total_s"] += record["duration_s"]
+                s["max_s"] = max(s["max_s"], record["duration_s"])
+            elif record["type"] == "counter":
+                labels = tuple(sorted(record.get("labels", {}).items()))
+                counters[(record["name"], labels)] += record["value"]
+    return {"spans": dict(spans), "counters": dict(counters), "rss_peak_mb": rss_peak}
+
+
+def _metric_name(name):
+    return "pd_" + "".join(ch if ch.isalnum() else "_" for ch in name)
+
+
+def render_prometheus(summary):
+    """
+    Renders a summarize() result in the Prometheus text format.
+    """
+    lines = ["# TYPE pd_span_seconds summary"]
+    for name, s in sorted(summary["spans"].items()):
+        lines.append(f'pd_span_seconds_sum{{span="{name}"}} {s["total_s"]:.6f}')
+        lines.append(f'pd_span_seconds_count{{span="{name}"}} {s["count"]}')
+    for (name, labels), total in sorted(summary["counters"].items()):
+        label_text = ",".join(f'{k}="{v}"' for k, v in labels)
+        lines.append(f"{_metric_name(name)}_total{'{' + label_text + '}' if label_text else ''} {total:g}")
+    lines.append("# TYPE pd_rss_peak_megabytes gauge")
+    for pid, peak in sorted(summary["rss_peak_mb"].items()):
+        lines.append(f'pd_rss_peak_megabytes{{pid="{pid}"}} {peak}')
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus(trace_path, metrics_path):
+    with open(metrics_path, "w", encoding="utf-8") as f:
+        f.write(render_prometheus(summarize(trace_path)))
+
+
+def format_summary(summary):
+    """
+    Renders a summarize() result as a table of where time went.
+    """
+    lines = [f"{'span':<32} {'count':>7} {'total s':>10} {'mean ms':>10} {'max ms':>10}"]
+    for name, s in sorted(summary["spans"].items(), key=lambda item: -item[1]["total_s"]):
+        lines.append(f"{name:<32} {s['count']:>7} {s['total_s']:>10.3f} "
+                     f"{s['total_s'] / s['count'] * 1000:>10.1f} {s['max_s'] * 1000:>10.1f}")
+    for (name, labels), total in sorted(summary["counters"].items()):
+        label_text = ",".join(f"{k}={v}" for k, v in labels)
+        lines.append(f"{name}{'{' + label_text + '}' if label_text else ''}: {total:g}")
+    return "\n".join(lines)
+
+
+if os.environ.get(TRACE_ENV) and not _state.enabled:
+    if os.environ.get(OWNER_ENV):
+        # A worker of a traced process: add to its trace, leave the dump to the owner
+        enable(os.environ[TRACE_ENV])
+    else:
+        enable(os.environ[TRACE_ENV], os.environ.get(METRICS_ENV))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarize a trace written with PD_TRACE or --trace.")
+    parser.add_argument("trace", help="JSON-lines trace file")
+    parser.add_argument("--prometheus", help="Also write the Prometheus text dump here")
+    args = parser.parse_args()
+    summary = summarize(args.trace)
+    print(format_summary(summary))
+    if args.prometheus:
+        write_prometheus(args.trace, args.prometheus)
@@ -1,2 +1,25 @@
-from .utils import plot_easyocr_boxes, get_plot, easyocr_to_json
-from .get_output import get_output
\ No newline at end of file
+import importlib
+
+# Public helpers and the submodule that defines each. They are imported on
+# first access, so "import ocr" does not load cv2, matplotlib or easyocr/torch.
+_EXPORTS = {
+    "plot_easyocr_boxes": "utils",
+    "get_plot": "utils",
+    "easyocr_to_json": "utils",
+    "get_output": "get_output",
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{module}", __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
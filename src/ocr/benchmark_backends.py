@@ -0,0 +1,96 @@
+import argparse
+import json
+import time
+
+from .benchmark_preprocess import text_similarity
+from .main import collect_images
+from .ocr_reader import evict_reader, get_reader, read_text
+from .utils import easyocr_to_text, load_image
+
+# Reader configurations compared against EasyOCR's default PyTorch reader
+BACKENDS = {
+    "torch": {},
+    "torch_fp32": {"quantize": False},
+    "onnx_fp32": {"backend": "onnx", "quantize": False},
+    "onnx_int8": {"backend": "onnx", "quantize": True},
+}
+
+
+def run_benchmark(source, output_path=None, threads=None, repeats=2, backends=None):
+    """
+    Times every backend on a fixed image set and compares the text with PyTorch.
+
+    The default PyTorch reader is the reference. Each backend is warmed up
+    on the first image, and every image is timed repeats times with the
+    best run kept. Readers are evicted after use so memory does not grow.
+    """
+    images = collect_images(source)
+    if not images:
+        print(f"No images found in {source}")
+        return {}
+    pixels = {path: load_image(path) for path in images}
+
+    references, results = {}, {}
+    for name in (backends or BACKENDS):
+        options = dict(BACKENDS[name])
+        if options.get("backend") == "onnx":
+            options["intra_op_threads"] = threads
+        start = time.perf_counter()
+        try:
+            reader = get_reader(['ru'], **options)
+        except ImportError as e:
+            print(f"Skipping {name}: {e}")
+            continue
+        load_s = time.perf_counter() - start
+        read_text(reader, pixels[images[0]])
+
+        latencies, similarities, boxes = [], [], []
+        for path in images:
+            best = None
+            for _ in range(repeats):
+                start = time.perf_counter()
+                result = read_text(reader, pixels[path])
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            latencies.append(best)
+            boxes.append(len(result))
+            text = easyocr_to_text(result)
+            references.setdefault(path, text)
+            similarities.append(text_similarity(references[path], text))
+        del reader
+        evict_reader(['ru'], **options)
+
+        results[name] = {
+            "options": options,
+            "load_s": load_s,
+            "mean_latency_s": sum(latencies) / len(latencies),
+            "mean_boxes": sum(boxes) / len(boxes),
+            "mean_similarity": sum(similarities) / len(similarities),
+            "min_similarity": min(similarities),
+        }
+
+    if not results:
+        return results
+    base = next(iter(results.values()))["mean_latency_s"]
+    print(f"{'backend':<14}{'load, s':>10}{'latency, s':>12}{'speedup':>10}{'boxes':>8}{'similarity':>12}{'worst':>8}")
+    for name, stats in results.items():
+        speedup = base / stats["mean_latency_s"] if stats["mean_latency_s"] else 0.0
+        print(f"{name:<14}{stats['load_s']:>10.1f}{stats['mean_latency_s']:>12.2f}{speedup:>10.2f}"
+              f"{stats['mean_boxes']:>8.1f}{stats['mean_similarity']:>12.3f}{stats['min_similarity']:>8.3f}")
+
+    if output_path:
+        with open(output_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"Benchmark results saved to {output_path}")
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compare OCR latency and accuracy of the PyTorch and ONNX backends.")
+    parser.add_argument('source', nargs='?', default='images', help="Directory or glob of images")
+    parser.add_argument('--backends', nargs='+', choices=list(BACKENDS), default=None)
+    parser.add_argument('--threads', type=int, default=None, help="ONNX Runtime intra-op threads")
+    parser.add_argument('--repeats', type=int, default=2, help="Timed runs per image; the best one counts")
+    parser.add_argument('--output', default=None, help="Optional JSON file for the results")
+    args = parser.parse_args()
+    run_benchmark(args.source, args.output, args.threads, args.repeats, args.backends)
@@ -0,0 +1,87 @@
+import argparse
+import difflib
+import json
+import time
+
+from .main import collect_images
+from .ocr_reader import get_reader, read_text
+from .preprocess import read_text_preprocessed
+from .utils import easyocr_to_text
+
+# Settings compared against the raw image; None means no preprocessing
+SETTINGS = {
+    "raw": None,
+    "max1600": {"max_side": 1600, "grayscale": False, "deskew": False, "binarize": False},
+    "max1600_gray": {"max_side": 1600, "grayscale": True, "deskew": False, "binarize": False},
+    "max1600_gray_deskew": {"max_side": 1600, "grayscale": True, "deskew": True, "binarize": False},
+    "max1600_gray_deskew_bin": {"max_side": 1600, "grayscale": True, "deskew": True, "binarize": True},
+    "max1200_gray_deskew": {"max_side": 1200, "grayscale": True, "deskew": True, "binarize": False},
+    "max1000_gray_deskew": {"max_side": 1000, "grayscale": True, "deskew": True, "binarize": False},
+}
+
+
+def text_similarity(reference, candidate):
+    """
+    Character-level similarity between two OCR texts, in [0, 1].
+    """
+    return difflib.SequenceMatcher(None, reference, candidate, autojunk=False).ratio()
+
+
+def run_benchmark(source, output_path=None):
+    """
+    Times OCR at every preprocessing setting and compares the text to the raw run.
+
+    Without ground truth, the raw full-resolution OCR is the reference, so
+    "accuracy" is agreement with what we get today.
+    """
+    images = collect_images(source)
+    if not images:
+        print(f"No images found in {source}")
+        return {}
+
+    reader = get_reader(['ru'])
+    # Warm-up run so that the first timing does not include lazy init
+    read_text(reader, images[0])
+
+    references = {}
+    results = {}
+    for name, options in SETTINGS.items():
+        latencies, similarities = [], []
+        for image_path in images:
+            start = time.perf_counter()
+            if options is None:
+                result = read_text(reader, image_path)
+            else:
+                result = read_text_preprocessed(reader, image_path, **options)
+            latencies.append(time.perf_counter() - start)
+
+            text = easyocr_to_text(result)
+            if options is None:
+                references[image_path] = text
+            similarities.append(text_similarity(references[image_path], text))
+
+        results[name] = {
+            "options": options,
+            "mean_latency_s": sum(latencies) / len(latencies),
+            "mean_similarity": sum(similarities) / len(similarities),
+        }
+
+    raw_latency = results["raw"]["mean_latency_s"]
+    print(f"{'setting':<26}{'latency, s':>12}{'speedup':>10}{'similarity':>12}")
+    for name, stats in results.items():
+        speedup = raw_latency / stats["mean_latency_s"] if stats["mean_latency_s"] else 0.0
+        print(f"{name:<26}{stats['mean_latency_s']:>12.2f}{speedup:>10.2f}{stats['mean_similarity']:>12.3f}")
+
+    if output_path:
+        with open(output_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"Benchmark results saved to {output_path}")
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compare OCR latency and accuracy across preprocessing settings.")
+    parser.add_argument('source', nargs='?', default='images', help="Directory or glob of images")
+    parser.add_argument('--output', default=None, help="Optional JSON file for the results")
+    args = parser.parse_args()
+    run_benchmark(args.source, args.output)
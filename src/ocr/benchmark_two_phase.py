@@ -0,0 +1,119 @@
+import argparse
+import json
+import shutil
+import tempfile
+import time
+
+from report_generator.rule_extractor import extract_parameters
+
+from .benchmark_preprocess import text_similarity
+from .cache import OCRCache
+from .main import collect_images
+from .ocr_reader import get_reader, read_text, read_text_two_phase
+from .utils import easyocr_to_json, easyocr_to_text, load_image
+
+# Region filters compared against a plain readtext call; False recognizes every region
+FILTERS = {
+    "no_filter": False,
+    "default": {},
+    "table_only": {"table_only": True},
+    "table_only_tight": {"table_only": True, "header_lines": 3},
+}
+
+
+def _extracted(result):
+    extracted, _, _ = extract_parameters(ocr_json=easyocr_to_json(result))
+    return {p["name"]: p.get("value") for p in extracted["parameters"]}, extracted.get("report_date"), \
+        extracted.get("gender")
+
+
+def _agreement(reference, candidate):
+    # Share of the reference's extracted values, date and sex that survive
+    values, date, gender = reference
+    other_values, other_date, other_gender = candidate
+    total = len(values) + 2
+    same = sum(1 for name, value in values.items() if other_values.get(name) == value)
+    return (same + (date == other_date) + (gender == other_gender)) / total
+
+
+def run_benchmark(source, output_path=None):
+    """
+    Times two-phase OCR with every region filter against readtext.
+
+    Without ground truth, plain readtext is the reference: similarity is
+    agreement of the text, and extraction agreement is the share of
+    values, sampling date and sex the rule extractor still finds.
+    """
+    images = collect_images(source)
+    if not images:
+        print(f"No images found in {source}")
+        return {}
+
+    reader = get_reader(['ru'])
+    pixels = {path: load_image(path) for path in images}
+    # Warm-up run so that the first timing does not include lazy init
+    read_text(reader, pixels[images[0]])
+
+    cache_dir = tempfile.mkdtemp(prefix="pd_detect_cache_")
+    try:
+        cache = OCRCache(cache_dir)
+        references, rows = {}, {"readtext": []}
+        for path in images:
+            start = time.perf_counter()
+            result = read_text(reader, pixels[path])
+            elapsed = time.perf_counter() - start
+            references[path] = (easyocr_to_text(result), _extracted(result))
+            rows["readtext"].append({"latency_s": elapsed, "regions": len(result), "similarity": 1.0,
+                                     "extraction": 1.0})
+
+        for name, region_filter in FILTERS.items():
+            rows[name] = []
+            for path in images:
+                # The first filter fills the detection cache, the others reuse it
+                start = time.perf_counter()
+                result = read_text_two_phase(reader, pixels[path], region_filter, cache=cache, source=path)
+                elapsed = time.perf_counter() - start
+                text, extracted = references[path]
+                rows[name].append({
+                    "latency_s": elapsed,
+                    "regions": len(result),
+                    "similarity": text_similarity(text, easyocr_to_text(result)),
+                    "extraction": _agreement(extracted, _extracted(result)),
+                })
+        detect_stats = cache.stats()
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+    results = {}
+    for name, per_image in rows.items():
+        results[name] = {
+            "filter": FILTERS.get(name),
+            "mean_latency_s": sum(r["latency_s"] for r in per_image) / len(per_image),
+            "mean_regions": sum(r["regions"] for r in per_image) / len(per_image),
+            "mean_similarity": sum(r["similarity"] for r in per_image) / len(per_image),
+            "mean_extraction_agreement": sum(r["extraction"] for r in per_image) / len(per_image),
+        }
+    results["detection_cache"] = detect_stats
+
+    base = results["readtext"]["mean_latency_s"]
+    print(f"{'setting':<20}{'latency, s':>12}{'speedup':>10}{'regions':>10}{'similarity':>12}{'extraction':>12}")
+    for name in rows:
+        stats = results[name]
+        speedup = base / stats["mean_latency_s"] if stats["mean_latency_s"] else 0.0
+        print(f"{name:<20}{stats['mean_latency_s']:>12.2f}{speedup:>10.2f}{stats['mean_regions']:>10.1f}"
+              f"{stats['mean_similarity']:>12.3f}{stats['mean_extraction_agreement']:>12.3f}")
+    print("Settings after no_filter reuse cached detections, so their latency is recognition only.")
+
+    if output_path:
+        with open(output_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"Benchmark results saved to {output_path}")
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compare two-phase OCR with region filtering against readtext.")
+    parser.add_argument('source', nargs='?', default='images', help="Directory or glob of report scans")
+    parser.add_argument('--output', default=None, help="Optional JSON file for the results")
+    args = parser.parse_args()
+    run_benchmark(args.source, args.output)
@@ -0,0 +1,362 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+from instrumentation import count
+
+DEFAULT_CACHE_DIR = 'ocr/cache'
+INDEX_FILE = 'index.json'
+
+
+def file_hash(image_path, chunk_size=1 << 20):
+    """
+    Returns the SHA-256 hex digest of a file's content.
+    """
+    digest = hashlib.sha256()
+    with open(image_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def content_hash(source):
+    """
+    Returns the SHA-256 hex digest identifying an image source.
+
+    Paths are hashed by file content, encoded bytes as they are, and
+    decoded arrays by shape, dtype and pixels.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        return file_hash(source)
+    if isinstance(source, np.ndarray):
+        digest = hashlib.sha256(f'{source.shape}:{source.dtype}'.encode('utf-8'))
+        digest.update(np.ascontiguousarray(source).data)
+        return digest.hexdigest()
+    return hashlib.sha256(source).hexdigest()
+
+
+def perceptual_hash(image, hash_size=8):
+    """
+    Computes a difference hash (dHash) of an image.
+
+    The image is shrunk to (hash_size + 1) x hash_size grayscale pixels and
+    each bit records whether a pixel is brighter than its right neighbour.
+    Re-photographs of the same page land within a few bits of each other.
+
+    Args:
+        image: Decoded RGB/grayscale array or a path to an image file
+
+    Returns:
+        int: 64-bit hash for the default hash_size, or None if unreadable
+    """
+    import cv2
+
+    if not isinstance(image, np.ndarray):
+        image = cv2.imread(image, cv2.IMREAD_GRAYSCALE)
+        if image is None:
+            return None
+    elif image.ndim == 3:
+        image = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+    small = cv2.resize(image, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int(np.packbits(bits).tobytes().hex(), 16)
+
+
+def hamming_distance(a, b):
+    return bin(a ^ b).count('1')
+
+
+def hash_bands(phash, bands, bits=64):
+    """
+    Splits a perceptual hash into bands contiguous bit ranges.
+
+    Two hashes within bands - 1 bits of each other agree exactly on at
+    least one band, so near-duplicate candidates are found with one dict
+    lookup per band instead of a comparison against every entry.
+
+    Returns:
+        list: (band number, band value) pairs
+    """
+    edges = [bits * i // bands for i in range(bands + 1)]
+    return [(i, (phash >> lo) & ((1 << (hi - lo)) - 1)) for i, (lo, hi) in enumerate(zip(edges, edges[1:]))]
+
+
+class OCRCache:
+    """
+    Content-addressed on-disk cache for easyocr_to_json output.
+
+    Entries are keyed by the SHA-256 of the image bytes plus the reader
+    configuration, and stored as one JSON file each. An index file keeps
+    the size, last access time and perceptual hash of every entry, which
+    is used for LRU eviction once the cache grows past max_bytes.
+
+    The perceptual hash only captures page layout: two sheets from the same
+    lab template with different values hash alike. Near-duplicate reuse is
+    therefore off by default, and when on, every candidate must pass the
+    verify callback before its result is returned.
+
+    Args:
+        cache_dir (str): Directory holding the entries and the index
+        max_bytes (int): Size bound for all stored entries
+        near_duplicates (bool): Also reuse results for near-identical photos
+        max_distance (int): Max Hamming distance between perceptual hashes
+            for two images to count as candidates
+        verify (callable): verify(image, json_data) -> bool, confirms that a
+            near-duplicate's result holds for the new image, e.g.
+            ocr_reader.confirm_values. Required with near_duplicates.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=256 * 1024 * 1024,
+                 near_duplicates=False, max_distance=4, verify=None):
+        if near_duplicates and verify is None:
+            raise ValueError("near_duplicates needs a verify callback to confirm candidates")
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.near_duplicates = near_duplicates
+        self.max_distance = max_distance
+        self.verify = verify
+        self.hits = 0
+        self.near_hits = 0
+        self.near_rejected = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        self._index_mtime = None
+        self._index = self._load_index()
+        self._rebuild_bands()
+
+    def _index_path(self):
+        return os.path.join(self.cache_dir, INDEX_FILE)
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, f'{key}.json')
+
+    def _index_file_mtime(self):
+        try:
+            return os.stat(self._index_path()).st_mtime_ns
+        except OSError:
+            return None
+
+    def _load_index(self):
+        self._index_mtime = self._index_file_mtime()
+        try:
+            with open(self._index_path(), 'r', encoding='utf-8') as f:
+                index = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return {}
+        # Drop entries whose files were removed behind our back
+        return {k: v for k, v in index.items() if os.path.exists(self._entry_path(k))}
+
+    def _save_index(self):
+        tmp_path = f'{self._index_path()}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._index, f)
+        os.replace(tmp_path, self._index_path())
+        self._index_mtime = self._index_file_mtime()
+
+    def _refresh(self):
+        # Other processes sharing the directory rewrite the index file;
+        # pick up their entries when it changed since we last saw it
+        if self._index_file_mtime() == self._index_mtime:
+            return
+        for key, meta in self._load_index().items():
+            if key not in self._index:
+                self._index[key] = meta
+                self._add_bands(key, meta)
+
+    def _bands(self, meta):
+        if not self.near_duplicates or meta.get('phash') is None:
+            return []
+        return [(meta.get('config'), *band) for band in hash_bands(int(meta['phash'], 16), self.max_distance + 1)]
+
+    def _add_bands(self, key, meta):
+        for band in self._bands(meta):
+            self._band_index.setdefault(band, set()).add(key)
+
+    def _remove_bands(self, key, meta):
+        for band in self._bands(meta):
+            keys = self._band_index.get(band)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._band_index[band]
+
+    def _rebuild_bands(self):
+        self._band_index = {}
+        for key, meta in self._index.items():
+            self._add_bands(key, meta)
+
+    @staticmethod
+    def make_key(content_hash, config):
+        """
+        Combines an image content hash with a reader configuration.
+        """
+        config_text = json.dumps(config, sort_keys=True, default=str)
+        return hashlib.sha256(f'{content_hash}:{config_text}'.encode('utf-8')).hexdigest()
+
+    def _config_tag(self, config):
+        return hashlib.sha256(json.dumps(config, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+    def _read_entry(self, key):
+        try:
+            with open(self._entry_path(key), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            meta = self._index.pop(key, None)
+            if meta is not None:
+                self._remove_bands(key, meta)
+            return None
+
+    @staticmethod
+    def _perceptual_hash(source, image):
+        if image is not None:
+            return perceptual_hash(image)
+        if isinstance(source, (str, os.PathLike, np.ndarray)):
+            return perceptual_hash(source)
+        import cv2
+        decoded = cv2.imdecode(np.frombuffer(source, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+        return None if decoded is None else perceptual_hash(decoded)
+
+    def _near_candidates(self, phash, config_tag):
+        # Entries sharing a band with phash, closest first
+        candidates = set()
+        for band in hash_bands(phash, self.max_distance + 1):
+            candidates |= self._band_index.get((config_tag, *band), set())
+        distances = [(hamming_distance(phash, int(self._index[key]['phash'], 16)), key)
+                     for key in candidates if key in self._index]
+        return [key for distance, key in sorted(distances) if distance <= self.max_distance]
+
+    def get(self, source, config, image=None):
+        """
+        Looks up the cached OCR output for an image.
+
+        Args:
+            source: Image path, encoded bytes or decoded array used for the key
+            config (dict): Reader configuration the result depends on
+            image (np.ndarray): Already decoded image, reused for the
+                perceptual hash and verify so the file is not decoded again
+
+        Returns:
+            list: Cached easyocr_to_json output, or None on a miss
+        """
+        key = self.make_key(content_hash(source), config)
+        with self._lock:
+            self._refresh()
+            if key in self._index:
+                data = self._read_entry(key)
+                if data is not None:
+                    self._index[key]['atime'] = time.time()
+                    self.hits += 1
+                    count("ocr_cache_lookups", result="hit")
+                    return data
+
+        # Hashing and verify (a recognition pass) run without the lock, so
+        # other lookups and puts are not held up behind them
+        phash = self._perceptual_hash(source, image) if self.near_duplicates else None
+        if phash is not None:
+            with self._lock:
+                candidates = self._near_candidates(phash, self._config_tag(config))
+            for near_key in candidates:
+                with self._lock:
+                    data = self._read_entry(near_key) if near_key in self._index else None
+                if data is None:
+                    continue
+                if not self.verify(source if image is None else image, data):
+                    with self._lock:
+                        self.near_rejected += 1
+                    count("ocr_cache_lookups", result="near_rejected")
+                    continue
+                with self._lock:
+                    # The entry may have been evicted while it was verified
+                    if near_key in self._index:
+                        self._index[near_key]['atime'] = time.time()
+                    self.near_hits += 1
+                count("ocr_cache_lookups", result="near_hit")
+                return data
+
+        with self._lock:
+            self.misses += 1
+        count("ocr_cache_lookups", result="miss")
+        return None
+
+    def put(self, source, config, json_data, image=None):
+        """
+        Stores easyocr_to_json output for an image and evicts old entries if needed.
+
+        Takes the same source/config/image arguments as get().
+        """
+        key = self.make_key(content_hash(source), config)
+        payload = json.dumps(json_data, ensure_ascii=False)
+        phash = self._perceptual_hash(source, image) if self.near_duplicates else None
+        with self._lock:
+            tmp_path = f'{self._entry_path(key)}.{os.getpid()}.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(payload)
+            os.replace(tmp_path, self._entry_path(key))
+            # Other processes may share this directory; keep their entries
+            self._index_mtime = None
+            self._refresh()
+            old = self._index.get(key)
+            if old is not None:
+                self._remove_bands(key, old)
+            self._index[key] = {
+                'size': os.path.getsize(self._entry_path(key)),
+                'atime': time.time(),
+                'config': self._config_tag(config),
+                'phash': None if phash is None else format(phash, 'x'),
+            }
+            self._add_bands(key, self._index[key])
+            self._evict()
+            self._save_index()
+
+    def _evict(self):
+        total = sum(meta['size'] for meta in self._index.values())
+        if total <= self.max_bytes:
+            return
+        for key in sorted(self._index, key=lambda k: self._index[k]['atime']):
+            if total <= self.max_bytes:
+                break
+            meta = self._index.pop(key)
+            self._remove_bands(key, meta)
+            total -= meta['size']
+            try:
+                os.remove(self._entry_path(key))
+            except OSError:
+                pass
+
+    def flush(self):
+        """
+        Persists access times gathered by get() to the index file.
+        """
+        with self._lock:
+            self._save_index()
+
+    def clear(self):
+        with self._lock:
+            for key in list(self._index):
+                try:
+                    os.remove(self._entry_path(key))
+                except OSError:
+                    pass
+            self._index = {}
+            self._band_index = {}
+            self._save_index()
+
+    def stats(self):
+        """
+        Returns hit/miss counters and the current cache size.
+        """
+        lookups = self.hits + self.near_hits + self.misses
+        return {
+            'hits': self.hits,
+            'near_hits': self.near_hits,
+            'near_rejected': self.near_rejected,
+            'misses': self.misses,
+            'hit_rate': (self.hits + self.near_hits) / lookups if lookups else 0.0,
+            'entries': len(self._index),
+            'bytes': sum(meta['size'] for meta in self._index.values()),
+        }
@@ -1,9 +1,40 @@
-from Pocket_Doctor.src.ocr.ocr_reader import load_reader, read_text
-from Pocket_Doctor.src.ocr.utils import get_plot, easyocr_to_json
+from .ocr_reader import get_reader, read_text
+from .utils import get_plot, easyocr_to_json, json_to_easyocr, load_image
 
 
-def get_output(image_path):
-    reader = load_reader(['ru'])
-    result = read_text(reader, image_path)
-    plot = get_plot(image_path, result)
-    return easyocr_to_json(result), plot
\ No newline at end of file
+def get_output(image, lang_list=None, cache=None, plot=True, preprocess=None):
+    """
+    Runs OCR on an image and returns its JSON output and the box overlay.
+
+    The image is decoded once and the same pixel buffer is used for OCR
+    and for the overlay.
+
+    Args:
+        image: Path, encoded bytes, memory-mapped file or decoded RGB array
+        lang_list (list): OCR languages, defaults to ['ru']
+        cache (OCRCache): Optional result cache checked before running OCR
+        plot (bool): Build the overlay; when False the second value is None
+        preprocess (dict): Options for preprocess.read_text_preprocessed;
+            None reads the image as it is
+    """
+    lang_list = lang_list or ['ru']
+    config = {"lang_list": lang_list}
+    if preprocess is not None:
+        config["preprocess"] = preprocess
+    pixels = load_image(image)
+    json_data = cache.get(image, config, image=pixels) if cache is not None else None
+    if json_data is None:
+        reader = get_reader(lang_list)
+        if preprocess is not None:
+            # Imported here: preprocess needs OpenCV at import time
+            from .preprocess import read_text_preprocessed
+            result = read_text_preprocessed(reader, pixels, **preprocess)
+        else:
+            result = read_text(reader, pixels)
+        json_data = easyocr_to_json(result)
+        if cache is not None:
+            cache.put(image, config, json_data, image=pixels)
+    else:
+        result = json_to_easyocr(json_data)
+    overlay = get_plot(pixels, result) if plot else None
+    return json_data, overlay
@@ -0,0 +1,69 @@
+import argparse
+import json
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+
+def _post(url, data):
+    request = urllib.request.Request(url, data=data, headers={"Content-Type": "application/octet-stream"},
+                                     method="POST")
+    start = time.perf_counter()
+    with urllib.request.urlopen(request, timeout=300) as response:
+        body = json.loads(response.read().decode("utf-8"))
+    return time.perf_counter() - start, body.get("batch_size", 1)
+
+
+def run_level(url, data, concurrency, n_requests):
+    """
+    Sends n_requests with the given number in flight.
+
+    Returns:
+        dict: Latency percentiles in seconds, throughput and mean batch size
+    """
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda _: _post(url, data), range(n_requests)))
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(r[0] for r in results)
+
+    def percentile(q):
+        return latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+
+    return {
+        "concurrency": concurrency,
+        "requests": n_requests,
+        "p50_s": round(percentile(0.50), 3),
+        "p95_s": round(percentile(0.95), 3),
+        "throughput_rps": round(n_requests / elapsed, 2),
+        "mean_batch_size": round(sum(r[1] for r in results) / len(results), 2),
+    }
+
+
+def run_load_test(image_path, url="http://127.0.0.1:8010/ocr", levels=(1, 2, 4, 8), n_requests=32):
+    with open(image_path, "rb") as f:
+        data = f.read()
+    # One request first so model warm-up does not count
+    _post(url, data)
+    results = []
+    for concurrency in levels:
+        result = run_level(url, data, concurrency, max(n_requests, concurrency))
+        print(f"concurrency {concurrency:>3}: p50 {result['p50_s']:.3f}s  p95 {result['p95_s']:.3f}s  "
+              f"{result['throughput_rps']:.2f} req/s  batch {result['mean_batch_size']:.1f}")
+        results.append(result)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test for the OCR service in server.py.")
+    parser.add_argument("image", help="Image sent with every request")
+    parser.add_argument("--url", default="http://127.0.0.1:8010/ocr")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--requests", type=int, default=32, help="Requests per concurrency level")
+    parser.add_argument("--output", help="Optional JSON file for the results")
+    args = parser.parse_args()
+    results = run_load_test(args.image, args.url, args.concurrency, args.requests)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
@@ -1,36 +1,268 @@
+import argparse
+import glob
 import json
-from ocr_reader import load_reader, read_text
-from utils import plot_easyocr_boxes, easyocr_to_json, easyocr_to_text, easyocr_to_structured_text
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from .cache import OCRCache
+from .ocr_reader import confirm_values, get_reader, read_text
+from .tiling import read_document
+from .utils import plot_easyocr_boxes, easyocr_to_json, easyocr_to_text, easyocr_to_structured_text, json_to_easyocr, load_image
 
 IMAGE_PATH = 'images/2.jpg'
 OUTPUT_JSON = 'ocr/output/ocr_result2.json'
 OUTPUT_TEXT = 'ocr/output/ocr_text2.txt'
+OUTPUT_DIR = 'ocr/output'
 
-def main():
-    # Load OCR reader for Russian language
-    reader = load_reader(['ru'])
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff', '.webp')
 
-    # Run OCR
-    result = read_text(reader, IMAGE_PATH)
 
-    # Show result with bounding boxes
-    plot_easyocr_boxes(IMAGE_PATH, result)
+def save_outputs(result, output_json, output_text):
+    """
+    Writes the JSON and structured text outputs for one OCR result.
+
+    Files are written to a temporary name first and then renamed, so a
+    crash never leaves a half-written output that resume would skip.
+    """
+    for directory in {os.path.dirname(output_json), os.path.dirname(output_text)}:
+        if directory:
+            os.makedirs(directory, exist_ok=True)
 
     # Convert to JSON-serializable format
     json_data = easyocr_to_json(result)
-
-    # Save to JSON file
-    with open(OUTPUT_JSON, 'w', encoding='utf-8') as f:
+    tmp_path = output_json + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
         json.dump(json_data, f, ensure_ascii=False, indent=4)
-    print(f"OCR results saved to {OUTPUT_JSON}")
+    os.replace(tmp_path, output_json)
 
     # Convert to plain text
     plain_text = easyocr_to_structured_text(result)
-
-    # Save to text file
-    with open(OUTPUT_TEXT, 'w', encoding='utf-8') as f:
+    tmp_path = output_text + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
         f.write(plain_text)
-    print(f"OCR text saved to {OUTPUT_TEXT}")
+    os.replace(tmp_path, output_text)
+
+
+def output_paths(image_path, output_dir):
+    """
+    Returns the (json, text) output paths for an image in batch mode.
+
+    Outputs are named after the whole file name, extension included
+    (scan.jpg -> scan.jpg.json), so scan.jpg and scan.png in one batch
+    do not overwrite each other or look already done to resume.
+    """
+    name = os.path.basename(image_path)
+    return (os.path.join(output_dir, f'{name}.json'),
+            os.path.join(output_dir, f'{name}.txt'))
+
+
+def collect_images(source):
+    """
+    Expands a directory or glob pattern into a sorted list of image paths.
+    """
+    if os.path.isdir(source):
+        paths = [os.path.join(source, name) for name in os.listdir(source)]
+    else:
+        paths = glob.glob(source)
+    return sorted(p for p in paths if p.lower().endswith(IMAGE_EXTENSIONS))
+
+
+_worker_cache = None
+_worker_tiling = None
+_worker_reader_options = {}
+_worker_preprocess = None
+
+
+def _init_worker(lang_list, cache_dir=None, tiling=None, reader_options=None, near_duplicates=False,
+                 preprocess=None):
+    global _worker_cache, _worker_tiling, _worker_reader_options, _worker_preprocess
+    _worker_reader_options = reader_options or {}
+    _worker_preprocess = preprocess
+    # Load the reader once per worker so every image after the first is warm
+    reader = get_reader(lang_list, **_worker_reader_options)
+    if cache_dir:
+        verify = None
+        if near_duplicates:
+            def verify(image, json_data):
+                return confirm_values(reader, image, json_data)
+        _worker_cache = OCRCache(cache_dir, near_duplicates=near_duplicates, verify=verify)
+    _worker_tiling = tiling
+
+
+def _read_text(reader, image_path, image, tiling=None, preprocess=None):
+    # Boxes are in the coordinates of the original image (or, with tiling,
+    # of the original pages stacked top to bottom)
+    if tiling is not None:
+        # Multi-page files are read frame by frame, so each page is
+        # preprocessed on its own inside read_document
+        return read_document(reader, image_path, image=image, preprocess=preprocess, **tiling)
+    if preprocess is not None:
+        # Imported here: preprocess needs OpenCV at import time
+        from .preprocess import read_text_preprocessed
+        return read_text_preprocessed(reader, image, **preprocess)
+    return read_text(reader, image)
+
+
+def _read_text_cached(image_path, lang_list, cache, tiling=None, reader_options=None, preprocess=None):
+    reader_options = reader_options or {}
+    config = {"lang_list": lang_list}
+    if tiling is not None:
+        config["tiling"] = tiling
+    if reader_options:
+        config["reader"] = reader_options
+    if preprocess is not None:
+        config["preprocess"] = preprocess
+    image = load_image(image_path)
+    json_data = cache.get(image_path, config, image=image) if cache is not None else None
+    if json_data is not None:
+        return json_to_easyocr(json_data)
+    result = _read_text(get_reader(lang_list, **reader_options), image_path, image, tiling, preprocess)
+    if cache is not None:
+        cache.put(image_path, config, easyocr_to_json(result), image=image)
+    return result
+
+
+def _process_image(image_path, output_dir, lang_list):
+    result = _read_text_cached(image_path, lang_list, _worker_cache, _worker_tiling, _worker_reader_options,
+                               _worker_preprocess)
+    output_json, output_text = output_paths(image_path, output_dir)
+    save_outputs(result, output_json, output_text)
+    return image_path, len(result)
+
+
+def run_batch(source, output_dir=OUTPUT_DIR, workers=None, lang_list=None, resume=True, cache_dir=None,
+              tiling=None, reader_options=None, near_duplicates=False, preprocess=None):
+    """
+    Runs OCR over every image in a directory or glob using a process pool.
+
+    Each worker keeps its own warm reader and writes the outputs for an
+    image as soon as it is done. Plotting is never done in batch mode.
+
+    Args:
+        source (str): Directory or glob pattern with input images
+        output_dir (str): Directory for the .json and .txt outputs
+        workers (int): Number of worker processes, defaults to CPU count
+        lang_list (list): OCR languages, defaults to ['ru']
+        resume (bool): Skip images whose outputs already exist
+        cache_dir (str): Optional OCRCache directory shared by the workers.
+            Only images with identical content are reused by default.
+        near_duplicates (bool): Also reuse results for re-photographs of a
+            cached page, after ocr_reader.confirm_values re-reads every
+            value box and finds the same text
+        preprocess (dict): Options for preprocess.read_text_preprocessed
+            (downscale, grayscale, deskew); None reads the images as they are
+        tiling (dict): Options for tiling.read_document; None reads every
+            image in one readtext call
+        reader_options (dict): Extra get_reader arguments, e.g.
+            {"backend": "onnx", "quantize": True, "intra_op_threads": 2}
+
+    Returns:
+        dict: Counts of processed, skipped and failed images and the rate
+    """
+    if lang_list is None:
+        lang_list = ['ru']
+    images = collect_images(source)
+
+    pending = []
+    skipped = 0
+    for image_path in images:
+        output_json, output_text = output_paths(image_path, output_dir)
+        if resume and os.path.exists(output_json) and os.path.exists(output_text):
+            skipped += 1
+        else:
+            pending.append(image_path)
+
+    print(f"Found {len(images)} images, {skipped} already done, {len(pending)} to process")
+    processed, failed = 0, 0
+    start = time.perf_counter()
+    if pending:
+        workers = workers or os.cpu_count() or 1
+        with ProcessPoolExecutor(max_workers=min(workers, len(pending)),
+                                 initializer=_init_worker,
+                                 initargs=(lang_list, cache_dir, tiling, reader_options, near_duplicates,
+                                           preprocess)) as pool:
+            futures = {pool.submit(_process_image, path, output_dir, lang_list): path
+                       for path in pending}
+            for future in as_completed(futures):
+                try:
+                    image_path, n_boxes = future.result()
+                except Exception as e:
+                    failed += 1
+                    print(f"⚠️ Failed on {futures[future]}: {e}")
+                    continue
+                processed += 1
+                print(f"[{processed + failed}/{len(pending)}] {image_path}: {n_boxes} boxes")
+
+    elapsed = time.perf_counter() - start
+    rate = processed / elapsed if elapsed > 0 else 0.0
+    print(f"Processed {processed} images in {elapsed:.1f}s ({rate:.2f} images/sec), "
+          f"{skipped} skipped, {failed} failed")
+    return {"processed": processed, "skipped": skipped, "failed": failed, "images_per_sec": rate}
+
+
+def main(image_path=IMAGE_PATH, output_json=OUTPUT_JSON, output_text=OUTPUT_TEXT, plot=True, tiling=None,
+         reader_options=None, preprocess=None):
+    # Load OCR reader for Russian language
+    reader = get_reader(['ru'], **(reader_options or {}))
+
+    # Decode once and share the pixels between OCR and the plot
+    image = load_image(image_path)
+
+    # Run OCR
+    result = _read_text(reader, image_path, image, tiling, preprocess)
+
+    save_outputs(result, output_json, output_text)
+    print(f"OCR results saved to {output_json}")
+    print(f"OCR text saved to {output_text}")
+
+    # Show result with bounding boxes once the outputs are safely on disk
+    if plot:
+        plot_easyocr_boxes(image, result)
+
 
 if __name__ == '__main__':
-    main()
+    parser = argparse.ArgumentParser(description="Run EasyOCR on one image or a batch of images.")
+    parser.add_argument('--batch', metavar='DIR_OR_GLOB',
+                        help="Directory or glob of images to process in parallel")
+    parser.add_argument('--output-dir', default=OUTPUT_DIR, help="Output directory for batch mode")
+    parser.add_argument('--workers', type=int, default=None, help="Number of worker processes")
+    parser.add_argument('--no-resume', action='store_true',
+                        help="Reprocess images whose outputs already exist")
+    parser.add_argument('--cache-dir', default=None,
+                        help="Reuse OCR results for identical images from this cache")
+    parser.add_argument('--near-duplicates', action='store_true',
+                        help="With --cache-dir, also reuse results for re-photographs of a cached page once "
+                             "their value boxes re-read identically")
+    parser.add_argument('--no-plot', action='store_true', help="Do not show the bounding box plot")
+    parser.add_argument('--tile-size', type=int, default=0,
+                        help="Read large scans in overlapping tiles of this size in pixels (0 = off)")
+    parser.add_argument('--tile-overlap', type=int, default=200,
+                        help="Pixels shared by neighbouring tiles; should exceed the tallest text line")
+    parser.add_argument('--tile-workers', type=int, default=2, help="Tiles read in parallel per image")
+    parser.add_argument('--no-split-pages', action='store_true',
+                        help="Do not split stitched multi-page scans into pages when tiling")
+    parser.add_argument('--preprocess', action='store_true',
+                        help="Downscale, grayscale and deskew images before OCR; boxes stay in original coordinates")
+    parser.add_argument('--binarize', action='store_true', help="With --preprocess, also binarize the page")
+    parser.add_argument('--backend', choices=['torch', 'onnx'], default='torch',
+                        help="Inference backend; onnx exports the models on first use")
+    parser.add_argument('--quantize', action='store_true', help="Use int8 models with the onnx backend")
+    parser.add_argument('--threads', type=int, default=None,
+                        help="ONNX Runtime intra-op threads per process (default: all cores)")
+    args = parser.parse_args()
+
+    reader_options = None
+    if args.backend == 'onnx':
+        reader_options = {"backend": "onnx", "quantize": args.quantize, "intra_op_threads": args.threads}
+    preprocess = {"binarize": args.binarize} if args.preprocess else None
+    tiling = None
+    if args.tile_size:
+        tiling = {"tile_size": args.tile_size, "overlap": args.tile_overlap, "workers": args.tile_workers,
+                  "split_pages": not args.no_split_pages}
+    if args.batch:
+        run_batch(args.batch, args.output_dir, args.workers, resume=not args.no_resume,
+                  cache_dir=args.cache_dir, tiling=tiling, reader_options=reader_options,
+                  near_duplicates=args.near_duplicates, preprocess=preprocess)
+    else:
+        main(plot=not args.no_plot, tiling=tiling, reader_options=reader_options, preprocess=preprocess)
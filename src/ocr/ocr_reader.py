@@ -1,15 +1,431 @@
-import easyocr
+import gc
+import os
+import sys
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+from instrumentation import count, enabled, span, traced
+
+# Process-wide registry of warm readers: key -> easyocr.Reader
+_READERS = {}
+_READER_LOCKS = {}
+# key -> number of open borrow_reader blocks; borrowed readers are evicted
+# when the last block exits
+_BORROWS = {}
+_EVICT_PENDING = set()
+_REGISTRY_LOCK = threading.Lock()
+_REGISTRY_PID = os.getpid()
+
 
 def load_reader(lang_list=None):
     """
     Initializes the EasyOCR reader with given language list.
     """
+    import easyocr
+
     if lang_list is None:
         lang_list = ['ru']
     return easyocr.Reader(lang_list, gpu=False)
 
-def read_text(reader, image_path):
+
+def reader_key(lang_list=None, gpu=False, **reader_kwargs):
+    """
+    Builds the registry key for a reader configuration.
+
+    The language order is kept as given, since EasyOCR treats the first
+    language as the primary one.
+    """
+    if lang_list is None:
+        lang_list = ['ru']
+    if reader_kwargs.get("backend") == "torch":
+        del reader_kwargs["backend"]
+    return (tuple(lang_list), bool(gpu), tuple(sorted(reader_kwargs.items())))
+
+
+def _reset_after_fork():
+    """
+    Drops readers inherited from the parent process.
+
+    Torch models do not survive a fork reliably, so every worker process
+    builds its own warm readers on first use.
+    """
+    global _REGISTRY_LOCK, _REGISTRY_PID
+    _READERS.clear()
+    _READER_LOCKS.clear()
+    _BORROWS.clear()
+    _EVICT_PENDING.clear()
+    _REGISTRY_LOCK = threading.Lock()
+    _REGISTRY_PID = os.getpid()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def get_reader(lang_list=None, gpu=False, **reader_kwargs):
+    """
+    Returns a warm EasyOCR reader for the given configuration.
+
+    The reader is built on first use and then shared by every caller in
+    this process. Concurrent first calls for the same key build it once.
+
+    Args:
+        lang_list (list): Languages for the reader, defaults to ['ru']
+        gpu (bool): Whether to run the models on GPU
+        **reader_kwargs: Extra keyword arguments for easyocr.Reader.
+            backend="onnx" runs the models on ONNX Runtime instead of
+            PyTorch; it takes model_dir, quantize and intra_op_threads
+            (see onnx_backend.load_onnx_reader).
+
+    Returns:
+        easyocr.Reader: Shared reader instance
+    """
+    if os.getpid() != _REGISTRY_PID:
+        _reset_after_fork()
+
+    key = reader_key(lang_list, gpu, **reader_kwargs)
+    reader = _READERS.get(key)
+    if reader is not None:
+        return reader
+
+    with _REGISTRY_LOCK:
+        key_lock = _READER_LOCKS.setdefault(key, threading.Lock())
+
+    # Build outside the registry lock so other configurations are not blocked
+    with key_lock:
+        reader = _READERS.get(key)
+        if reader is None:
+            options = dict(key[2])
+            if options.pop("backend", "torch") == "onnx":
+                if gpu:
+                    raise ValueError("The ONNX backend runs on CPU; use gpu=False")
+                from .onnx_backend import load_onnx_reader
+                reader = load_onnx_reader(list(key[0]), **options)
+            else:
+                # Imported here: easyocr pulls in torch, which takes seconds
+                import easyocr
+                reader = easyocr.Reader(list(key[0]), gpu=gpu, **options)
+            _READERS[key] = reader
+    return reader
+
+
+@contextmanager
+def borrow_reader(lang_list=None, gpu=False, **reader_kwargs):
+    """
+    Context manager that hands out a warm reader and holds off its eviction.
+
+    While any block holds a configuration, evict_reader and shutdown leave
+    it in the registry and mark it instead; it is evicted when the last
+    borrower leaves its block.
+    """
+    key = reader_key(lang_list, gpu, **reader_kwargs)
+    with _REGISTRY_LOCK:
+        _BORROWS[key] = _BORROWS.get(key, 0) + 1
+    try:
+        yield get_reader(lang_list, gpu, **reader_kwargs)
+    finally:
+        with _REGISTRY_LOCK:
+            _BORROWS[key] -= 1
+            evict = not _BORROWS[key] and key in _EVICT_PENDING
+            if not _BORROWS[key]:
+                del _BORROWS[key]
+        if evict:
+            _evict(key)
+
+
+def warm_up(configs=None):
+    """
+    Pre-builds readers at startup so the first request does not pay model load time.
+
+    Args:
+        configs (list): List of lang lists or dicts of get_reader kwargs.
+            Defaults to a single Russian reader.
+
+    Returns:
+        list: The warm readers, in the order of configs
+    """
+    if configs is None:
+        configs = [['ru']]
+    readers = []
+    for config in configs:
+        if isinstance(config, dict):
+            readers.append(get_reader(**config))
+        else:
+            readers.append(get_reader(config))
+    return readers
+
+
+def _release_memory():
+    gc.collect()
+    torch = sys.modules.get("torch")
+    if torch is not None and torch.cuda.is_available():
+        torch.cuda.empty_cache()
+
+
+def _evict(key, release=True):
+    with _REGISTRY_LOCK:
+        key_lock = _READER_LOCKS.get(key)
+    if key_lock is None:
+        return False
+    # Waits for a build of this key in flight. The lock stays registered:
+    # dropping it would let a new caller build alongside one still waiting on it
+    with key_lock:
+        with _REGISTRY_LOCK:
+            if _BORROWS.get(key):
+                _EVICT_PENDING.add(key)
+                return False
+            _EVICT_PENDING.discard(key)
+            reader = _READERS.pop(key, None)
+    if reader is None:
+        return False
+    del reader
+    if release:
+        _release_memory()
+    return True
+
+
+def evict_reader(lang_list=None, gpu=False, **reader_kwargs):
+    """
+    Removes one reader configuration from the registry and frees its models.
+
+    A borrowed configuration (see borrow_reader) is only marked and is
+    evicted when its last borrower is done.
+
+    Returns:
+        bool: True if a reader was evicted now
+    """
+    return _evict(reader_key(lang_list, gpu, **reader_kwargs))
+
+
+def shutdown():
+    """
+    Drops every warm reader in this process. Call this when a long-running
+    service stops or needs to give memory back. Borrowed readers are
+    dropped when their borrowers are done.
+    """
+    with _REGISTRY_LOCK:
+        keys = list(_READERS)
+    for key in keys:
+        _evict(key, release=False)
+    _release_memory()
+
+
+def loaded_readers():
+    """
+    Returns the keys of the readers currently held in the registry.
+    """
+    return list(_READERS.keys())
+
+
+def read_text(reader, image):
     """
     Performs OCR on the image using EasyOCR.
+
+    The image can be a path, encoded bytes or a decoded array. Pass the
+    array from utils.load_image to avoid EasyOCR decoding the file again.
+    """
+    if enabled():
+        instrument_reader(reader)
+    with span("ocr.readtext"):
+        result = reader.readtext(image)
+    count("ocr_images")
+    count("ocr_boxes", len(result))
+    return result
+
+
+def instrument_reader(reader):
+    """
+    Wraps the reader's detect and recognize steps in spans, so a trace
+    shows CRAFT detection and recognition separately. Only done while
+    tracing is enabled; untraced readers are left as they are.
     """
-    return reader.readtext(image_path)
+    if not getattr(reader, "_instrumented", False):
+        reader.detect = traced("ocr.detect")(reader.detect)
+        reader.recognize = traced("ocr.recognize")(reader.recognize)
+        reader._instrumented = True
+    return reader
+
+
+def pad_to_canvas(images, fill=255):
+    """
+    Pads images at the bottom and right to the size of the largest one.
+
+    Padding (rather than resizing) keeps every box EasyOCR returns in the
+    coordinates of the original image.
+
+    Returns:
+        tuple: (list of padded arrays, (height, width) of the canvas)
+    """
+    height = max(image.shape[0] for image in images)
+    width = max(image.shape[1] for image in images)
+    padded = []
+    for image in images:
+        if image.shape[:2] == (height, width):
+            padded.append(image)
+            continue
+        canvas = np.full((height, width) + image.shape[2:], fill, dtype=image.dtype)
+        canvas[:image.shape[0], :image.shape[1]] = image
+        padded.append(canvas)
+    return padded, (height, width)
+
+
+def read_text_batched(reader, images, batch_size=8):
+    """
+    Runs OCR over several decoded images in one batched call.
+
+    EasyOCR's batched path needs images of one size, so they are padded
+    to a common canvas first.
+
+    Returns:
+        list: One EasyOCR result list per image, in input order
+    """
+    if len(images) == 1:
+        return [read_text(reader, images[0])]
+    if enabled():
+        instrument_reader(reader)
+    padded, (height, width) = pad_to_canvas(images)
+    with span("ocr.readtext_batched", images=len(images)):
+        results = reader.readtext_batched(padded, n_width=width, n_height=height, batch_size=batch_size)
+    count("ocr_images", len(images))
+    count("ocr_boxes", sum(len(result) for result in results))
+    return results
+
+
+def _to_builtin(value):
+    # reader.detect returns numpy scalars; the cache stores JSON
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return [_to_builtin(v) for v in value]
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def confirm_values(reader, image, json_data):
+    """
+    Checks that a cached OCR result reads the same on another image.
+
+    Every cached box holding a digit (values, units, reference ranges,
+    dates) is recognized again on image at the cached position. The
+    result is confirmed only if each of them reads exactly the same, so
+    a sheet from the same template with other values, date or sex is
+    rejected, and so is a photo that is shifted against the cached one.
+
+    Args:
+        reader (easyocr.Reader): Reader to run
+        image: Decoded RGB array or anything load_image accepts
+        json_data (list): easyocr_to_json output of the cached image
+
+    Returns:
+        bool: True if the cached result can be reused for image
+    """
+    from .utils import load_image
+
+    image = load_image(image)
+    height, width = image.shape[:2]
+    horizontal_list, expected = [], []
+    for item in json_data:
+        if not any(ch.isdigit() for ch in item["text"]):
+            continue
+        xs = [p[0] for p in item["bbox"]]
+        ys = [p[1] for p in item["bbox"]]
+        if min(xs) < 0 or min(ys) < 0 or max(xs) > width or max(ys) > height:
+            return False
+        horizontal_list.append([int(min(xs)), int(max(xs)), int(min(ys)), int(max(ys))])
+        expected.append(item["text"])
+    if not horizontal_list:
+        return False
+
+    if image.ndim == 3:
+        import cv2
+        grey = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    else:
+        grey = image
+    with span("ocr.confirm_values", boxes=len(horizontal_list)):
+        result = reader.recognize(grey, horizontal_list=horizontal_list, free_list=[])
+    # recognize may reorder boxes, so compare the texts as multisets
+    return sorted(text for _, text, _ in result) == sorted(expected)
+
+
+def detect_regions(reader, image, cache=None, source=None, **detect_options):
+    """
+    Runs only EasyOCR's detection phase on a decoded image.
+
+    Args:
+        reader (easyocr.Reader): Reader to run
+        image (np.ndarray): Decoded RGB or grayscale image
+        cache (OCRCache): Optional cache for the detections. Use one
+            without near_duplicates, since boxes are only valid for the
+            exact image they were found on.
+        source: Path or bytes the image came from, used for the cache key
+        **detect_options: Keyword arguments for reader.detect, e.g.
+            text_threshold, low_text, canvas_size, mag_ratio
+
+    Returns:
+        tuple: (horizontal_list, free_list) for the image
+    """
+    config = {"phase": "detect", **detect_options}
+    key_source = image if source is None else source
+    cached = cache.get(key_source, config) if cache is not None else None
+    if cached is not None:
+        count("ocr_detect_cache", result="hit")
+        return cached["horizontal"], cached["free"]
+
+    if enabled():
+        instrument_reader(reader)
+    horizontal_list, free_list = reader.detect(image, **detect_options)
+    horizontal_list, free_list = _to_builtin(horizontal_list[0]), _to_builtin(free_list[0])
+    if cache is not None:
+        count("ocr_detect_cache", result="miss")
+        cache.put(key_source, config, {"horizontal": horizontal_list, "free": free_list})
+    return horizontal_list, free_list
+
+
+def read_text_two_phase(reader, image, region_filter=None, detect_options=None, recognize_options=None,
+                        cache=None, source=None):
+    """
+    Performs OCR with detection and recognition as separate phases.
+
+    Detected regions go through regions.filter_regions before recognition,
+    so tiny boxes, duplicates and (with table_only) headers, logos and
+    footers around the results table are never recognized. Detections can
+    be cached, so trying other filters or recognition settings on the same
+    image skips detection.
+
+    Args:
+        reader (easyocr.Reader): Reader to run
+        image: Decoded RGB array or anything load_image accepts
+        region_filter (dict): Overrides for regions.DEFAULT_FILTER; False
+            recognizes every detected region
+        detect_options (dict): Keyword arguments for reader.detect
+        recognize_options (dict): Keyword arguments for reader.recognize
+        cache (OCRCache): Optional detection cache, see detect_regions
+        source: Path or bytes the image came from, used for the cache key
+
+    Returns:
+        list: [(bbox, text, confidence), ...] like read_text
+    """
+    from .regions import DEFAULT_FILTER, filter_regions
+    from .utils import load_image
+
+    image = load_image(image)
+    with span("ocr.two_phase") as s:
+        horizontal_list, free_list = detect_regions(reader, image, cache, source, **(detect_options or {}))
+        if region_filter is not False:
+            horizontal_list, free_list, stats = filter_regions(horizontal_list, free_list,
+                                                               **dict(DEFAULT_FILTER, **(region_filter or {})))
+            s.set(**stats)
+            count("ocr_regions_detected", stats["detected"])
+            count("ocr_regions_skipped", stats["detected"] - stats["kept"])
+        if not horizontal_list and not free_list:
+            return []
+        if image.ndim == 3:
+            import cv2
+            # The grayscale copy readtext hands to recognition
+            grey = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        else:
+            grey = image
+        result = reader.recognize(grey, horizontal_list=horizontal_list, free_list=free_list,
+                                  **(recognize_options or {}))
+    count("ocr_images")
+    count("ocr_boxes", len(result))
+    return result
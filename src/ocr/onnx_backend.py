@@ -0,0 +1,207 @@
+import os
+
+from instrumentation import span
+
+DEFAULT_MODEL_DIR = 'ocr/onnx_models'
+OPSET = 17
+# EasyOCR recognizers read text lines scaled to this height
+RECOGNIZER_HEIGHT = 64
+
+
+def _require_onnxruntime():
+    try:
+        import onnxruntime
+    except ImportError as e:
+        raise ImportError("The ONNX backend needs onnxruntime and onnx: pip install onnxruntime onnx") from e
+    return onnxruntime
+
+
+def _detector_wrapper(model):
+    import torch
+
+    class Detector(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.model = model
+
+        def forward(self, x):
+            return self.model(x)
+
+    return Detector()
+
+
+def _recognizer_wrapper(model):
+    import torch
+
+    class MeanOverHeight(torch.nn.Module):
+        # AdaptiveAvgPool2d((None, 1)) does not export with a dynamic width
+        def forward(self, x):
+            return x.mean(dim=3, keepdim=True)
+
+    class Recognizer(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.model = model
+            if isinstance(getattr(model, "AdaptiveAvgPool", None), torch.nn.AdaptiveAvgPool2d):
+                model.AdaptiveAvgPool = MeanOverHeight()
+
+        def forward(self, image):
+            # The text argument is only used by attention decoders, which EasyOCR does not ship
+            return self.model(image, None)
+
+    return Recognizer()
+
+
+def model_paths(reader, model_dir=DEFAULT_MODEL_DIR):
+    """
+    Returns the (detector, recognizer) ONNX paths for a reader.
+
+    The detector is shared by all languages; the recognizer is named after
+    the reader's recognition network (e.g. cyrillic_g2).
+    """
+    network = getattr(reader, 'recog_network', None) or getattr(reader, 'model_lang', 'recognizer')
+    return os.path.join(model_dir, 'craft.onnx'), os.path.join(model_dir, f'{network}.onnx')
+
+
+def export_models(reader, model_dir=DEFAULT_MODEL_DIR, force=False):
+    """
+    Exports the reader's CRAFT detector and CRNN recognizer to ONNX.
+
+    The reader must be built with quantize=False: PyTorch's dynamically
+    quantized layers cannot be exported. Batch size, image height and
+    width are dynamic, so one file serves every page size.
+
+    Returns:
+        tuple: (detector path, recognizer path)
+    """
+    import torch
+
+    detector_path, recognizer_path = model_paths(reader, model_dir)
+    os.makedirs(model_dir, exist_ok=True)
+    with torch.no_grad():
+        if force or not os.path.exists(detector_path):
+            with span("onnx.export", model="detector"):
+                tmp_path = f'{detector_path}.{os.getpid()}.tmp'
+                torch.onnx.export(_detector_wrapper(reader.detector.eval()), torch.zeros(1, 3, 640, 640), tmp_path,
+                                  input_names=['image'], output_names=['score', 'feature'],
+                                  dynamic_axes={'image': {0: 'batch', 2: 'height', 3: 'width'},
+                                                'score': {0: 'batch', 1: 'height', 2: 'width'},
+                                                'feature': {0: 'batch', 2: 'height', 3: 'width'}},
+                                  opset_version=OPSET)
+                os.replace(tmp_path, detector_path)
+        if force or not os.path.exists(recognizer_path):
+            with span("onnx.export", model="recognizer"):
+                tmp_path = f'{recognizer_path}.{os.getpid()}.tmp'
+                torch.onnx.export(_recognizer_wrapper(reader.recognizer.eval()),
+                                  torch.zeros(1, 1, RECOGNIZER_HEIGHT, 256), tmp_path,
+                                  input_names=['image'], output_names=['logits'],
+                                  dynamic_axes={'image': {0: 'batch', 3: 'width'},
+                                                'logits': {0: 'batch', 1: 'steps'}},
+                                  opset_version=OPSET)
+                os.replace(tmp_path, recognizer_path)
+    return detector_path, recognizer_path
+
+
+def quantize_model(path, force=False):
+    """
+    Applies ONNX Runtime dynamic int8 quantization to an exported model.
+
+    Weights are stored as int8 and activations are quantized on the fly,
+    which mostly speeds up the recognizer's LSTM and linear layers.
+
+    Returns:
+        str: Path of the .int8.onnx model
+    """
+    _require_onnxruntime()
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    quantized_path = path[:-len('.onnx')] + '.int8.onnx'
+    if force or not os.path.exists(quantized_path):
+        with span("onnx.quantize", model=os.path.basename(path)):
+            tmp_path = f'{quantized_path}.{os.getpid()}.tmp'
+            quantize_dynamic(path, tmp_path, weight_type=QuantType.QInt8)
+            os.replace(tmp_path, quantized_path)
+    return quantized_path
+
+
+def make_session(path, intra_op_threads=None, inter_op_threads=1):
+    """
+    Opens an ONNX Runtime CPU session with full graph optimization.
+
+    Args:
+        intra_op_threads (int): Threads used inside one operator; None
+            lets ONNX Runtime use every core. Lower it when several
+            workers run on one machine.
+    """
+    ort = _require_onnxruntime()
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    if intra_op_threads:
+        options.intra_op_num_threads = intra_op_threads
+    options.inter_op_num_threads = inter_op_threads
+    return ort.InferenceSession(path, options, providers=['CPUExecutionProvider'])
+
+
+class ONNXModule:
+    """
+    Stands in for an EasyOCR torch model and runs an ONNX Runtime session.
+
+    EasyOCR calls its detector as net(x) and its recognizer as
+    model(image, text) with torch tensors, and reads torch tensors back,
+    so inputs are converted to numpy and outputs back to torch. Extra
+    arguments (the recognizer's text) are ignored.
+    """
+
+    def __init__(self, session, name):
+        self.session = session
+        self.name = name
+        self.input_name = session.get_inputs()[0].name
+
+    def __call__(self, x, *unused):
+        import torch
+
+        with span(f"onnx.{self.name}"):
+            outputs = self.session.run(None, {self.input_name: x.detach().cpu().numpy()})
+        outputs = [torch.from_numpy(output) for output in outputs]
+        return outputs[0] if len(outputs) == 1 else tuple(outputs)
+
+    def eval(self):
+        return self
+
+    def to(self, *args, **kwargs):
+        return self
+
+
+def load_onnx_reader(lang_list=None, model_dir=DEFAULT_MODEL_DIR, quantize=False, intra_op_threads=None,
+                     **reader_kwargs):
+    """
+    Builds an EasyOCR reader whose detector and recognizer run on ONNX Runtime.
+
+    The models are exported on first use and reused from model_dir after
+    that. EasyOCR's own pre- and post-processing is unchanged, so readtext,
+    detect and recognize return the usual (bbox, text, confidence) results.
+
+    Args:
+        lang_list (list): Reader languages, defaults to ['ru']
+        model_dir (str): Where exported models are kept
+        quantize (bool): Use int8 dynamically quantized models
+        intra_op_threads (int): See make_session
+        **reader_kwargs: Extra keyword arguments for easyocr.Reader
+
+    Returns:
+        easyocr.Reader: Reader with ONNX Runtime models
+    """
+    _require_onnxruntime()
+    import easyocr
+
+    if lang_list is None:
+        lang_list = ['ru']
+    # Unquantized torch models are needed for the export
+    reader = easyocr.Reader(lang_list, gpu=False, quantize=False, **reader_kwargs)
+    detector_path, recognizer_path = export_models(reader, model_dir)
+    if quantize:
+        detector_path, recognizer_path = quantize_model(detector_path), quantize_model(recognizer_path)
+    reader.detector = ONNXModule(make_session(detector_path, intra_op_threads), 'detector')
+    reader.recognizer = ONNXModule(make_session(recognizer_path, intra_op_threads), 'recognizer')
+    reader.backend = 'onnx'
+    return reader
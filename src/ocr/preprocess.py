@@ -0,0 +1,139 @@
+import cv2
+import numpy as np
+
+from .ocr_reader import read_text
+from .utils import load_image
+
+# Settings applied when read_text_preprocessed is called without options
+DEFAULT_OPTIONS = {
+    "max_side": 1600,
+    "grayscale": True,
+    "deskew": True,
+    "binarize": False,
+}
+
+
+def _profile_score(ink, angle):
+    h, w = ink.shape
+    rotation = cv2.getRotationMatrix2D((w / 2.0, h / 2.0), angle, 1.0)
+    rotated = cv2.warpAffine(ink, rotation, (w, h), flags=cv2.INTER_NEAREST)
+    # Level text lines give sharp peaks in the row sums
+    return float(np.var(rotated.sum(axis=1, dtype=np.float64)))
+
+
+def estimate_skew_angle(gray, max_angle=15.0, work_side=800):
+    """
+    Estimates the rotation that levels the text lines of a page.
+
+    The ink mask is rotated over a range of candidate angles on a small
+    copy of the page, and the angle whose horizontal projection profile
+    has the highest variance wins. A coarse 1 degree search is refined
+    in 0.1 degree steps.
+
+    Args:
+        gray (np.ndarray): Grayscale image
+        max_angle (float): Largest correction that will be considered
+        work_side (int): Long edge of the copy used for the search
+
+    Returns:
+        float: Angle in degrees to pass to cv2.getRotationMatrix2D
+    """
+    h, w = gray.shape[:2]
+    if max(h, w) > work_side:
+        scale = work_side / float(max(h, w))
+        gray = cv2.resize(gray, (round(w * scale), round(h * scale)), interpolation=cv2.INTER_AREA)
+    _, ink = cv2.threshold(gray, 0, 1, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)
+    if cv2.countNonZero(ink) < 50:
+        return 0.0
+
+    coarse = np.arange(-max_angle, max_angle + 1.0, 1.0)
+    best = max(coarse, key=lambda a: _profile_score(ink, a))
+    fine = np.arange(best - 1.0, best + 1.05, 0.1)
+    best = max(fine, key=lambda a: _profile_score(ink, a))
+    return float(round(best, 1))
+
+
+def preprocess_image(image, max_side=1600, grayscale=True, deskew=True, binarize=False):
+    """
+    Prepares an image for OCR and returns the transform back to the original.
+
+    Args:
+        image (np.ndarray): RGB or grayscale image as returned by load_image
+        max_side (int): Cap for the longest edge in pixels, None to keep size
+        grayscale (bool): Convert to a single channel
+        deskew (bool): Rotate the page so that text lines are level
+        binarize (bool): Apply adaptive thresholding (implies grayscale)
+
+    Returns:
+        tuple: (processed image, 2x3 affine matrix mapping processed
+            coordinates to original image coordinates)
+    """
+    forward = np.eye(3)
+    processed = image
+
+    h, w = processed.shape[:2]
+    if max_side and max(h, w) > max_side:
+        scale = max_side / float(max(h, w))
+        processed = cv2.resize(processed, (round(w * scale), round(h * scale)),
+                               interpolation=cv2.INTER_AREA)
+        forward = np.diag([scale, scale, 1.0]) @ forward
+
+    if (grayscale or binarize) and processed.ndim == 3:
+        processed = cv2.cvtColor(processed, cv2.COLOR_RGB2GRAY)
+
+    if deskew:
+        gray = processed if processed.ndim == 2 else cv2.cvtColor(processed, cv2.COLOR_RGB2GRAY)
+        angle = estimate_skew_angle(gray)
+        if abs(angle) >= 0.3:
+            h, w = processed.shape[:2]
+            rotation = cv2.getRotationMatrix2D((w / 2.0, h / 2.0), angle, 1.0)
+            processed = cv2.warpAffine(processed, rotation, (w, h),
+                                       flags=cv2.INTER_LINEAR,
+                                       borderMode=cv2.BORDER_REPLICATE)
+            forward = np.vstack([rotation, [0, 0, 1]]) @ forward
+
+    if binarize:
+        processed = cv2.adaptiveThreshold(processed, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+                                          cv2.THRESH_BINARY, 31, 15)
+
+    return processed, np.linalg.inv(forward)[:2]
+
+
+def map_boxes_to_original(ocr_result, transform):
+    """
+    Maps EasyOCR boxes from the preprocessed image back to the original image.
+
+    Args:
+        ocr_result (list): [(bbox, text, confidence), ...] on the processed image
+        transform (np.ndarray): 2x3 matrix returned by preprocess_image
+
+    Returns:
+        list: Same detections with bbox points in original coordinates
+    """
+    mapped = []
+    for box, text, score in ocr_result:
+        points = np.asarray(box, dtype=np.float64)
+        points = points @ transform[:, :2].T + transform[:, 2]
+        mapped.append((points.tolist(), text, score))
+    return mapped
+
+
+def read_text_preprocessed(reader, image, read=None, **options):
+    """
+    Runs OCR on a preprocessed copy of the image.
+
+    Boxes are returned in the coordinates of the original file, so the
+    result can go straight into easyocr_to_json or get_plot.
+
+    Args:
+        reader (easyocr.Reader): Reader to run
+        image: Decoded RGB array or anything load_image accepts
+        read (callable): read(reader, processed image) -> EasyOCR result;
+            defaults to ocr_reader.read_text
+        **options: Overrides for DEFAULT_OPTIONS (see preprocess_image)
+    """
+    settings = dict(DEFAULT_OPTIONS, **options)
+    image = load_image(image)
+    processed, transform = preprocess_image(image, **settings)
+    result = (read or read_text)(reader, processed)
+    return map_boxes_to_original(result, transform)
@@ -0,0 +1,156 @@
+import numpy as np
+
+# Settings applied when filter_regions is called without options
+DEFAULT_FILTER = {
+    "min_height": 0.4,
+    "min_area": 25,
+    "dedupe": 0.8,
+    "table_only": False,
+    "header_lines": 6,
+    "footer_lines": 0,
+    "min_columns": 3,
+}
+
+
+def _free_rect(points):
+    points = np.asarray(points, dtype=np.float64).reshape(4, 2)
+    return [*points.min(axis=0), *points.max(axis=0)]
+
+
+def regions_to_rects(horizontal_list, free_list):
+    """
+    Converts EasyOCR detections to one (n, 4) array of x0, y0, x1, y1.
+
+    horizontal_list holds [x_min, x_max, y_min, y_max] boxes and free_list
+    four-point polygons, as returned by reader.detect for one image. Rows
+    follow horizontal_list first, then free_list.
+    """
+    rects = [[x0, y0, x1, y1] for x0, x1, y0, y1 in horizontal_list]
+    rects.extend(_free_rect(points) for points in free_list)
+    return np.asarray(rects, dtype=np.float64).reshape(-1, 4)
+
+
+def _dedupe(rects, keep, threshold):
+    # Larger boxes first; a box mostly inside a kept one is dropped
+    areas = (rects[:, 2] - rects[:, 0]) * (rects[:, 3] - rects[:, 1])
+    kept = []
+    for i in sorted(np.flatnonzero(keep), key=lambda i: -areas[i]):
+        if kept:
+            k = np.asarray(kept)
+            width = np.minimum(rects[k, 2], rects[i, 2]) - np.maximum(rects[k, 0], rects[i, 0])
+            height = np.minimum(rects[k, 3], rects[i, 3]) - np.maximum(rects[k, 1], rects[i, 1])
+            inter = np.clip(width, 0, None) * np.clip(height, 0, None)
+            if (inter >= threshold * max(areas[i], 1.0)).any():
+                keep[i] = False
+                continue
+        kept.append(i)
+    return keep
+
+
+def group_lines(rects, indices, line_height):
+    """
+    Groups boxes into text lines by their vertical centres.
+
+    Returns:
+        list: Lists of indices into rects, top to bottom, each sorted left to right
+    """
+    centers = (rects[:, 1] + rects[:, 3]) / 2
+    lines, current, current_y = [], [], None
+    for i in sorted(indices, key=lambda i: centers[i]):
+        if current and centers[i] - current_y > 0.5 * line_height:
+            lines.append(current)
+            current = []
+        current.append(i)
+        current_y = np.mean(centers[current])
+    if current:
+        lines.append(current)
+    return [sorted(line, key=lambda i: rects[i, 0]) for line in lines]
+
+
+def _columns(rects, line, column_gap):
+    # Runs of boxes separated by gaps wider than column_gap
+    columns, right = 1, rects[line[0], 2]
+    for i in line[1:]:
+        if rects[i, 0] - right > column_gap:
+            columns += 1
+        right = max(right, rects[i, 2])
+    return columns
+
+
+def table_lines(rects, indices, min_columns=3, max_gap_lines=2, column_gap=2.0):
+    """
+    Finds the lines of the results table on a page.
+
+    A line with at least min_columns separate columns is a table row. The
+    table is the longest run of rows interrupted by at most max_gap_lines
+    other lines, which skips section titles inside the table.
+
+    Returns:
+        tuple: (lines, first, last) where lines are the grouped lines of
+            the page and first/last the table's line numbers, or None for
+            first and last if no table was found
+    """
+    heights = rects[indices, 3] - rects[indices, 1]
+    line_height = float(np.median(heights)) if len(heights) else 0.0
+    lines = group_lines(rects, indices, line_height)
+    rows = [n for n, line in enumerate(lines) if _columns(rects, line, column_gap * line_height) >= min_columns]
+    if not rows:
+        return lines, None, None
+
+    best, start = (rows[0], rows[0]), rows[0]
+    for previous, row in zip(rows, rows[1:]):
+        if row - previous - 1 > max_gap_lines:
+            start = row
+        if row - start > best[1] - best[0]:
+            best = (start, row)
+    return lines, best[0], best[1]
+
+
+def filter_regions(horizontal_list, free_list, min_height=0.4, min_area=25, dedupe=0.8, table_only=False,
+                   header_lines=6, footer_lines=0, min_columns=3):
+    """
+    Drops detected text regions that are not worth recognizing.
+
+    EasyOCR's detector does not expose per-box scores; weak detections are
+    pruned in reader.detect through text_threshold / low_text instead.
+
+    Args:
+        horizontal_list (list): reader.detect boxes [x_min, x_max, y_min, y_max]
+        free_list (list): reader.detect four-point polygons
+        min_height (float): Boxes lower than this share of the median box
+            height are specks, stamps or logo fragments
+        min_area (float): Smallest box area in pixels
+        dedupe (float): Drop a box when this share of it lies inside a
+            larger box; None keeps overlapping boxes
+        table_only (bool): Keep only the results table, header_lines lines
+            above it (patient, sex, sampling date) and footer_lines below
+        header_lines (int): Lines kept above the table
+        footer_lines (int): Lines kept below the table
+        min_columns (int): Columns that make a line a table row
+
+    Returns:
+        tuple: (horizontal_list, free_list, stats) with the kept regions
+            and {"detected", "kept"} counts
+    """
+    rects = regions_to_rects(horizontal_list, free_list)
+    detected = len(rects)
+    if not detected:
+        return horizontal_list, free_list, {"detected": 0, "kept": 0}
+
+    widths = rects[:, 2] - rects[:, 0]
+    heights = rects[:, 3] - rects[:, 1]
+    keep = (heights >= min_height * np.median(heights)) & (widths * heights >= min_area)
+    if dedupe:
+        keep = _dedupe(rects, keep, dedupe)
+
+    if table_only and keep.any():
+        lines, first, last = table_lines(rects, np.flatnonzero(keep), min_columns)
+        if first is not None:
+            keep[:] = False
+            for line in lines[max(0, first - header_lines):last + footer_lines + 1]:
+                keep[line] = True
+
+    n_horizontal = len(horizontal_list)
+    horizontal_list = [box for i, box in enumerate(horizontal_list) if keep[i]]
+    free_list = [points for i, points in enumerate(free_list) if keep[n_horizontal + i]]
+    return horizontal_list, free_list, {"detected": detected, "kept": int(keep.sum())}
@@ -0,0 +1,361 @@
+import argparse
+import base64
+import json
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import cv2
+
+from .ocr_reader import get_reader, loaded_readers, read_text_batched, warm_up
+from .preprocess import DEFAULT_OPTIONS, map_boxes_to_original, preprocess_image
+from .utils import easyocr_to_json, get_plot, load_image
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Larger request bodies are refused before they are read
+MAX_BODY_BYTES = 20 * 1024 * 1024
+
+
+class Metrics:
+    """
+    Thread-safe counters and a latency histogram in Prometheus text format.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = {"ok": 0, "error": 0}
+        self.batches = 0
+        self.batched_images = 0
+        self.latency_counts = [0] * len(LATENCY_BUCKETS)
+        self.latency_sum = 0.0
+        self.latency_count = 0
+
+    def observe_request(self, ok, latency):
+        with self._lock:
+            self.requests["ok" if ok else "error"] += 1
+            self.latency_sum += latency
+            self.latency_count += 1
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if latency <= bound:
+                    self.latency_counts[i] += 1
+
+    def observe_batch(self, size):
+        with self._lock:
+            self.batches += 1
+            self.batched_images += size
+
+    def render(self, queue_depth=0):
+        with self._lock:
+            lines = [
+                "# TYPE ocr_requests_total counter",
+                *(f'ocr_requests_total{{status="{k}"}} {v}' for k, v in self.requests.items()),
+                "# TYPE ocr_batches_total counter",
+                f"ocr_batches_total {self.batches}",
+                "# TYPE ocr_batched_images_total counter",
+                f"ocr_batched_images_total {self.batched_images}",
+                "# TYPE ocr_request_latency_seconds histogram",
+                *(f'ocr_request_latency_seconds_bucket{{le="{bound}"}} {count}'
+                  for bound, count in zip(LATENCY_BUCKETS, self.latency_counts)),
+                f'ocr_request_latency_seconds_bucket{{le="+Inf"}} {self.latency_count}',
+                f"ocr_request_latency_seconds_sum {self.latency_sum:.6f}",
+                f"ocr_request_latency_seconds_count {self.latency_count}",
+                "# TYPE ocr_queue_depth gauge",
+                f"ocr_queue_depth {queue_depth}",
+                "# TYPE ocr_readers_loaded gauge",
+                f"ocr_readers_loaded {len(loaded_readers())}",
+            ]
+        return "\n".join(lines) + "\n"
+
+
+def group_by_canvas(images, max_pad_ratio=2.0):
+    """
+    Splits images into groups that can share a padded canvas.
+
+    pad_to_canvas pads a group to its largest height and largest width.
+    An image joins a group only if that canvas, grown to fit the image,
+    stays at most max_pad_ratio times the area of every member, so one
+    large page (or a wide and a tall image) does not make a batch pay
+    for padding.
+
+    Returns:
+        list: Lists of indices into images
+    """
+    order = sorted(range(len(images)), key=lambda i: images[i].shape[0] * images[i].shape[1], reverse=True)
+    groups = []
+    for i in order:
+        height, width = images[i].shape[:2]
+        for group in groups:
+            canvas_height, canvas_width = max(group["height"], height), max(group["width"], width)
+            smallest = min(group["smallest"], height * width)
+            if canvas_height * canvas_width <= max_pad_ratio * smallest:
+                group["indices"].append(i)
+                group["height"], group["width"], group["smallest"] = canvas_height, canvas_width, smallest
+                break
+        else:
+            groups.append({"height": height, "width": width, "smallest": height * width, "indices": [i]})
+    return [group["indices"] for group in groups]
+
+
+class MicroBatcher:
+    """
+    Collects concurrent OCR requests into batches for one reader.
+
+    A batch is run as soon as max_batch_size images are waiting or the
+    oldest image has waited max_wait_ms, whichever comes first, so
+    batching never adds more than max_wait_ms to a request.
+
+    If the reader cannot be loaded or a batch fails, the waiting requests
+    get the exception and the loop keeps serving. A failed reader load is
+    kept in error (which makes /healthz report the service unhealthy) and
+    retried with the next batch.
+
+    Args:
+        lang_list (list): Reader languages
+        max_batch_size (int): Images per batched call
+        max_wait_ms (float): Longest time the first image waits for company
+        max_pad_ratio (float): See group_by_canvas
+        metrics (Metrics): Optional metrics sink
+    """
+
+    def __init__(self, lang_list, max_batch_size=8, max_wait_ms=25, max_pad_ratio=2.0, metrics=None):
+        self.lang_list = lang_list
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_pad_ratio = max_pad_ratio
+        self.metrics = metrics
+        self.queue = queue.Queue()
+        self.error = None
+        self._thread = threading.Thread(target=self._loop, name=f"batcher-{'-'.join(lang_list)}", daemon=True)
+        self._thread.start()
+
+    def submit(self, image):
+        """
+        Queues a decoded image and returns a Future with its EasyOCR result.
+        """
+        future = Future()
+        self.queue.put((image, future, time.monotonic()))
+        return future
+
+    def _collect(self):
+        batch = [self.queue.get()]
+        deadline = batch[0][2] + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self, reader, batch):
+        images = [item[0] for item in batch]
+        for indices in group_by_canvas(images, self.max_pad_ratio):
+            try:
+                results = read_text_batched(reader, [images[i] for i in indices], self.max_batch_size)
+            except Exception as e:
+                for i in indices:
+                    batch[i][1].set_exception(e)
+                continue
+            if self.metrics is not None:
+                self.metrics.observe_batch(len(indices))
+            for i, result in zip(indices, results):
+                batch[i][1].set_result((result, len(indices)))
+
+    def _loop(self):
+        reader = None
+        while True:
+            batch = self._collect()
+            try:
+                if reader is None:
+                    try:
+                        reader = get_reader(self.lang_list)
+                    except Exception as e:
+                        self.error = e
+                        raise
+                    self.error = None
+                self._run(reader, batch)
+            except Exception as e:
+                # Nothing may escape: a dead loop would leave every later request hanging
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+
+class OCRService:
+    """
+    Keeps warm readers and one MicroBatcher per language configuration.
+    """
+
+    def __init__(self, max_batch_size=8, max_wait_ms=25, max_pad_ratio=2.0):
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.max_pad_ratio = max_pad_ratio
+        self.metrics = Metrics()
+        self._batchers = {}
+        self._lock = threading.Lock()
+
+    def batcher(self, lang_list):
+        key = tuple(lang_list)
+        with self._lock:
+            batcher = self._batchers.get(key)
+            if batcher is None:
+                batcher = MicroBatcher(list(key), self.max_batch_size, self.max_wait_ms,
+                                       self.max_pad_ratio, self.metrics)
+                self._batchers[key] = batcher
+        return batcher
+
+    def errors(self):
+        """
+        Returns {languages: error} for batchers whose reader failed to load.
+        """
+        with self._lock:
+            return {",".join(key): str(b.error) for key, b in self._batchers.items() if b.error is not None}
+
+    def queue_depth(self):
+        with self._lock:
+            return sum(b.queue.qsize() for b in self._batchers.values())
+
+    def ocr(self, data, lang_list, overlay=False, preprocess=None):
+        """
+        Runs OCR on an encoded image.
+
+        Args:
+            preprocess (dict): Options for preprocess.preprocess_image. The
+                preprocessed copy is batched and its boxes are mapped back
+                to the original image.
+
+        Returns:
+            dict: {"result": easyocr_to_json output, "batch_size": n,
+                "overlay": base64 PNG if requested}
+        """
+        image = load_image(data)
+        if preprocess is not None:
+            processed, transform = preprocess_image(image, **dict(DEFAULT_OPTIONS, **preprocess))
+            result, batch_size = self.batcher(lang_list).submit(processed).result()
+            result = map_boxes_to_original(result, transform)
+        else:
+            result, batch_size = self.batcher(lang_list).submit(image).result()
+        response = {"result": easyocr_to_json(result), "batch_size": batch_size}
+        if overlay:
+            drawn = cv2.cvtColor(get_plot(image, result), cv2.COLOR_RGB2BGR)
+            ok, png = cv2.imencode(".png", drawn)
+            response["overlay"] = base64.b64encode(png.tobytes()).decode("ascii") if ok else None
+        return response
+
+
+def make_handler(service, max_body_bytes=MAX_BODY_BYTES):
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, status, body, content_type="application/json"):
+            if not isinstance(body, bytes):
+                body = json.dumps(body, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            path = urlparse(self.path).path
+            if path == "/healthz":
+                errors = service.errors()
+                readers = [list(key[0]) for key in loaded_readers()]
+                if errors:
+                    self._send(503, {"status": "unhealthy", "errors": errors, "readers": readers})
+                else:
+                    self._send(200, {"status": "ok", "readers": readers})
+            elif path == "/metrics":
+                self._send(200, service.metrics.render(service.queue_depth()).encode("utf-8"),
+                           "text/plain; version=0.0.4")
+            else:
+                self._send(404, {"error": "not found"})
+
+        def do_POST(self):
+            url = urlparse(self.path)
+            if url.path != "/ocr":
+                self._send(404, {"error": "not found"})
+                return
+            start = time.perf_counter()
+            params = parse_qs(url.query)
+            lang_list = params.get("lang", ["ru"])[0].split(",")
+            overlay = params.get("overlay", ["0"])[0] in ("1", "true", "yes")
+            preprocess = {} if params.get("preprocess", ["0"])[0] in ("1", "true", "yes") else None
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+            except ValueError:
+                length = -1
+            if length < 0 or length > max_body_bytes:
+                # The body is left unread, so the connection cannot be reused
+                self.close_connection = True
+                service.metrics.observe_request(False, time.perf_counter() - start)
+                if length < 0:
+                    self._send(400, {"error": "Invalid Content-Length"})
+                else:
+                    self._send(413, {"error": f"Request body larger than {max_body_bytes} bytes"})
+                return
+            data = self.rfile.read(length)
+            try:
+                if not data:
+                    raise ValueError("Empty request body; send the encoded image as the body")
+                response = service.ocr(data, lang_list, overlay, preprocess)
+            except ValueError as e:
+                service.metrics.observe_request(False, time.perf_counter() - start)
+                self._send(400, {"error": str(e)})
+                return
+            except Exception as e:
+                service.metrics.observe_request(False, time.perf_counter() - start)
+                self._send(500, {"error": str(e)})
+                return
+            response["latency_ms"] = round((time.perf_counter() - start) * 1000, 1)
+            service.metrics.observe_request(True, time.perf_counter() - start)
+            self._send(200, response)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def serve(host="127.0.0.1", port=8010, lang_list=None, max_batch_size=8, max_wait_ms=25, max_pad_ratio=2.0,
+          max_body_bytes=MAX_BODY_BYTES):
+    """
+    Runs the OCR service until interrupted.
+
+    Endpoints:
+        POST /ocr?lang=ru,en&overlay=1&preprocess=1  body: encoded image
+        GET /healthz  (503 while a reader fails to load)
+        GET /metrics  (Prometheus text format)
+    """
+    lang_list = lang_list or ['ru']
+    # Load the models before accepting requests
+    warm_up([lang_list])
+    service = OCRService(max_batch_size, max_wait_ms, max_pad_ratio)
+    service.batcher(lang_list)
+    server = ThreadingHTTPServer((host, port), make_handler(service, max_body_bytes))
+    print(f"OCR service on http://{host}:{port} (batch {max_batch_size}, max wait {max_wait_ms} ms)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local OCR HTTP service with micro-batching.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8010)
+    parser.add_argument("--lang", default="ru", help="Comma-separated languages to warm up")
+    parser.add_argument("--max-batch-size", type=int, default=8)
+    parser.add_argument("--max-wait-ms", type=float, default=25, help="Longest extra wait to fill a batch")
+    parser.add_argument("--max-pad-ratio", type=float, default=2.0,
+                        help="Largest canvas/image area ratio when padding images into one batch")
+    parser.add_argument("--max-body-mb", type=float, default=MAX_BODY_BYTES / (1024 * 1024),
+                        help="Largest accepted image upload; bigger requests get 413")
+    args = parser.parse_args()
+    serve(args.host, args.port, args.lang.split(","), args.max_batch_size, args.max_wait_ms, args.max_pad_ratio,
+          int(args.max_body_mb * 1024 * 1024))
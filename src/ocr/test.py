@@ -1,2 +1,2 @@
-from Pocket_Doctor.src.ocr.get_output import get_output
+from .get_output import get_output
 print(get_output("images/BLD.jpg"))
\ No newline at end of file
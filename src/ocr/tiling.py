@@ -0,0 +1,341 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from difflib import SequenceMatcher
+
+import numpy as np
+
+from instrumentation import count, span
+from .ocr_reader import read_text
+from .utils import load_image
+
+# Settings applied when read_document is called without options
+DEFAULT_OPTIONS = {
+    "tile_size": 1600,
+    "overlap": 200,
+    "workers": 2,
+    "split_pages": True,
+}
+
+MULTIPAGE_EXTENSIONS = ('.tif', '.tiff')
+
+
+def tile_grid(height, width, tile_size=1600, overlap=200):
+    """
+    Splits a page into overlapping tiles.
+
+    Tiles are at most tile_size square and neighbours share overlap
+    pixels. The last tile of a row or column is flush with the page edge,
+    so tiles never reach past the image.
+
+    Returns:
+        list: (y0, x0, y1, x1) per tile, in reading order
+    """
+    if overlap >= tile_size:
+        raise ValueError("overlap must be smaller than tile_size")
+
+    def starts(length):
+        if length <= tile_size:
+            return [0]
+        step = tile_size - overlap
+        positions = list(range(0, length - tile_size, step))
+        positions.append(length - tile_size)
+        return positions
+
+    return [(y, x, min(y + tile_size, height), min(x + tile_size, width))
+            for y in starts(height) for x in starts(width)]
+
+
+def _rects(boxes):
+    # Axis-aligned (x0, y0, x1, y1) of each EasyOCR quadrilateral
+    points = np.array([np.asarray(box, dtype=np.float64).reshape(4, 2) for box in boxes]).reshape(-1, 4, 2)
+    return np.concatenate([points.min(axis=1), points.max(axis=1)], axis=1)
+
+
+def _normalize_text(text):
+    return "".join(text.lower().split())
+
+
+def texts_agree(a, b, threshold=0.6):
+    """
+    Whether two readings are the same text.
+
+    A word cut by a tile edge is read as a prefix or suffix of the whole
+    word, so containment counts as agreement as well as close similarity.
+    """
+    a, b = _normalize_text(a), _normalize_text(b)
+    if not a or not b:
+        return a == b
+    if a in b or b in a:
+        return True
+    return SequenceMatcher(None, a, b).ratio() >= threshold
+
+
+def _join_text(left, right):
+    # Longest suffix of left that is also a prefix of right is read twice
+    if _normalize_text(right) in _normalize_text(left):
+        return left
+    for k in range(min(len(left), len(right)), 0, -1):
+        if left[-k:].lower() == right[:k].lower():
+            return left + right[k:]
+    return left + right
+
+
+def _stitch(pieces):
+    """
+    Joins pieces of words cut by a vertical tile edge.
+
+    Pieces on the same line whose boxes overlap were read from the two
+    sides of one tile edge. The texts are joined on their common overlap
+    and the boxes on their bounding rectangle.
+    """
+    pieces = sorted(pieces, key=lambda piece: piece[0][0])
+    stitched = []
+    for rect, text, score in pieces:
+        for i, (other, other_text, other_score) in enumerate(stitched):
+            vertical = min(rect[3], other[3]) - max(rect[1], other[1])
+            if rect[0] < other[2] and vertical >= 0.5 * min(rect[3] - rect[1], other[3] - other[1]):
+                joined = [min(rect[0], other[0]), min(rect[1], other[1]), max(rect[2], other[2]),
+                          max(rect[3], other[3])]
+                stitched[i] = (joined, _join_text(other_text, text), min(score, other_score))
+                break
+        else:
+            stitched.append((list(rect), text, score))
+    return [([[x0, y0], [x1, y0], [x1, y1], [x0, y1]], text, score) for (x0, y0, x1, y1), text, score in stitched]
+
+
+def merge_detections(detections, iou_threshold=0.5, containment_threshold=0.8, text_threshold=0.6):
+    """
+    Merges the detections of overlapping tiles into one page result.
+
+    Detections are visited whole-before-cut and then by confidence. One is
+    dropped when a kept whole detection covers it (IoU >= iou_threshold,
+    or the smaller box lies containment_threshold inside the larger one)
+    and the texts agree. Cut detections that no whole one covers are
+    pieces of a word wider than the overlap and are stitched together.
+    Only boxes that more than one tile saw are compared.
+
+    Args:
+        detections (list): (bbox, text, confidence, cut, shared) in page
+            coordinates; cut marks boxes touching an inner tile edge and
+            shared marks boxes that lie in an overlap region
+
+    Returns:
+        tuple: (list of (bbox, text, confidence), number of detections
+            merged away)
+    """
+    if not detections:
+        return [], 0
+    rects = _rects([d[0] for d in detections])
+    areas = np.maximum(rects[:, 2] - rects[:, 0], 1.0) * np.maximum(rects[:, 3] - rects[:, 1], 1.0)
+    order = sorted(range(len(detections)), key=lambda i: (detections[i][3], -detections[i][2]))
+
+    kept, whole_shared, pieces = [], [], []
+    for i in order:
+        box, text, score, cut, shared = detections[i]
+        if shared and whole_shared:
+            k = np.asarray(whole_shared)
+            width = np.minimum(rects[k, 2], rects[i, 2]) - np.maximum(rects[k, 0], rects[i, 0])
+            height = np.minimum(rects[k, 3], rects[i, 3]) - np.maximum(rects[k, 1], rects[i, 1])
+            inter = np.clip(width, 0, None) * np.clip(height, 0, None)
+            iou = inter / (areas[k] + areas[i] - inter)
+            containment = inter / np.minimum(areas[k], areas[i])
+            overlapping = k[(iou >= iou_threshold) | (containment >= containment_threshold)]
+            if any(texts_agree(text, detections[j][1], text_threshold) for j in overlapping):
+                continue
+        if cut and shared:
+            pieces.append((rects[i].tolist(), text, score))
+            continue
+        kept.append(detections[i][:3])
+        if shared:
+            whole_shared.append(i)
+
+    merged = kept + _stitch(pieces)
+    # Reading order: top to bottom, then left to right, like readtext
+    merged_rects = _rects([box for box, _, _ in merged])
+    order = sorted(range(len(merged)), key=lambda i: (merged_rects[i, 1], merged_rects[i, 0]))
+    return [merged[i] for i in order], len(detections) - len(merged)
+
+
+def _tile_detections(result, tile, tiles, page_shape, margin):
+    y0, x0, y1, x1 = tile
+    height, width = page_shape
+    detections = []
+    for box, text, score in result:
+        box = (np.asarray(box, dtype=np.float64).reshape(4, 2) + (x0, y0)).tolist()
+        bx0, by0 = min(p[0] for p in box), min(p[1] for p in box)
+        bx1, by1 = max(p[0] for p in box), max(p[1] for p in box)
+        # Edges shared with the page cannot cut a word; inner tile edges can
+        cut = ((x0 > 0 and bx0 - x0 < margin) or (x1 < width and x1 - bx1 < margin)
+               or (y0 > 0 and by0 - y0 < margin) or (y1 < height and y1 - by1 < margin))
+        shared = sum(1 for ty0, tx0, ty1, tx1 in tiles
+                     if tx0 < bx1 and bx0 < tx1 and ty0 < by1 and by0 < ty1) > 1
+        detections.append((box, text, score, cut, shared))
+    return detections
+
+
+def read_text_tiled(reader, image, tile_size=1600, overlap=200, workers=2, iou_threshold=0.5,
+                    text_threshold=0.6, edge_margin=4):
+    """
+    Runs OCR tile by tile and merges the tiles back into one page result.
+
+    Large scans are cut into overlapping tiles that are read in parallel
+    threads, at most workers at a time, so peak memory is bounded by
+    workers tiles instead of the whole page. overlap should exceed the
+    tallest text line so every word is whole in at least one tile.
+
+    Args:
+        reader (easyocr.Reader): Reader to run
+        image: Decoded RGB array or anything load_image accepts
+        tile_size (int): Longest tile edge in pixels
+        overlap (int): Pixels shared by neighbouring tiles
+        workers (int): Tiles read at the same time
+        iou_threshold (float): See merge_detections
+        text_threshold (float): See texts_agree
+        edge_margin (int): Boxes this close to an inner tile edge count as cut
+
+    Returns:
+        list: [(bbox, text, confidence), ...] in page coordinates, ready
+            for easyocr_to_json or easyocr_to_structured_text
+    """
+    image = load_image(image)
+    height, width = image.shape[:2]
+    tiles = tile_grid(height, width, tile_size, overlap)
+    if len(tiles) == 1:
+        return read_text(reader, image)
+
+    def read_tile(tile):
+        y0, x0, y1, x1 = tile
+        # Copy only while the tile is being read; the page itself is never duplicated
+        result = read_text(reader, np.ascontiguousarray(image[y0:y1, x0:x1]))
+        return _tile_detections(result, tile, tiles, (height, width), edge_margin)
+
+    with span("ocr.tiled", tiles=len(tiles), workers=workers) as s:
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(tiles)))) as pool:
+            detections = [d for tile_result in pool.map(read_tile, tiles) for d in tile_result]
+        merged, duplicates = merge_detections(detections, iou_threshold, text_threshold=text_threshold)
+        s.set(duplicates=duplicates)
+    count("ocr_tiles", len(tiles))
+    count("ocr_tile_duplicates", duplicates)
+    return merged
+
+
+def split_pages(image, page_aspect=1.414, max_aspect=2.0, search=0.15, ink_threshold=0.005):
+    """
+    Finds page boundaries in pages stitched one above the other.
+
+    An image taller than max_aspect times its width is expected to hold
+    round(height / (width * page_aspect)) pages. Each boundary is placed
+    in the middle of the widest blank band within search page heights of
+    its expected position, or at the emptiest row if there is none.
+
+    Args:
+        image (np.ndarray): Decoded page image
+        page_aspect (float): Height / width of one page (A4 is 1.414)
+        max_aspect (float): Images up to this height / width are one page
+        search (float): Search window around each boundary, in page heights
+        ink_threshold (float): Rows with a smaller share of dark pixels are blank
+
+    Returns:
+        list: (y0, y1) row range of every page
+    """
+    height, width = image.shape[:2]
+    n_pages = round(height / (width * page_aspect))
+    if height <= max_aspect * width or n_pages < 2:
+        return [(0, height)]
+
+    gray = image if image.ndim == 2 else image.mean(axis=2)
+    ink = (gray < 128).mean(axis=1)
+    blank = ink < ink_threshold
+    page_height = height / n_pages
+    cuts = [0]
+    for k in range(1, n_pages):
+        lo = max(cuts[-1] + 1, int(k * page_height - search * page_height))
+        hi = min(height - 1, int(k * page_height + search * page_height))
+        best, best_len, start = None, 0, None
+        for y in range(lo, hi + 1):
+            if blank[y] and start is None:
+                start = y
+            if start is not None and (not blank[y] or y == hi):
+                end = y if not blank[y] else y + 1
+                if end - start > best_len:
+                    best, best_len = (start + end) // 2, end - start
+                start = None
+        cuts.append(best if best is not None else lo + int(np.argmin(ink[lo:hi + 1])))
+    cuts.append(height)
+    return list(zip(cuts[:-1], cuts[1:]))
+
+
+def load_pages(source, image=None, split=True, **split_options):
+    """
+    Returns the pages of a document with their vertical offset.
+
+    Frames of a multi-page TIFF are stacked one below the other; any other
+    image is cut with split_pages. Offsets place every page in document
+    coordinates, so results of all pages can be joined into one.
+
+    Args:
+        source: Path or anything load_image accepts
+        image (np.ndarray): Already decoded pixels of source, if available
+        split (bool): Look for stitched pages in single images
+
+    Returns:
+        list: (page image, y offset) per page
+    """
+    if isinstance(source, (str, os.PathLike)) and str(source).lower().endswith(MULTIPAGE_EXTENSIONS):
+        import cv2
+        ok, frames = cv2.imreadmulti(str(source), flags=cv2.IMREAD_COLOR)
+        if ok and len(frames) > 1:
+            pages, offset = [], 0
+            for frame in frames:
+                pages.append((cv2.cvtColor(frame, cv2.COLOR_BGR2RGB), offset))
+                offset += frame.shape[0]
+            return pages
+    image = load_image(source if image is None else image)
+    if not split:
+        return [(image, 0)]
+    return [(image[y0:y1], y0) for y0, y1 in split_pages(image, **split_options)]
+
+
+def read_document(reader, source, image=None, per_page=False, preprocess=None, **options):
+    """
+    Runs tiled OCR over every page of a single or multi-page document.
+
+    Boxes are always in the pixels of the original pages: with
+    preprocess, every page is preprocessed on its own and its boxes are
+    mapped back before pages are joined. image must therefore be the
+    original, not an already preprocessed copy. For a multi-page TIFF it
+    is ignored and the frames are read from source.
+
+    Args:
+        reader (easyocr.Reader): Reader to run
+        source: Path or anything load_image accepts
+        image (np.ndarray): Already decoded original pixels of source, if available
+        per_page (bool): Return one result per page in page coordinates
+        preprocess (dict): Options for preprocess.preprocess_image, or
+            None to read the pages as they are
+        **options: Overrides for DEFAULT_OPTIONS (see read_text_tiled)
+
+    Returns:
+        list: One result in document coordinates (pages stacked top to
+            bottom), or a list of page results if per_page
+    """
+    settings = dict(DEFAULT_OPTIONS, **options)
+    split = settings.pop("split_pages")
+    pages = load_pages(source, image, split)
+    count("ocr_pages", len(pages))
+    if preprocess is not None:
+        # Imported here: preprocess needs OpenCV at import time
+        from .preprocess import read_text_preprocessed
+
+        def read(reader, processed):
+            return read_text_tiled(reader, processed, **settings)
+        results = [read_text_preprocessed(reader, page, read, **preprocess) for page, _ in pages]
+    else:
+        results = [read_text_tiled(reader, page, **settings) for page, _ in pages]
+    if per_page:
+        return results
+    document = []
+    for (_, offset), result in zip(pages, results):
+        document.extend(((np.asarray(box, dtype=np.float64).reshape(4, 2) + (0, offset)).tolist(), text, score)
+                        for box, text, score in result)
+    return document
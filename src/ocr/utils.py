@@ -1,39 +1,67 @@
-import cv2
-import matplotlib.pyplot as plt
+import os
+
 import numpy as np
 import json
 
-def plot_easyocr_boxes(image_path, ocr_result):
-    """
-    Plots bounding boxes and recognized text from EasyOCR results on the image.
-    """
-    image = cv2.imread(image_path)
-    image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+from instrumentation import traced
 
-    for detection in ocr_result:
-        box, text, score = detection
-        box = np.array(box).astype(int)
-        cv2.polylines(image, [box], isClosed=True, color=(0, 255, 0), thickness=2)
 
-    plt.figure(figsize=(12, 8))
-    plt.imshow(image)
-    plt.axis('off')
-    plt.title("Detected Text with Bounding Boxes")
-    plt.show()
+@traced("ocr.decode")
+def load_image(source):
+    """
+    Decodes an image exactly once into an RGB array.
+
+    Args:
+        source: Path to an image file, encoded bytes (bytes, bytearray,
+            memoryview), a 1-D uint8 buffer such as an np.memmap of an
+            encoded file, or an already decoded image array
 
-def get_plot(image_path, ocr_result):
+    Returns:
+        np.ndarray: RGB (or grayscale) image. Decoded arrays are returned
+            as is, without a copy.
     """
-    Plots bounding boxes and recognized text from EasyOCR results on the image.
+    if isinstance(source, np.ndarray) and source.ndim >= 2:
+        return source
+    import cv2
+    if isinstance(source, (str, os.PathLike)):
+        # Map the encoded file instead of reading it into a bytes object;
+        # this also avoids cv2.imread failing on non-ASCII Windows paths
+        buffer = np.memmap(source, dtype=np.uint8, mode='r')
+    elif isinstance(source, np.ndarray):
+        buffer = source
+    else:
+        buffer = np.frombuffer(source, dtype=np.uint8)
+    image = cv2.imdecode(buffer, cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError(f"Could not decode image from {type(source).__name__}")
+    return cv2.cvtColor(image, cv2.COLOR_BGR2RGB, dst=image)
+
+
+def get_plot(image, ocr_result):
+    """
+    Draws EasyOCR bounding boxes on a copy of the image.
+
+    Args:
+        image: Decoded RGB array or anything load_image accepts
+        ocr_result (list): EasyOCR output [(bbox, text, confidence), ...]
+
+    Returns:
+        np.ndarray: RGB overlay; the input array is left untouched
     """
-    image = cv2.imread(image_path)
-    image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+    import cv2
+
+    image = load_image(image)
+    if image.ndim == 2:
+        overlay = cv2.cvtColor(image, cv2.COLOR_GRAY2RGB)
+    else:
+        overlay = image.copy()
 
     for detection in ocr_result:
         box, text, score = detection
         box = np.array(box).astype(int)
-        cv2.polylines(image, [box], isClosed=True, color=(0, 255, 0), thickness=2)
+        cv2.polylines(overlay, [box], isClosed=True, color=(0, 255, 0), thickness=2)
 
-    return image
+    return overlay
 
 
 def easyocr_to_json(ocr_result):
@@ -57,6 +85,18 @@ def easyocr_to_json(ocr_result):
         })
     return output
 
+def json_to_easyocr(json_data):
+    """
+    Converts easyocr_to_json output back to EasyOCR's result format.
+
+    Args:
+        json_data (list): List of dicts with 'text', 'bbox' and 'confidence' keys
+
+    Returns:
+        list: [(bbox, text, confidence), ...] as returned by readtext()
+    """
+    return [(item["bbox"], item["text"], item["confidence"]) for item in json_data]
+
 def easyocr_to_text(ocr_result):
     """
     Converts EasyOCR output to a plain text string without bbox or confidence info.
@@ -74,75 +114,187 @@ def easyocr_to_text(ocr_result):
             lines.append(text.strip())
     return "\n".join(lines)
 
-def easyocr_to_structured_text(ocr_result, line_threshold=15, space_scale=10):
+def _boxes_to_array(ocr_result):
+    """
+    Packs EasyOCR boxes into one (n, 4, 2) float array plus the list of texts.
+    """
+    if not ocr_result:
+        return np.zeros((0, 4, 2)), []
+    boxes = np.array([np.asarray(box, dtype=np.float64).reshape(4, 2) for box, _, _ in ocr_result])
+    texts = [text for _, text, _ in ocr_result]
+    return boxes, texts
+
+
+def estimate_page_skew(boxes):
+    """
+    Estimates the page rotation from the top edges of the detected boxes.
+
+    Args:
+        boxes (np.ndarray): (n, 4, 2) array of box corners in EasyOCR order
+            (top-left, top-right, bottom-right, bottom-left)
+
+    Returns:
+        float: Skew angle in radians, positive when lines slope downwards
+    """
+    if len(boxes) == 0:
+        return 0.0
+    edges = boxes[:, 1] - boxes[:, 0]
+    widths = np.hypot(edges[:, 0], edges[:, 1])
+    # Short boxes (single digits, units) give noisy angles
+    usable = (widths > 0) & (widths >= np.median(widths))
+    if not usable.any():
+        return 0.0
+    angles = np.arctan2(edges[usable, 1], edges[usable, 0])
+    return float(np.median(angles))
+
+
+def layout_lines(ocr_result, line_threshold=None):
+    """
+    Groups EasyOCR detections into text lines.
+
+    Box centres are rotated by the estimated page skew, sorted top to
+    bottom, and a new line starts wherever the vertical gap to the
+    previous box exceeds the threshold. This is one sort plus vectorized
+    passes, so it stays O(n log n) on dense sheets.
+
+    Args:
+        ocr_result (list): EasyOCR output [(bbox, text, confidence), ...]
+        line_threshold (float): Max vertical distance between words on the
+            same line. Defaults to half the median box height.
+
+    Returns:
+        tuple: (boxes, texts, lines) where lines is a list of index arrays,
+            top to bottom, each ordered left to right, and boxes are the
+            deskewed (n, 4, 2) corners
+    """
+    boxes, texts = _boxes_to_array(ocr_result)
+    if len(boxes) == 0:
+        return boxes, texts, []
+
+    skew = estimate_page_skew(boxes)
+    cos, sin = np.cos(skew), np.sin(skew)
+    rotation = np.array([[cos, sin], [-sin, cos]])
+    boxes = boxes @ rotation.T
+
+    centers_y = boxes[:, :, 1].mean(axis=1)
+    left_x = boxes[:, :, 0].min(axis=1)
+    heights = boxes[:, :, 1].max(axis=1) - boxes[:, :, 1].min(axis=1)
+    if line_threshold is None:
+        line_threshold = max(float(np.median(heights)) * 0.5, 1.0)
+
+    order = np.argsort(centers_y, kind='stable')
+    gaps = np.diff(centers_y[order])
+    line_ids = np.empty(len(order), dtype=np.int64)
+    line_ids[order] = np.concatenate([[0], np.cumsum(gaps > line_threshold)])
+
+    order = np.lexsort((left_x, line_ids))
+    splits = np.flatnonzero(np.diff(line_ids[order])) + 1
+    return boxes, texts, np.split(order, splits)
+
+
+def _column_edges(boxes, lines):
+    """
+    Finds column boundaries from the x-extents of boxes in multi-box lines.
+
+    Single-box lines (titles, notes) are ignored because they usually span
+    several columns. Overlapping extents are merged; each merged interval
+    is one column.
+    """
+    spans = [(boxes[i, :, 0].min(), boxes[i, :, 0].max())
+             for line in lines if len(line) > 1 for i in line]
+    if not spans:
+        return np.zeros(0)
+    spans = np.array(sorted(spans))
+    running_end = np.maximum.accumulate(spans[:, 1])
+    new_column = np.concatenate([[True], spans[1:, 0] > running_end[:-1]])
+    return spans[new_column, 0]
+
+
+def easyocr_to_table(ocr_result, line_threshold=None):
+    """
+    Converts EasyOCR output into table rows.
+
+    Args:
+        ocr_result (list): EasyOCR output [(bbox, text, confidence), ...]
+        line_threshold (float): See layout_lines
+
+    Returns:
+        list: One list of cell strings per line. Lines with a single box
+            have one cell; other lines have one cell per detected column,
+            with empty strings for missing cells.
+    """
+    boxes, texts, lines = layout_lines(ocr_result, line_threshold)
+    column_starts = _column_edges(boxes, lines)
+    rows = []
+    for line in lines:
+        if len(line) == 1 or len(column_starts) == 0:
+            rows.append([' '.join(texts[i] for i in line)])
+            continue
+        centers_x = boxes[line, :, 0].mean(axis=1)
+        columns = np.clip(np.searchsorted(column_starts, centers_x, side='right') - 1, 0, None)
+        cells = [[] for _ in range(len(column_starts))]
+        for i, column in zip(line, columns):
+            cells[column].append(texts[i])
+        rows.append([' '.join(cell) for cell in cells])
+    return rows
+
+
+@traced("ocr.structure")
+def easyocr_to_structured_text(ocr_result, line_threshold=None, space_scale=10, mode="lines"):
     """
     Converts EasyOCR output to structured text with layout preserved.
 
     Args:
         ocr_result (list): EasyOCR output [(bbox, text, confidence), ...]
-        line_threshold (int): Max vertical distance between words on the same line
+        line_threshold (float): Max vertical distance between words on the
+            same line. Defaults to half the median box height.
         space_scale (int): Number of pixels per space character
+        mode (str): "lines" pads words with spaces to keep horizontal
+            layout, "table" emits '|'-separated cells per detected column
 
     Returns:
         str: Visually structured plain text
     """
-    import numpy as np
+    if mode == "table":
+        rows = easyocr_to_table(ocr_result, line_threshold)
+        return '\n'.join(' | '.join(row) for row in rows)
 
-    # Prepare list of entries with avg y and x positions
-    entries = []
-    for bbox, text, _ in ocr_result:
-        x_coords = [p[0] for p in bbox]
-        y_coords = [p[1] for p in bbox]
-        avg_y = sum(y_coords) / len(y_coords)
-        avg_x = min(x_coords)
-        entries.append({'text': text, 'y': avg_y, 'x': avg_x})
+    boxes, texts, lines = layout_lines(ocr_result, line_threshold)
+    left_x = boxes[:, :, 0].min(axis=1)
+    right_x = boxes[:, :, 0].max(axis=1)
 
-    # Sort entries top to bottom
-    entries.sort(key=lambda x: x['y'])
-
-    # Group by lines
-    lines = []
-    current_line = []
-    last_y = None
-
-    for entry in entries:
-        if last_y is None or abs(entry['y'] - last_y) <= line_threshold:
-            current_line.append(entry)
-        else:
-            lines.append(current_line)
-            current_line = [entry]
-        last_y = entry['y']
-    if current_line:
-        lines.append(current_line)
-
-    # Sort each line left to right, and format with indentation
     output_lines = []
     for line in lines:
-        line.sort(key=lambda x: x['x'])
-        line_text = ''
-        last_x = 0
-        for word in line:
-            spaces = int((word['x'] - last_x) / space_scale)
-            line_text += ' ' * max(spaces, 1) + word['text']
-            last_x = word['x'] + len(word['text']) * space_scale // 2  # Estimate next start
-        output_lines.append(line_text.strip())
+        # Gaps between the right edge of a word and the left edge of the next
+        gaps = left_x[line[1:]] - right_x[line[:-1]]
+        spaces = np.maximum((gaps / space_scale).astype(int), 1)
+        parts = [texts[line[0]]]
+        for i, n_spaces in zip(line[1:], spaces):
+            parts.append(' ' * n_spaces)
+            parts.append(texts[i])
+        output_lines.append(''.join(parts).strip())
 
     return '\n'.join(output_lines)
 
 
 
-from PIL import Image, ImageDraw, ImageFont
 
-def plot_easyocr_boxes(image_path, ocr_result):
+def plot_easyocr_boxes(image, ocr_result):
     """
     Plots bounding boxes and recognized Russian text from EasyOCR results on the image.
+
+    Accepts a decoded RGB array or anything load_image accepts.
     """
-    # Load image with OpenCV and convert to RGB
-    image = cv2.imread(image_path)
-    image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+    import cv2
+    import matplotlib.pyplot as plt
+    from PIL import Image, ImageDraw, ImageFont
+
+    image = load_image(image)
+    if image.ndim == 2:
+        image = cv2.cvtColor(image, cv2.COLOR_GRAY2RGB)
 
-    # Convert to PIL for text rendering
-    pil_img = Image.fromarray(image)
+    # Convert to PIL for text rendering; this copies, so the caller's array is untouched
+    pil_img = Image.fromarray(image).copy()
     draw = ImageDraw.Draw(pil_img)
 
     # Try to load a font that supports Cyrillic (adjust path if needed)
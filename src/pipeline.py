@@ -0,0 +1,305 @@
+import argparse
+import functools
+import json
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import instrumentation
+
+STAGES = ("ocr", "extract", "combine", "plot")
+
+OCR_DIR = "ocr/output"
+REPORTS_DIR = "report_generator/reports"
+COMBINED_PATH = "report_generator/combined_report_analysis.txt"
+FIGURES_DIR = "plots/figures"
+
+_DONE = object()
+
+
+class Stage:
+    """
+    A pool of worker threads between two bounded queues.
+
+    Every worker takes an item from the input queue, applies fn and puts
+    the result on the output queue. A full output queue blocks the
+    workers, which in turn fills the input queue and blocks the stage
+    before it, so a slow stage throttles the whole pipeline instead of
+    letting intermediates pile up in memory.
+
+    Args:
+        name (str): Stage name used in logs and stats
+        fn: Callable applied to each item; returning None drops the item
+        workers (int): Items processed concurrently
+        inbox (queue.Queue): Input queue, ends with _DONE
+        outbox (queue.Queue): Output queue, or None for the last stage
+    """
+
+    def __init__(self, name, fn, workers, inbox, outbox=None):
+        self.name = name
+        self.fn = fn
+        self.workers = max(1, workers)
+        self.inbox = inbox
+        self.outbox = outbox
+        self.processed = 0
+        self.failed = 0
+        self.busy = 0.0
+        self._lock = threading.Lock()
+        self._running = self.workers
+        self._threads = []
+
+    def _work(self):
+        while True:
+            item = self.inbox.get()
+            if item is _DONE:
+                # Let the sibling workers see the end marker as well
+                self.inbox.put(_DONE)
+                break
+            start = time.perf_counter()
+            try:
+                with instrumentation.span(f"pipeline.{self.name}"):
+                    result = self.fn(item)
+            except Exception as e:
+                print(f"[{self.name}] {item}: {e}")
+                result = None
+                with self._lock:
+                    self.failed += 1
+            else:
+                with self._lock:
+                    self.processed += 1
+            with self._lock:
+                self.busy += time.perf_counter() - start
+            if result is not None and self.outbox is not None:
+                self.outbox.put(result)
+
+        with self._lock:
+            self._running -= 1
+            last = self._running == 0
+        if last and self.outbox is not None:
+            self.outbox.put(_DONE)
+
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"{self.name}-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def join(self):
+        for thread in self._threads:
+            thread.join()
+
+    def stats(self):
+        return {"processed": self.processed, "failed": self.failed, "busy_s": round(self.busy, 3),
+                "workers": self.workers}
+
+
+def _stem(path):
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def make_ocr_stage(pool, ocr_dir, lang_list, resume):
+    from ocr.main import _process_image, output_paths
+
+    def run(image_path):
+        output_json, output_text = output_paths(image_path, ocr_dir)
+        if not (resume and os.path.exists(output_json) and os.path.exists(output_text)):
+            pool.submit(_process_image, image_path, ocr_dir, lang_list).result()
+        return output_json, output_text
+
+    return run
+
+
+def make_extract_stage(reports_dir, cache, use_rules, resume):
+    from report_generator.blood_analysis_extractor import analyze_blood_report, compact_report, compute_health_score
+    from report_generator.compaction import format_stats
+    from report_generator.rule_extractor import analyze_blood_report_hybrid
+
+    os.makedirs(reports_dir, exist_ok=True)
+
+    def run(ocr_outputs):
+        output_json, output_text = ocr_outputs
+        report_path = os.path.join(reports_dir, f"{_stem(output_text)}.txt")
+        if resume and os.path.exists(report_path):
+            return report_path
+
+        with open(output_text, "r", encoding="utf-8") as f:
+            text = f.read()
+        ocr_json = None
+        if os.path.exists(output_json):
+            with open(output_json, "r", encoding="utf-8") as f:
+                ocr_json = json.load(f)
+        # The OCR confidences let compaction drop unreadable lines as well
+        text, stats = compact_report(text, ocr_json=ocr_json)
+        print(format_stats(_stem(output_text), stats))
+        if use_rules:
+            result = analyze_blood_report_hybrid(text, ocr_json=ocr_json, cache=cache, compact=False)
+        else:
+            result = analyze_blood_report(text, cache=cache, compact=False)
+        result["general_health_score"] = compute_health_score(result.get("parameters", []))
+
+        tmp_path = f"{report_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(json.dumps(result, indent=2, ensure_ascii=False))
+        os.replace(tmp_path, report_path)
+        return report_path
+
+    return run
+
+
+def run_combine(reports_dir, combined_path, cache, map_reduce=None):
+    from report_generator import multi_blood_analysis
+    multi_blood_analysis.main(reports_dir, combined_path, cache=cache, map_reduce=map_reduce)
+
+
+def run_plot(reports_dir, combined_path, figures_dir, executor=None):
+    from plots.extract_series import extract_parameters_over_reports
+    from plots.plot_health_score import extract_health_scores_from_dir, plot_scores_with_trends
+    from plots.plot_seperate_params import plot_parameters_separately
+
+    with open(combined_path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    reports = data.get("reports", [])
+    stats = plot_parameters_separately(extract_parameters_over_reports(data),
+                                       [r.get("report_date") for r in reports],
+                                       [r.get("gender", "Unknown") for r in reports],
+                                       output_dir=figures_dir, executor=executor)
+    print(f"Rendered {stats['rendered']} charts, {stats['skipped']} unchanged, {stats['failed']} failed")
+    plot_scores_with_trends(extract_health_scores_from_dir(reports_dir),
+                            os.path.join(figures_dir, "general_health_scores_all.png"))
+
+
+def _stage_inputs(start_stage, source, ocr_dir):
+    # Starting later reuses the intermediates written by an earlier run
+    if start_stage == "ocr":
+        from ocr.main import collect_images
+        return collect_images(source)
+    names = sorted(n for n in os.listdir(ocr_dir) if n.endswith(".txt"))
+    return [(os.path.join(ocr_dir, f"{_stem(n)}.json"), os.path.join(ocr_dir, n)) for n in names]
+
+
+def run_pipeline(source="images", start_stage="ocr", stop_stage="plot", ocr_workers=None, extract_workers=4,
+                 queue_size=4, lang_list=None, resume=True, cache=None, use_rules=True, map_reduce=None,
+                 ocr_dir=OCR_DIR, reports_dir=REPORTS_DIR, combined_path=COMBINED_PATH, figures_dir=FIGURES_DIR,
+                 preprocess=None):
+    """
+    Runs OCR -> extract -> combine -> plot as one streaming pipeline.
+
+    The per-image stages run concurrently: while image N+1 is in OCR,
+    image N is already being extracted. Each stage writes its outputs to
+    the same places as the standalone scripts, so a run can start or stop
+    at any stage and later stages pick up where an earlier run left off.
+    combine and plot need every report and run once the per-image stages
+    have drained.
+
+    Args:
+        source (str): Image directory or glob, used when starting at "ocr"
+        start_stage (str): First stage to run, one of STAGES
+        stop_stage (str): Last stage to run, one of STAGES
+        ocr_workers (int): OCR processes, defaults to the CPU count
+        extract_workers (int): Reports extracted concurrently
+        queue_size (int): Capacity of the queues between stages
+        lang_list (list): OCR languages, defaults to ['ru']
+        resume (bool): Reuse per-image outputs that already exist
+        cache (LLMCache): Optional LLM response cache
+        use_rules (bool): Try the rule-based extractor before the LLM
+        map_reduce (bool): Passed to multi_blood_analysis.main
+        preprocess (dict): OCR preprocessing options, see ocr.main.run_batch
+
+    Returns:
+        dict: Per-stage counts and timings
+    """
+    first, last = STAGES.index(start_stage), STAGES.index(stop_stage)
+    if first > last:
+        raise ValueError(f"Stage {start_stage!r} comes after {stop_stage!r}")
+    wanted = STAGES[first:last + 1]
+    lang_list = lang_list or ['ru']
+    stats = {}
+    start = time.perf_counter()
+
+    per_image = [name for name in ("ocr", "extract") if name in wanted]
+    pool = None
+    if per_image:
+        inputs = _stage_inputs(start_stage, source, ocr_dir)
+        print(f"Streaming {len(inputs)} items through {' -> '.join(per_image)}")
+        inbox = queue.Queue(maxsize=queue_size)
+        stages = []
+        try:
+            for name in per_image:
+                outbox = queue.Queue(maxsize=queue_size) if name != per_image[-1] else None
+                if name == "ocr":
+                    from ocr.main import _init_worker
+                    workers = ocr_workers or os.cpu_count() or 1
+                    pool = ProcessPoolExecutor(max_workers=workers,
+                                               initializer=functools.partial(_init_worker, lang_list,
+                                                                             preprocess=preprocess))
+                    fn = make_ocr_stage(pool, ocr_dir, lang_list, resume)
+                else:
+                    workers = extract_workers
+                    fn = make_extract_stage(reports_dir, cache, use_rules, resume)
+                stages.append(Stage(name, fn, workers, inbox, outbox))
+                inbox = outbox
+
+            for stage in stages:
+                stage.start()
+            # Blocks whenever the first stage is queue_size items behind
+            for item in inputs:
+                stages[0].inbox.put(item)
+            stages[0].inbox.put(_DONE)
+            for stage in stages:
+                stage.join()
+                stats[stage.name] = stage.stats()
+                instrumentation.sample_memory(f"pipeline.{stage.name}")
+        finally:
+            if pool is not None:
+                pool.shutdown()
+
+    if "combine" in wanted:
+        t = time.perf_counter()
+        run_combine(reports_dir, combined_path, cache, map_reduce)
+        stats["combine"] = {"seconds": round(time.perf_counter() - t, 3)}
+    if "plot" in wanted:
+        t = time.perf_counter()
+        run_plot(reports_dir, combined_path, figures_dir)
+        stats["plot"] = {"seconds": round(time.perf_counter() - t, 3)}
+
+    stats["total_s"] = round(time.perf_counter() - start, 3)
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run OCR, extraction, combined analysis and plotting in one go.")
+    parser.add_argument("source", nargs="?", default="images", help="Image directory or glob pattern")
+    parser.add_argument("--from-stage", choices=STAGES, default="ocr")
+    parser.add_argument("--to-stage", choices=STAGES, default="plot")
+    parser.add_argument("--ocr-workers", type=int, default=None, help="OCR processes (default: CPU count)")
+    parser.add_argument("--extract-workers", type=int, default=4, help="Reports extracted concurrently")
+    parser.add_argument("--queue-size", type=int, default=4, help="Items buffered between stages")
+    parser.add_argument("--no-resume", action="store_true", help="Redo per-image outputs that already exist")
+    parser.add_argument("--llm-only", action="store_true", help="Skip the rule-based extractor")
+    parser.add_argument("--cache-dir", default="report_generator/cache", help="Directory of cached LLM responses")
+    parser.add_argument("--cache-mode", choices=("readwrite", "readonly", "refresh", "off"), default="readwrite")
+    parser.add_argument("--mode", choices=("auto", "single-prompt", "map-reduce"), default="auto",
+                        help="How the combine stage analyzes the reports")
+    parser.add_argument("--preprocess", action="store_true",
+                        help="Downscale, grayscale and deskew images before OCR")
+    parser.add_argument("--trace", help="Write spans, counters and memory samples to this JSON-lines file")
+    parser.add_argument("--metrics", help="Write a Prometheus text dump of the trace here at the end")
+    args = parser.parse_args()
+
+    if args.trace:
+        instrumentation.enable(args.trace, args.metrics)
+
+    cache = None
+    if args.cache_mode != "off":
+        from report_generator.llm_cache import LLMCache
+        cache = LLMCache(args.cache_dir, mode=args.cache_mode)
+    stats = run_pipeline(args.source, args.from_stage, args.to_stage, args.ocr_workers, args.extract_workers,
+                         args.queue_size, resume=not args.no_resume, cache=cache, use_rules=not args.llm_only,
+                         map_reduce={"auto": None, "single-prompt": False, "map-reduce": True}[args.mode],
+                         preprocess={} if args.preprocess else None)
+    print(json.dumps(stats, indent=2))
+    if args.trace:
+        instrumentation.disable()
+        print(instrumentation.format_summary(instrumentation.summarize(args.trace)))
@@ -1,24 +1,89 @@
 import os
 import json
-import matplotlib.pyplot as plt
+
+from instrumentation import span
+
+INDEX_FILE = ".scores_index.json"
+
+
+def _load_index(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return {}
+
+
+def _save_index(path, index):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(index, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def _read_entry(filepath, filename, stat):
+    entry = {"mtime": stat.st_mtime, "size": stat.st_size, "report_date": None, "general_health_score": None}
+    try:
+        with open(filepath, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except json.JSONDecodeError as e:
+        # Remembered as unscorable until the file changes
+        print(f"⚠️ Skipping {filename} (invalid JSON): {e}")
+        return entry
+    if isinstance(data, dict):
+        entry["report_date"] = data.get("report_date")
+        if data.get("general_health_score") is not None:
+            entry["general_health_score"] = data["general_health_score"]
+    return entry
+
+
+def update_scores_index(directory):
+    """
+    Brings the reports index of a directory up to date.
+
+    The index (directory/.scores_index.json) keeps mtime, size, report_date
+    and general_health_score per report file. Only files that are new or
+    whose mtime or size changed are parsed; removed files are dropped.
+
+    Returns:
+        dict: File name -> index entry
+    """
+    index_path = os.path.join(directory, INDEX_FILE)
+    index = _load_index(index_path)
+    updated = {}
+    changed = False
+
+    with os.scandir(directory) as entries:
+        for item in entries:
+            if not item.name.endswith(".txt") or not item.is_file():
+                continue
+            stat = item.stat()
+            entry = index.get(item.name)
+            if entry is None or entry["mtime"] != stat.st_mtime or entry["size"] != stat.st_size:
+                entry = _read_entry(item.path, item.name, stat)
+                changed = True
+            updated[item.name] = entry
+
+    if changed or len(updated) != len(index):
+        _save_index(index_path, updated)
+    return updated
+
 
 def extract_health_scores_from_dir(directory):
-    scores = []
-    
-    for filename in os.listdir(directory):
-        if filename.endswith(".txt"):
-            filepath = os.path.join(directory, filename)
-            try:
-                with open(filepath, "r", encoding="utf-8") as f:
-                    data = json.load(f)
-                if "general_health_score" in data:
-                    scores.append(int(round(data["general_health_score"])))
-            except json.JSONDecodeError as e:
-                print(f"⚠️ Skipping {filename} (invalid JSON): {e}")
-    
-    return scores
+    """
+    Returns the general health scores of all reports in a directory,
+    ordered by report_date. Reports without a date come last, by file name.
+    """
+    index = update_scores_index(directory)
+    scored = [(entry["report_date"] is None, entry["report_date"] or "", filename, entry["general_health_score"])
+              for filename, entry in index.items() if entry["general_health_score"] is not None]
+    scored.sort()
+    return [int(round(score)) for _, _, _, score in scored]
+
 
 def plot_scores_with_trends(scores, save_path="plots/figures/general_health_scores_all.png"):
+    import matplotlib.pyplot as plt
+
     if not scores:
         print("No valid scores found.")
         return
@@ -41,7 +106,8 @@ def plot_scores_with_trends(scores, save_path="plots/figures/general_health_scor
                  fontsize=20, ha="center", va="center", color=color)
 
     os.makedirs(os.path.dirname(save_path), exist_ok=True)
-    plt.savefig(save_path, dpi=300, bbox_inches="tight")
+    with span("plots.savefig", chart="general_health_scores"):
+        plt.savefig(save_path, dpi=300, bbox_inches="tight")
     plt.close()
 
 if __name__ == "__main__":
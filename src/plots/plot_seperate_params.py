@@ -1,10 +1,14 @@
+import hashlib
 import os
-import matplotlib.pyplot as plt
-from extract_series import extract_parameters_over_reports
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from .extract_series import extract_parameters_over_reports
 import json
 import sys
 from datetime import datetime
 
+from instrumentation import span
+from report_generator.units import parse_number
+
 # Reference normal ranges — now sex-specific where relevant
 NORMAL_RANGES = {
     "Hemoglobin": {
@@ -63,11 +67,153 @@ def get_range(param, gender):
     return rng
 
 
-def plot_parameters_separately(param_dict, dates, genders):
-    normal_dir = os.path.join("plots", "figures", "normal")
-    extreme_dir = os.path.join("plots", "figures", "extreme")
+# Bump whenever the look of the charts changes so every figure is re-rendered
+STYLE_VERSION = "1"
+MANIFEST_FILE = ".render_manifest.json"
+
+
+def _build_job(param, values, parsed_dates, genders):
+    """
+    Collects everything a chart depends on into a plain, picklable dict.
+    """
+    # "-" (missing) and results such as "<5" are left out of the chart
+    numeric_values = [parse_number(v) for v in values]
+
+    outliers, normals = [], []
+
+    for dt, v, g in zip(parsed_dates, numeric_values, genders):
+        if v is None or dt is None:
+            continue
+        lower, upper = get_range(param, g)
+        if lower is not None and upper is not None and (v < lower or v > upper):
+            outliers.append((dt.strftime("%Y-%m-%d"), v))
+        else:
+            normals.append((dt.strftime("%Y-%m-%d"), v))
+
+    # Reference range for the **most recent gender** (for visualization only)
+    band = None
+    if genders and genders[-1] is not None:
+        lower, upper = get_range(param, genders[-1])
+        if lower is not None and upper is not None:
+            band = (lower, upper, genders[-1])
+
+    return {
+        "param": param,
+        "normals": normals,
+        "outliers": outliers,
+        "band": band,
+        "style": STYLE_VERSION,
+    }
+
+
+def _job_hash(job):
+    return hashlib.sha256(json.dumps(job, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def render_parameter(job, path):
+    """
+    Renders one parameter chart with the object-oriented Agg API and
+    writes it atomically to path.
+    """
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=(9, 5))
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+
+    if job["band"] is not None:
+        lower, upper, gender = job["band"]
+        ax.axhspan(lower, upper, color='lightgreen', alpha=0.25)
+        ax.text(
+            0.5, (lower + upper) / 2,
+            f"Healthy range ({gender})",
+            color="green", fontsize=10, alpha=0.8,
+            ha="center", va="center",
+            transform=ax.get_yaxis_transform()
+        )
+
+    for points, color, size in ((job["normals"], 'green', 8), (job["outliers"], 'red', 10)):
+        if points:
+            ax.plot(
+                [datetime.strptime(p[0], "%Y-%m-%d") for p in points],
+                [p[1] for p in points],
+                marker='o', color=color, linewidth=2, markersize=size
+            )
+
+    ax.set_xlabel("Report Date")
+    ax.set_ylabel("Value")
+    ax.set_title(f"{job['param']} Trend")
+    ax.grid(True, linestyle=":", alpha=0.7)
+    fig.tight_layout()
+
+    tmp_path = f"{path}.{os.getpid()}.tmp.png"
+    with span("plots.savefig", chart=job["param"]):
+        fig.savefig(tmp_path)
+    os.replace(tmp_path, path)
+    return path
+
+
+def _load_manifest(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return {}
+
+
+def _save_manifest(path, manifest):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def _render_in_pool(pool, pending, manifest, failed):
+    futures = {pool.submit(render_parameter, job, path): (filename, digest, path)
+               for job, path, filename, digest in pending}
+    for future in as_completed(futures):
+        filename, digest, path = futures[future]
+        try:
+            future.result()
+        except Exception as e:
+            failed[filename] = e
+            continue
+        manifest[filename] = {"hash": digest, "path": path}
+
+
+def plot_parameters_separately(param_dict, dates, genders, output_dir=os.path.join("plots", "figures"),
+                               workers=None, force=False, executor=None):
+    """
+    Renders one trend chart per parameter into output_dir/normal or output_dir/extreme.
+
+    A chart is skipped when the hash of its input series, reference range
+    and STYLE_VERSION matches the one recorded in the render manifest and
+    the file is still there. The remaining charts are rendered across a
+    process pool. Callers that render repeatedly can pass their own
+    executor, so the workers (and their matplotlib import) are reused.
+
+    Args:
+        param_dict (dict): Output of extract_parameters_over_reports
+        dates (list): Report dates as YYYY-MM-DD strings
+        genders (list): Gender per report
+        output_dir (str): Root directory for the figures
+        workers (int): Worker processes; 1 renders in this process
+        force (bool): Re-render every chart
+        executor (concurrent.futures.Executor): Pool to render in, left
+            running afterwards. Without one, each call with several charts
+            starts and stops its own pool of size workers.
+
+    Returns:
+        dict: Number of charts rendered, skipped and failed. Failures are
+            printed after the manifest of the rendered charts is saved.
+    """
+    normal_dir = os.path.join(output_dir, "normal")
+    extreme_dir = os.path.join(output_dir, "extreme")
     os.makedirs(normal_dir, exist_ok=True)
     os.makedirs(extreme_dir, exist_ok=True)
+    manifest_path = os.path.join(output_dir, MANIFEST_FILE)
+    manifest = {} if force else _load_manifest(manifest_path)
 
     # Convert dates to datetime objects for plotting
     parsed_dates = []
@@ -77,64 +223,51 @@ def plot_parameters_separately(param_dict, dates, genders):
         except Exception:
             parsed_dates.append(None)
 
+    pending, skipped = [], 0
     for param, values in param_dict.items():
-        if all(v == '-' for v in values):
+        if all(parse_number(v) is None for v in values):
             continue
 
-        numeric_values = [float(v) if v != '-' else None for v in values]
-
-        outliers, normals = [], []
-
-        for dt, v, g in zip(parsed_dates, numeric_values, genders):
-            if v is None or dt is None:
-                continue
-            lower, upper = get_range(param, g)
-            if lower is not None and upper is not None and (v < lower or v > upper):
-                outliers.append((dt, v))
-            else:
-                normals.append((dt, v))
-
-        is_extreme = len(outliers) > 0
+        job = _build_job(param, values, parsed_dates, genders)
+        is_extreme = len(job["outliers"]) > 0
         save_dir = extreme_dir if is_extreme else normal_dir
+        filename = f"{param.replace(' ', '_')}.png"
+        path = os.path.join(save_dir, filename)
+        digest = _job_hash(job)
 
-        plt.figure(figsize=(9, 5))
-
-        # Draw reference range for the **most recent gender** (for visualization only)
-        if genders and genders[-1] is not None:
-            lower, upper = get_range(param, genders[-1])
-            if lower is not None and upper is not None:
-                plt.axhspan(lower, upper, color='lightgreen', alpha=0.25)
-                plt.text(
-                    0.5, (lower + upper) / 2,
-                    f"Healthy range ({genders[-1]})",
-                    color="green", fontsize=10, alpha=0.8,
-                    ha="center", va="center",
-                    transform=plt.gca().get_yaxis_transform()
-                )
-
-        if normals:
-            plt.plot(
-                [p[0] for p in normals],
-                [p[1] for p in normals],
-                marker='o', color='green', linewidth=2, markersize=8
-            )
+        previous = manifest.get(filename)
+        if previous and previous["hash"] == digest and os.path.exists(path):
+            skipped += 1
+            continue
 
-        if outliers:
-            plt.plot(
-                [p[0] for p in outliers],
-                [p[1] for p in outliers],
-                marker='o', color='red', linewidth=2, markersize=10
-            )
+        # The chart may have moved between normal/ and extreme/
+        stale = os.path.join(normal_dir if is_extreme else extreme_dir, filename)
+        if os.path.exists(stale):
+            os.remove(stale)
+        pending.append((job, path, filename, digest))
 
-        plt.xlabel("Report Date")
-        plt.ylabel("Value")
-        plt.title(f"{param} Trend")
-        plt.grid(True, linestyle=":", alpha=0.7)
-        plt.tight_layout()
+    if workers is None:
+        workers = min(len(pending), os.cpu_count() or 1)
+    # A failing chart must not lose the manifest entries of the others
+    failed = {}
+    if executor is not None and pending:
+        _render_in_pool(executor, pending, manifest, failed)
+    elif workers > 1 and len(pending) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            _render_in_pool(pool, pending, manifest, failed)
+    else:
+        for job, path, filename, digest in pending:
+            try:
+                render_parameter(job, path)
+            except Exception as e:
+                failed[filename] = e
+                continue
+            manifest[filename] = {"hash": digest, "path": path}
 
-        filename = f"{param.replace(' ', '_')}.png"
-        plt.savefig(os.path.join(save_dir, filename))
-        plt.close()
+    _save_manifest(manifest_path, manifest)
+    for filename, e in failed.items():
+        print(f"⚠️ Could not render {filename}: {e}")
+    return {"rendered": len(pending) - len(failed), "skipped": skipped, "failed": len(failed)}
 
 
 if __name__ == "__main__":
@@ -152,4 +285,5 @@ if __name__ == "__main__":
     dates = [r.get("report_date") for r in data.get("reports", [])]
     genders = [r.get("gender", "Unknown") for r in data.get("reports", [])]
 
-    plot_parameters_separately(result, dates, genders)
+    stats = plot_parameters_separately(result, dates, genders)
+    print(f"Rendered {stats['rendered']} charts, {stats['skipped']} unchanged, {stats['failed']} failed")
@@ -1,5 +1,6 @@
 import matplotlib.pyplot as plt
-from extract_series import extract_parameters_over_reports
+from .extract_series import extract_parameters_over_reports
+from report_generator.units import parse_number
 import json
 import sys
 
@@ -11,11 +12,11 @@ def plot_all_parameters_single_chart(param_dict):
 
     for param, values in param_dict.items():
         # Skip empty or all-missing values
-        if all(v == '-' for v in values):
+        if all(parse_number(v) is None for v in values):
             continue
 
-        # Convert values to float, replacing '-' with None
-        numeric_values = [float(v) if v != '-' else None for v in values]
+        # Convert values to float, replacing '-' and results such as "<5" with None
+        numeric_values = [parse_number(v) for v in values]
         plt.plot(x, numeric_values, marker='o', label=param)
 
     plt.xlabel("Report Index")
@@ -0,0 +1,275 @@
+import json
+import sys
+from datetime import datetime
+
+import numpy as np
+
+from .extract_series import extract_parameters_over_reports
+from .plot_seperate_params import get_range
+from report_generator.units import parse_number
+
+
+class ParameterSeries:
+    """
+    All parameter series of a patient as one float matrix.
+
+    Attributes:
+        names (list): Parameter names, one per row
+        dates (np.ndarray): Report dates as datetime64[D], NaT if unknown,
+            one per column in chronological order
+        genders (list): Gender per report
+        values (np.ndarray): (parameters x reports) values, NaN where missing
+        mask (np.ndarray): True where a value was reported and its date is known
+        days (np.ndarray): Days since the first report, NaN if the date is unknown
+    """
+
+    def __init__(self, names, dates, genders, values):
+        self.names = names
+        self.dates = dates
+        self.genders = genders
+        self.values = values
+        known_dates = ~np.isnat(dates)
+        self.days = np.full(len(dates), np.nan)
+        if known_dates.any():
+            first = dates[known_dates].min()
+            self.days[known_dates] = (dates[known_dates] - first).astype(np.float64)
+        self.mask = ~np.isnan(values) & known_dates
+
+
+def _parse_date(value):
+    try:
+        return np.datetime64(datetime.strptime(value, "%Y-%m-%d").date(), "D")
+    except (TypeError, ValueError):
+        return np.datetime64("NaT", "D")
+
+
+def _to_float(value):
+    number = parse_number(value)
+    return np.nan if number is None else number
+
+
+def build_series(data):
+    """
+    Builds a ParameterSeries from combined report analysis JSON.
+
+    Reports are ordered by date; reports without a date keep their
+    relative order at the end.
+    """
+    reports = data.get("reports", [])
+    param_dict = extract_parameters_over_reports(data)
+    names = sorted(param_dict)
+    dates = np.array([_parse_date(r.get("report_date")) for r in reports], dtype="datetime64[D]")
+    genders = [r.get("gender", "Unknown") for r in reports]
+    values = np.array([[_to_float(v) for v in param_dict[name]] for name in names],
+                      dtype=np.float64).reshape(len(names), len(reports))
+
+    order = np.argsort(np.where(np.isnat(dates), np.datetime64("9999-12-31"), dates), kind="stable")
+    return ParameterSeries(names, dates[order], [genders[i] for i in order], values[:, order])
+
+
+def rolling_slopes(series, window=3):
+    """
+    Least-squares slope (units per day) over the last `window` reports.
+
+    Computed for every parameter and report at once from cumulative sums
+    of the masked values. Entries with fewer than two measurements in the
+    window, or with all of them on the same day, are NaN.
+    """
+    mask = series.mask
+    x = np.where(mask, series.days, 0.0)
+    y = np.where(mask, series.values, 0.0)
+
+    def windowed(a):
+        c = np.cumsum(a, axis=-1)
+        shifted = np.zeros_like(c)
+        shifted[..., window:] = c[..., :-window]
+        return c - shifted
+
+    n = windowed(mask.astype(np.float64))
+    sx, sy = windowed(x), windowed(y)
+    sxy, sxx = windowed(x * y), windowed(x * x)
+    denominator = n * sxx - sx * sx
+    with np.errstate(divide="ignore", invalid="ignore"):
+        slopes = (n * sxy - sx * sy) / denominator
+    slopes[(n < 2) | (np.abs(denominator) < 1e-12)] = np.nan
+    return slopes
+
+
+def _previous_valid_index(mask):
+    # Index of the last measurement strictly before each report, -1 if none
+    idx = np.where(mask, np.arange(mask.shape[1]), -1)
+    last = np.maximum.accumulate(idx, axis=1)
+    previous = np.full_like(last, -1)
+    previous[:, 1:] = last[:, :-1]
+    return previous
+
+
+def rate_of_change(series):
+    """
+    Change per day between each measurement and the previous one.
+    """
+    mask = series.mask
+    previous = _previous_valid_index(mask)
+    rows = np.arange(mask.shape[0])[:, None]
+    safe_previous = np.maximum(previous, 0)
+    delta_value = series.values - series.values[rows, safe_previous]
+    delta_days = series.days[None, :] - series.days[safe_previous]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rates = delta_value / delta_days
+    rates[~mask | (previous < 0) | (delta_days == 0)] = np.nan
+    return rates
+
+
+def change_points(series, threshold=5.0, min_size=2):
+    """
+    Finds the strongest mean shift in each parameter series.
+
+    Every split position is scored with a two-sample t statistic (the
+    difference between the means before and after, over the pooled
+    within-segment standard deviation). Cumulative sums over the
+    measurements evaluate all parameters and splits at once. Using the
+    within-segment spread keeps steady drifts from looking like jumps.
+
+    Returns:
+        list: Per parameter, None or a dict with the report index where the
+            new level starts, the statistic and the means before/after
+    """
+    mask = series.mask
+    y = np.where(mask, series.values, 0.0)
+    n_left = np.cumsum(mask, axis=1).astype(np.float64)
+    s_left = np.cumsum(y, axis=1)
+    q_left = np.cumsum(y * y, axis=1)
+    if mask.shape[1]:
+        n_total, s_total, q_total = n_left[:, -1:], s_left[:, -1:], q_left[:, -1:]
+    else:
+        n_total = s_total = q_total = np.zeros((mask.shape[0], 1))
+    n_right, s_right, q_right = n_total - n_left, s_total - s_left, q_total - q_left
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean_left, mean_right = s_left / n_left, s_right / n_right
+        within = (q_left - s_left * mean_left) + (q_right - s_right * mean_right)
+        pooled_sd = np.sqrt(np.maximum(within, 0.0) / (n_total - 2))
+        # Guard against perfectly flat segments
+        pooled_sd = np.maximum(pooled_sd, 1e-9 * (np.abs(mean_left) + np.abs(mean_right)) + 1e-12)
+        stat = np.abs(mean_left - mean_right) / (pooled_sd * np.sqrt(1 / n_left + 1 / n_right))
+    # Only split right after a measurement, with enough points on both sides
+    stat[~mask | (n_left < min_size) | (n_right < min_size) | ~np.isfinite(stat)] = 0.0
+
+    results = []
+    best = np.argmax(stat, axis=1) if stat.shape[1] else np.zeros(stat.shape[0], dtype=int)
+    for i, split in enumerate(best):
+        if stat.shape[1] == 0 or stat[i, split] < threshold:
+            results.append(None)
+            continue
+        later = np.flatnonzero(mask[i, split + 1:])
+        start = split + 1 + later[0]
+        results.append({
+            "index": int(start),
+            "statistic": float(stat[i, split]),
+            "before_mean": float(mean_left[i, split]),
+            "after_mean": float(mean_right[i, split]),
+        })
+    return results
+
+
+def range_bounds(series):
+    """
+    Returns (lower, upper) matrices with the sex-specific reference range
+    of every parameter at every report, NaN where no range is known.
+    """
+    lower = np.full(series.values.shape, np.nan)
+    upper = np.full(series.values.shape, np.nan)
+    for j, gender in enumerate(series.genders):
+        for i, name in enumerate(series.names):
+            lo, hi = get_range(name, gender)
+            if lo is not None and hi is not None:
+                lower[i, j], upper[i, j] = lo, hi
+    return lower, upper
+
+
+def out_of_range_runs(series):
+    """
+    Lengths of consecutive out-of-range measurements.
+
+    Missing reports neither extend nor break a run.
+
+    Returns:
+        tuple: (current, longest) arrays with one entry per parameter
+    """
+    lower, upper = range_bounds(series)
+    with np.errstate(invalid="ignore"):
+        out = series.mask & ((series.values < lower) | (series.values > upper))
+
+    current = np.zeros(len(series.names), dtype=np.int64)
+    longest = np.zeros(len(series.names), dtype=np.int64)
+    # One step per report, vectorized over all parameters
+    for j in range(series.values.shape[1]):
+        measured = series.mask[:, j]
+        current = np.where(measured, np.where(out[:, j], current + 1, 0), current)
+        longest = np.maximum(longest, current)
+    return current, longest
+
+
+def summarize_trends(data, window=3, change_threshold=5.0):
+    """
+    Computes a compact per-parameter trend summary.
+
+    Returns:
+        dict: Parameter name -> {"n_measurements", "last_value", "last_date",
+            "slope_per_day", "rate_per_day", "change_point",
+            "out_of_range_run", "longest_out_of_range_run"}
+    """
+    series = build_series(data)
+    slopes = rolling_slopes(series, window)
+    rates = rate_of_change(series)
+    changes = change_points(series, change_threshold)
+    current_runs, longest_runs = out_of_range_runs(series)
+
+    summary = {}
+    for i, name in enumerate(series.names):
+        measured = np.flatnonzero(series.mask[i])
+        if len(measured) == 0:
+            continue
+        last = measured[-1]
+        change = changes[i]
+        if change is not None:
+            change = dict(change, date=str(series.dates[change.pop("index")]))
+        summary[name] = {
+            "n_measurements": int(len(measured)),
+            "last_value": float(series.values[i, last]),
+            "last_date": str(series.dates[last]),
+            "slope_per_day": None if np.isnan(slopes[i, last]) else float(slopes[i, last]),
+            "rate_per_day": None if np.isnan(rates[i, last]) else float(rates[i, last]),
+            "change_point": change,
+            "out_of_range_run": int(current_runs[i]),
+            "longest_out_of_range_run": int(longest_runs[i]),
+        }
+    return summary
+
+
+def format_trend_summary(summary):
+    """
+    Renders a trend summary as short text lines for an LLM prompt.
+    """
+    lines = []
+    for name, s in summary.items():
+        parts = [f"{name}: last {s['last_value']:g} on {s['last_date']} (n={s['n_measurements']})"]
+        if s["slope_per_day"] is not None:
+            parts.append(f"trend {s['slope_per_day'] * 30:+.3g}/month")
+        if s["change_point"] is not None:
+            cp = s["change_point"]
+            parts.append(f"shift {cp['before_mean']:.3g}->{cp['after_mean']:.3g} from {cp['date']}")
+        if s["out_of_range_run"]:
+            parts.append(f"out of range in last {s['out_of_range_run']} results")
+        lines.append(", ".join(parts))
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    file_path = "report_generator/combined_report_analysis.txt"
+    if len(sys.argv) > 1:
+        file_path = sys.argv[1]
+
+    with open(file_path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    print(format_trend_summary(summarize_trends(data)))
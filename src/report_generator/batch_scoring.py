@@ -0,0 +1,142 @@
+from itertools import compress, repeat
+from operator import itemgetter
+
+import numpy as np
+
+from .blood_analysis_extractor import NORMAL_RANGES
+from .units import default_table, parse_number
+
+
+class CompiledRanges:
+    """
+    NORMAL_RANGES compiled into aligned arrays.
+
+    Attributes:
+        names (list): Parameter names, one per column
+        index (dict): Parameter name -> column
+        means (np.ndarray): Reference means per column
+        sds (np.ndarray): Reference standard deviations per column
+    """
+
+    def __init__(self, normal_ranges=NORMAL_RANGES):
+        self.names = list(normal_ranges)
+        self.index = {name: i for i, name in enumerate(self.names)}
+        self.means = np.array([normal_ranges[n]["mean"] for n in self.names], dtype=np.float64)
+        self.sds = np.array([normal_ranges[n]["sd"] for n in self.names], dtype=np.float64)
+
+
+_DEFAULT_RANGES = None
+
+
+def default_ranges():
+    global _DEFAULT_RANGES
+    if _DEFAULT_RANGES is None:
+        _DEFAULT_RANGES = CompiledRanges()
+    return _DEFAULT_RANGES
+
+
+class PackedReports:
+    """
+    Parameters of many reports packed for vectorized scoring.
+
+    Every known parameter occurrence is kept in flat (row, col, value)
+    arrays, so reports that list a parameter twice score exactly like
+    compute_health_score does. values/mask give the (reports x parameters)
+    matrix view, where a repeated parameter keeps its last value.
+    """
+
+    def __init__(self, rows, cols, values, n_reports, ranges):
+        self.rows = rows
+        self.cols = cols
+        self.flat_values = values
+        self.n_reports = n_reports
+        self.ranges = ranges
+        self.values = np.full((n_reports, len(ranges.names)), np.nan)
+        self.values[rows, cols] = values
+        self.mask = np.zeros((n_reports, len(ranges.names)), dtype=bool)
+        self.mask[rows, cols] = True
+
+
+def _as_float(value):
+    # Plain numbers skip parse_number; values that are not numbers become NaN
+    if type(value) is float or type(value) is int:
+        return value
+    number = parse_number(value)
+    return np.nan if number is None else number
+
+
+def _normalize_batch(cols, units, values, ranges):
+    # Same conversions as normalize_value, applied to all occurrences at once
+    values, _ = default_table().convert_batch(ranges.names, cols, units, values)
+    return values
+
+
+def pack_reports(reports, ranges=None):
+    """
+    Packs a list of parameter lists into a PackedReports.
+
+    Args:
+        reports (list): One list of {"name", "value", "unit"} dicts per report
+        ranges (CompiledRanges): Defaults to the compiled NORMAL_RANGES
+
+    Returns:
+        PackedReports
+    """
+    ranges = ranges or default_ranges()
+    params = [p for parameters in reports for p in parameters]
+    n = len(params)
+    rows = np.repeat(np.arange(len(reports), dtype=np.intp), [len(parameters) for parameters in reports])
+    cols = np.fromiter(map(ranges.index.get, map(itemgetter("name"), params), repeat(-1)), dtype=np.intp, count=n)
+
+    values = np.fromiter(map(_as_float, map(itemgetter("value"), params)), dtype=np.float64, count=n)
+
+    # Unknown parameters and values that are not numbers are not scored
+    known = (cols >= 0) & ~np.isnan(values)
+    if not known.all():
+        params = list(compress(params, known))
+        rows, cols, values = rows[known], cols[known], values[known]
+    units = list(map(itemgetter("unit"), params))
+    values = _normalize_batch(cols, units, values, ranges)
+    return PackedReports(rows, cols, values, len(reports), ranges)
+
+
+def batch_z_scores(packed):
+    """
+    Returns the (reports x parameters) matrix of absolute z-scores.
+
+    Missing parameters and parameters with a zero reference sd are NaN.
+    """
+    ranges = packed.ranges
+    with np.errstate(divide="ignore", invalid="ignore"):
+        z = np.abs((packed.values - ranges.means) / ranges.sds)
+    z[~packed.mask | (ranges.sds == 0)] = np.nan
+    return z
+
+
+def batch_health_scores(reports, ranges=None):
+    """
+    Scores many reports at once; results match compute_health_score exactly.
+
+    Args:
+        reports (list): One list of parameter dicts per report, or a
+            PackedReports from pack_reports
+
+    Returns:
+        list: Health score per report, None where nothing could be scored
+    """
+    packed = reports if isinstance(reports, PackedReports) else pack_reports(reports, ranges)
+    ranges = packed.ranges
+
+    scored = ranges.sds[packed.cols] != 0
+    rows = packed.rows[scored]
+    cols = packed.cols[scored]
+    z = np.abs((packed.flat_values[scored] - ranges.means[cols]) / ranges.sds[cols])
+
+    # bincount adds in input order, i.e. the same order as the scalar loop
+    sums = np.bincount(rows, weights=z, minlength=packed.n_reports)
+    counts = np.bincount(rows, minlength=packed.n_reports)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        scores = np.maximum(0, 100 - (sums / counts) * 10)
+
+    # Python's round() so that ties round exactly like the scalar function
+    return [round(float(s), 1) if c else None for s, c in zip(scores, counts)]
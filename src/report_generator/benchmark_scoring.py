@@ -0,0 +1,54 @@
+import argparse
+import random
+import time
+
+from .batch_scoring import batch_health_scores, pack_reports
+from .blood_analysis_extractor import NORMAL_RANGES, compute_health_score
+
+
+def synthetic_reports(n_reports, seed=0):
+    """
+    Generates random reports with a realistic mix of present parameters.
+    """
+    rng = random.Random(seed)
+    names = list(NORMAL_RANGES)
+    reports = []
+    for _ in range(n_reports):
+        parameters = []
+        for name in rng.sample(names, rng.randint(8, len(names))):
+            info = NORMAL_RANGES[name]
+            value = round(rng.gauss(info["mean"], info["sd"] * 1.5 or 0.5), 2)
+            parameters.append({"name": name, "value": value, "unit": info["unit"]})
+        reports.append(parameters)
+    return reports
+
+
+def run_benchmark(n_reports=20000, seed=0):
+    reports = synthetic_reports(n_reports, seed)
+
+    start = time.perf_counter()
+    scalar = [compute_health_score(parameters) for parameters in reports]
+    scalar_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    packed = pack_reports(reports)
+    pack_time = time.perf_counter() - start
+    start = time.perf_counter()
+    batch = batch_health_scores(packed)
+    score_time = time.perf_counter() - start
+
+    mismatches = sum(1 for a, b in zip(scalar, batch) if a != b)
+    print(f"{n_reports} reports")
+    print(f"scalar loop:  {scalar_time:.3f}s")
+    print(f"batch:        {pack_time + score_time:.3f}s (pack {pack_time:.3f}s, score {score_time:.3f}s), "
+          f"{scalar_time / (pack_time + score_time):.1f}x faster")
+    print(f"mismatches:   {mismatches}")
+    return {"scalar_s": scalar_time, "pack_s": pack_time, "score_s": score_time, "mismatches": mismatches}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare batch health scoring with compute_health_score.")
+    parser.add_argument("--reports", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    run_benchmark(args.reports, args.seed)
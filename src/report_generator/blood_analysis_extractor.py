@@ -1,12 +1,16 @@
+import asyncio
 import os
-import openai
-from dotenv import load_dotenv
 import json
 import math
+import time
 
-# Load API key
-load_dotenv()
-openai.api_key = os.getenv("OPENAI_API_KEY")
+from instrumentation import count, span, traced
+from .llm_cache import CACHE_MODES, DEFAULT_CACHE_DIR, LLMCache
+from .llm_client import AsyncLLMClient, estimate_tokens, load_openai, prompt_token_budget
+from .stream_parser import IncrementalParametersParser, StreamAborted
+
+# Bump whenever build_prompt changes so cached answers are not reused
+PROMPT_VERSION = "2"
 
 # Reference norms: replace with actual clinical values
 NORMAL_RANGES = {
@@ -51,15 +55,39 @@ def read_text_input(path_or_text):
     return path_or_text  # Assume direct text
 
 def normalize_value(name, value, unit):
-    if name == "Hemoglobin" and unit.lower() == "g/l":
-        return value / 10.0, "g/dL"
-    return value, unit
+    """
+    Converts a value to the NORMAL_RANGES unit of its parameter.
+
+    Unknown units are returned unchanged; see units.UnitTable.
+    """
+    # Imported here because units builds on NORMAL_RANGES from this module
+    from .units import default_table
+    return default_table().convert(name, value, unit)
+
+
+def _normalize_parameters(parameters):
+    from .units import normalize_parameters
+    return normalize_parameters(parameters)
+
 
+def _normalize_parameter(parameter):
+    if not isinstance(parameter, dict):
+        return parameter
+    return _normalize_parameters([parameter])[0]
+
+@traced("scoring.health_score")
 def compute_health_score(parameters):
+    # Imported here because units builds on NORMAL_RANGES from this module
+    from .units import parse_number
+
     scores = []
     for p in parameters:
         name = p["name"]
-        val, unit = normalize_value(name, p["value"], p["unit"])
+        # Results such as "<5" have no z-score
+        value = parse_number(p.get("value"))
+        if value is None:
+            continue
+        val, unit = normalize_value(name, value, p.get("unit"))
         info = NORMAL_RANGES.get(name)
         if info:
             sd = info["sd"]
@@ -74,26 +102,21 @@ def compute_health_score(parameters):
     return round(health_score, 1)
 
 
-def analyze_blood_report(text):
-    # Build mapping of expected units from NORMAL_RANGES
-    expected_units = {name: info["unit"] for name, info in NORMAL_RANGES.items()}
-
-    unit_instructions = "\n".join([
-        f"- {name}: always report in {unit}"
-        for name, unit in expected_units.items()
-    ])
-    print(unit_instructions)
+@traced("llm.build_prompt")
+def build_prompt(text):
+    # Units are converted in code (normalize_parameters), so the model only
+    # needs the names and copies values and units as printed
+    names = ", ".join(NORMAL_RANGES)
     prompt = f"""
         You are a medical assistant AI.
         The user has provided a blood test report that may be written in Russian.
 
-        Your job is to extract and normalize the data.
+        Your job is to extract the data.
 
         Tasks:
         1. Extract all blood analysis parameters into JSON with English field names.
-        2. For each parameter, convert and output the value in the expected unit system.
-        Use ONLY these units (convert if necessary):
-        {unit_instructions}
+        Use these names where they apply: {names}
+        2. Copy each value and its unit exactly as printed in the report. Do not convert units.
         3. Extract the date of the report (if present).
         4. Extract the gender of the patient (if present).
         5. Summarize the likely medical situation (e.g., anemia, infection, normal).
@@ -113,33 +136,237 @@ def analyze_blood_report(text):
         Here is the report:
         {text}
     """
+    return prompt
 
-    res = openai.ChatCompletion.create(
-        model="gpt-4",
-        messages=[{"role": "user", "content": prompt}],
-        temperature=0.3,
-    )
 
-    content = res['choices'][0]['message']['content']
+def compact_report(text, model="gpt-4", ocr_json=None, completion_tokens=1500):
+    """
+    Compacts OCR text for build_prompt within the model's prompt budget.
 
+    See compaction.compact_text; the budget is what prompt_token_budget
+    leaves after the prompt's own instructions.
+
+    Returns:
+        tuple: (compacted text, stats)
+    """
+    # Imported here because compaction builds on rule_extractor, which imports this module
+    from .compaction import compact_text
+    budget = prompt_token_budget(model, completion_tokens) - estimate_tokens(build_prompt(""))
+    return compact_text(text, ocr_json, max_tokens=budget)
+
+
+@traced("llm.parse")
+def parse_response(content):
     try:
-        return json.loads(content)
+        result = json.loads(content)
     except json.JSONDecodeError as e:
         raise ValueError(f"Model did not return valid JSON. Error: {e}\nResponse:\n{content}")
+    if isinstance(result, dict) and isinstance(result.get("parameters"), list):
+        result["parameters"] = _normalize_parameters(result["parameters"])
+    return result
+
+
+def analyze_blood_report(text, model="gpt-4", temperature=0.3, cache=None, compact=True):
+    if compact:
+        text, _ = compact_report(text, model)
+    if cache is not None:
+        cached = cache.get(text, model, temperature, PROMPT_VERSION)
+        if cached is not None:
+            return cached
+
+    prompt = build_prompt(text)
+    count("llm_prompt_tokens", estimate_tokens(prompt))
+
+    with span("llm.request", model=model):
+        res = load_openai().ChatCompletion.create(
+            model=model,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=temperature,
+        )
+
+    content = res['choices'][0]['message']['content']
+    result = parse_response(content)
+    if cache is not None:
+        cache.put(text, model, temperature, PROMPT_VERSION, result)
+    return result
+
+
+def stream_blood_report(text, model="gpt-4", temperature=0.3, max_invalid=5, compact=True):
+    """
+    Streams the analysis of one report, yielding parameters as they complete.
+
+    Each parameter is validated against NORMAL_RANGES as soon as its JSON
+    object is closed, and the request is abandoned as soon as the output
+    is clearly broken (not JSON, a malformed entry, or mostly unknown
+    names), instead of after the whole completion has been paid for.
 
+    Yields:
+        dict: {"type": "parameter", "parameter": {...}, "issues": [...],
+            "elapsed": seconds} for each parameter, then one
+            {"type": "done", "result": {...}, "time_to_first_parameter": s,
+            "total_time": s}
 
-def main(input_path_or_text, output_path="output.txt"):
+    Raises:
+        StreamAborted: With the parameters received so far in .partial
+    """
+    if compact:
+        text, _ = compact_report(text, model)
+    expected_units = {name: info["unit"] for name, info in NORMAL_RANGES.items()}
+    parser = IncrementalParametersParser(expected_units, max_invalid=max_invalid, normalize=_normalize_parameter)
+    start = time.perf_counter()
+    first_parameter = None
+
+    response = load_openai().ChatCompletion.create(
+        model=model,
+        messages=[{"role": "user", "content": build_prompt(text)}],
+        temperature=temperature,
+        stream=True,
+    )
+    try:
+        for chunk in response:
+            delta = chunk['choices'][0].get('delta', {}).get('content')
+            if not delta:
+                continue
+            for parameter, issues in parser.feed(delta):
+                elapsed = time.perf_counter() - start
+                if first_parameter is None:
+                    first_parameter = elapsed
+                yield {"type": "parameter", "parameter": parameter, "issues": issues, "elapsed": elapsed}
+    finally:
+        # Stop receiving tokens if we aborted or the caller stopped early
+        close = getattr(response, "close", None)
+        if close is not None:
+            close()
+
+    result = parser.result()
+    if isinstance(result, dict) and isinstance(result.get("parameters"), list):
+        result["parameters"] = _normalize_parameters(result["parameters"])
+    yield {
+        "type": "done",
+        "result": result,
+        "time_to_first_parameter": first_parameter,
+        "total_time": time.perf_counter() - start,
+    }
+
+
+async def analyze_blood_reports_async(texts, client=None, model="gpt-4", temperature=0.3, cache=None,
+                                      compact=True):
+    """
+    Analyzes many reports concurrently.
+
+    Args:
+        texts (list): OCR texts of the reports
+        client (AsyncLLMClient): Client with the concurrency, token budget,
+            retry settings and backend to use. Defaults to 8 concurrent
+            OpenAI requests.
+        model (str): Model name
+        temperature (float): Sampling temperature
+        cache (LLMCache): Optional response cache; only misses are sent
+        compact (bool): Compact each text with compact_report first
+
+    Returns:
+        list: Parsed results in input order; a failed report holds the
+            exception instead of a dict
+    """
+    if compact:
+        texts = [compact_report(text, model)[0] for text in texts]
+    results = [None] * len(texts)
+    pending = []
+    for i, text in enumerate(texts):
+        cached = cache.get(text, model, temperature, PROMPT_VERSION) if cache is not None else None
+        if cached is not None:
+            results[i] = cached
+        else:
+            pending.append(i)
+
+    client = client or AsyncLLMClient()
+    message_lists = [[{"role": "user", "content": build_prompt(texts[i])}] for i in pending]
+    contents = await client.complete_many(message_lists, model, temperature)
+
+    for i, content in zip(pending, contents):
+        if isinstance(content, Exception):
+            results[i] = content
+            continue
+        try:
+            results[i] = parse_response(content)
+        except ValueError as e:
+            results[i] = e
+            continue
+        if cache is not None:
+            cache.put(texts[i], model, temperature, PROMPT_VERSION, results[i])
+    return results
+
+
+def analyze_blood_reports(texts, client=None, model="gpt-4", temperature=0.3, cache=None, compact=True):
+    """
+    Synchronous wrapper around analyze_blood_reports_async.
+    """
+    return asyncio.run(analyze_blood_reports_async(texts, client, model, temperature, cache, compact))
+
+
+def _read_compacted(input_path_or_text, compact):
     text = read_text_input(input_path_or_text)
-    result = analyze_blood_report(text)
+    if not compact:
+        return text
+    # Imported here because compaction builds on rule_extractor, which imports this module
+    from .compaction import format_stats, sibling_ocr_json
+    text, stats = compact_report(text, ocr_json=sibling_ocr_json(input_path_or_text))
+    print(format_stats("Compacted report", stats))
+    return text
+
+
+def main(input_path_or_text, output_path="output.txt", cache=None, use_rules=True, compact=True):
+    text = _read_compacted(input_path_or_text, compact)
+    if use_rules:
+        # Imported here because rule_extractor builds on this module
+        from .rule_extractor import analyze_blood_report_hybrid
+        result = analyze_blood_report_hybrid(text, cache=cache, compact=False)
+    else:
+        result = analyze_blood_report(text, cache=cache, compact=False)
     health_score = compute_health_score(result.get("parameters", []))
     result["general_health_score"] = health_score
     print(result)
+    if cache is not None:
+        print(f"LLM cache hit rate: {cache.hit_rate():.0%}")
+    with open(output_path, "w", encoding="utf-8") as f:
+        f.write(json.dumps(result, indent=2, ensure_ascii=False))
+
+def main_stream(input_path_or_text, output_path="output.txt", compact=True):
+    text = _read_compacted(input_path_or_text, compact)
+    try:
+        for event in stream_blood_report(text, compact=False):
+            if event["type"] == "parameter":
+                p = event["parameter"]
+                warning = f"  ⚠️ {'; '.join(event['issues'])}" if event["issues"] else ""
+                print(f"[{event['elapsed']:.1f}s] {p.get('name')}: {p.get('value')} {p.get('unit')}{warning}")
+            else:
+                result = event["result"]
+                print(f"Time to first parameter: {event['time_to_first_parameter']}s, "
+                      f"total: {event['total_time']:.1f}s")
+    except StreamAborted as e:
+        print(f"Aborted after {len(e.partial)} parameters: {e}")
+        raise
+    result["general_health_score"] = compute_health_score(result.get("parameters", []))
     with open(output_path, "w", encoding="utf-8") as f:
         f.write(json.dumps(result, indent=2, ensure_ascii=False))
 
 if __name__ == "__main__":
-    import sys
-    if len(sys.argv) < 2:
-        print("Usage: python blood_analysis_extractor.py <path_to_txt_or_text>")
+    import argparse
+    parser = argparse.ArgumentParser(description="Extract blood test parameters from an OCR text with an LLM.")
+    parser.add_argument("input", help="Path to an OCR .txt file or the report text itself")
+    parser.add_argument("--output", default="report_generator/reports/report_analysis2.txt")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR, help="Directory of cached LLM responses")
+    parser.add_argument("--cache-mode", choices=CACHE_MODES + ("off",), default="readwrite",
+                        help="readwrite, readonly, refresh (ignore cached answers) or off")
+    parser.add_argument("--stream", action="store_true",
+                        help="Stream the LLM response and print parameters as they arrive")
+    parser.add_argument("--llm-only", action="store_true",
+                        help="Always use the LLM instead of trying the local rule-based extractor first")
+    parser.add_argument("--no-compact", action="store_true",
+                        help="Send the OCR text as is instead of compacting it first")
+    args = parser.parse_args()
+    cache = None if args.cache_mode == "off" else LLMCache(args.cache_dir, mode=args.cache_mode)
+    if args.stream:
+        main_stream(args.input, args.output, compact=not args.no_compact)
     else:
-        main(sys.argv[1], "report_generator/reports/report_analysis2.txt")
+        main(args.input, args.output, cache, use_rules=not args.llm_only, compact=not args.no_compact)
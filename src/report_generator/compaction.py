@@ -0,0 +1,210 @@
+import json
+import os
+import re
+
+from instrumentation import count, traced
+
+from .llm_client import estimate_tokens
+from .rule_extractor import ALIAS_PATTERN, DATE_PATTERN, GENDER_LABEL_PATTERN, _fold, _looks_like_parameter_row
+
+COLUMN_SEPARATOR = " | "
+
+# Lab sheet lines that carry nothing the extraction needs: contacts,
+# licences, signatures, disclaimers and page numbers
+BOILERPLATE_PATTERNS = [re.compile(p) for p in (
+    r"лиценз",
+    r"(?<![а-яa-z])тел(?:ефон)?[.:\s]",
+    r"www\.|https?:|e-?mail|@",
+    r"(?<![а-яa-z])адрес",
+    r"(?<![а-яa-z])(?:инн|огрн|кпп)(?![а-яa-z])",
+    r"страниц[аы]?\s*\d|(?<![а-яa-z])стр\.\s*\d|page\s*\d",
+    r"подпис",
+    r"печат",
+    r"не являю?тся\s+диагноз|консультаци",
+    r"врач\s+клинической\s+лабораторной|выполнил[аи]?(?![а-яa-z])",
+)]
+_PADDING = re.compile(r"[ \t]{2,}|\t")
+_WORD = re.compile(r"[0-9a-zа-я]", re.IGNORECASE)
+
+
+def collapse_padding(line):
+    """
+    Replaces runs of layout spaces with one column separator.
+
+    easyocr_to_structured_text pads words with a space per space_scale
+    pixels of gap; single spaces (inside a cell) are kept.
+    """
+    return _PADDING.sub(COLUMN_SEPARATOR, line.strip())
+
+
+def _is_boilerplate(line):
+    # Cyrillic patterns match the folded line, where Latin lookalikes from
+    # OCR are already Cyrillic; Latin ones (www, e-mail) the lower-cased one
+    lower, folded = line.lower(), _fold(line)
+    return not _WORD.search(line) or any(p.search(lower) or p.search(folded) for p in BOILERPLATE_PATTERNS)
+
+
+def _line_key(line):
+    # Separators and spacing differ between pages; the words do not
+    return " ".join(_fold(line).replace("|", " ").split())
+
+
+def classify_line(line):
+    """
+    Returns "parameter", "header" (date, sex) or "other" for a report line.
+    """
+    folded = _fold(line)
+    if ALIAS_PATTERN.search(folded) or _looks_like_parameter_row(folded):
+        return "parameter"
+    if DATE_PATTERN.search(folded) or GENDER_LABEL_PATTERN.search(folded) or GENDER_LABEL_PATTERN.search(line.lower()):
+        return "header"
+    return "other"
+
+
+def json_to_lines(ocr_json, column_gap=1.5):
+    """
+    Groups easyocr_to_json boxes into lines with their mean confidence.
+
+    Lines come from ocr.utils.layout_lines, like rule_extractor.boxes_to_lines;
+    a horizontal gap wider than column_gap median box heights starts a
+    new column.
+
+    Returns:
+        list: (text, confidence) pairs, top to bottom
+    """
+    if not ocr_json:
+        return []
+    # Imported here so that compacting plain text does not load numpy
+    import numpy as np
+    from ocr.utils import layout_lines
+
+    ocr_result = [(item["bbox"], item["text"], item.get("confidence", 1.0)) for item in ocr_json]
+    boxes, texts, lines = layout_lines(ocr_result)
+    left, right = boxes[:, :, 0].min(axis=1), boxes[:, :, 0].max(axis=1)
+    height = max(float(np.median(boxes[:, :, 1].max(axis=1) - boxes[:, :, 1].min(axis=1))), 1.0)
+
+    output = []
+    for line in lines:
+        parts, edge = [texts[line[0]]], right[line[0]]
+        for i in line[1:]:
+            parts.append(COLUMN_SEPARATOR if left[i] - edge > column_gap * height else " ")
+            parts.append(texts[i])
+            edge = max(edge, right[i])
+        confidence = sum(ocr_result[i][2] for i in line) / len(line)
+        output.append(("".join(parts).strip(), confidence))
+    return output
+
+
+def _trim_to_budget(kept, max_tokens):
+    # kept: [line, kind]; other lines go first, from the bottom up, then
+    # headers, then parameter rows
+    tokens = [estimate_tokens(line) for line, _ in kept]
+    total = sum(tokens) + len(kept)
+    dropped = 0
+    for kind in ("other", "header", "parameter"):
+        for i in range(len(kept) - 1, -1, -1):
+            if total <= max_tokens:
+                return dropped
+            if kept[i] is not None and kept[i][1] == kind:
+                total -= tokens[i] + 1
+                kept[i] = None
+                dropped += 1
+    return dropped
+
+
+@traced("llm.compact")
+def compact_text(text=None, ocr_json=None, max_tokens=None, min_confidence=0.4, drop_boilerplate=True,
+                 dedupe=True):
+    """
+    Shrinks an OCR report before it is put into an LLM prompt.
+
+    Layout padding becomes column separators, lines without clinical
+    content (contacts, licences, signatures, low-confidence specks) are
+    dropped, and lines repeated on later pages (lab header, table header,
+    patient and date lines) are kept once. Parameter rows, the sampling
+    date and the patient's sex are never dropped, except to meet max_tokens.
+
+    Args:
+        text (str): Structured OCR text
+        ocr_json (list): easyocr_to_json boxes of the same report. When
+            given, lines are rebuilt from the boxes and their confidence
+            is used; text is only used for tokens_before.
+        max_tokens (int): Budget for the compacted text (estimate_tokens);
+            None for no limit
+        min_confidence (float): Lines below this mean OCR confidence are
+            dropped unless they hold clinical content
+        drop_boilerplate (bool): Drop lines matching BOILERPLATE_PATTERNS
+            and lines without letters or digits
+        dedupe (bool): Keep only the first copy of repeated non-parameter lines
+
+    Returns:
+        tuple: (compacted text, stats) where stats holds tokens_before,
+            tokens_after, tokens_saved, lines_before, lines_after and the
+            number of lines dropped per reason
+    """
+    if ocr_json is not None:
+        lines = json_to_lines(ocr_json)
+        if text is None:
+            text = "\n".join(line for line, _ in lines)
+    else:
+        lines = [(collapse_padding(line), None) for line in text.splitlines()]
+
+    dropped = {"low_confidence": 0, "boilerplate": 0, "duplicate": 0, "budget": 0}
+    kept, seen = [], set()
+    for line, confidence in lines:
+        if not line:
+            continue
+        kind = classify_line(line)
+        if kind == "other":
+            if confidence is not None and confidence < min_confidence:
+                dropped["low_confidence"] += 1
+                continue
+            if drop_boilerplate and _is_boilerplate(line):
+                dropped["boilerplate"] += 1
+                continue
+        if dedupe and kind != "parameter":
+            key = _line_key(line)
+            if key in seen:
+                dropped["duplicate"] += 1
+                continue
+            seen.add(key)
+        kept.append([line, kind])
+
+    if max_tokens is not None:
+        dropped["budget"] = _trim_to_budget(kept, max_tokens)
+
+    compacted = "\n".join(item[0] for item in kept if item is not None)
+    before, after = estimate_tokens(text), estimate_tokens(compacted)
+    count("llm_tokens_saved", before - after)
+    stats = {
+        "tokens_before": before,
+        "tokens_after": after,
+        "tokens_saved": before - after,
+        "lines_before": sum(1 for line in text.splitlines() if line.strip()),
+        "lines_after": len(compacted.splitlines()),
+        "dropped": dropped,
+    }
+    return compacted, stats
+
+
+def sibling_ocr_json(path):
+    """
+    Loads the easyocr_to_json output saved next to an OCR .txt file.
+
+    ocr/main.py writes <image name>.json and <image name>.txt side by
+    side in batch mode. Returns None if path is not a file or has no such sibling.
+    """
+    if not isinstance(path, str) or not path.endswith(".txt") or not os.path.isfile(path):
+        return None
+    json_path = path[:-len(".txt")] + ".json"
+    if not os.path.exists(json_path):
+        return None
+    with open(json_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def format_stats(name, stats):
+    dropped = ", ".join(f"{n} {reason}" for reason, n in stats["dropped"].items() if n)
+    return (f"{name}: {stats['tokens_before']} -> {stats['tokens_after']} tokens "
+            f"({stats['tokens_saved']} saved, {stats['lines_before']} -> {stats['lines_after']} lines"
+            + (f"; dropped {dropped}" if dropped else "") + ")")
@@ -0,0 +1,137 @@
+import hashlib
+import json
+import os
+import re
+import threading
+
+from instrumentation import count
+
+DEFAULT_CACHE_DIR = "report_generator/cache"
+CACHE_MODES = ("readwrite", "readonly", "refresh")
+
+
+def normalize_text(text):
+    """
+    Collapses all whitespace runs so that re-OCR'd text with different
+    padding maps to the same cache key.
+    """
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def make_key(text, model, temperature, prompt_version):
+    payload = json.dumps({
+        "text": normalize_text(text),
+        "model": model,
+        "temperature": temperature,
+        "prompt_version": prompt_version,
+    }, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    """
+    On-disk cache of parsed LLM responses.
+
+    Entries are keyed by the normalized input text, model name,
+    temperature and prompt template version, and stored as one JSON file
+    each. The least recently used entries are removed once there are more
+    than max_entries; eviction trims down to evict_to of max_entries so
+    that it runs once per batch of new entries rather than on every put.
+
+    Args:
+        cache_dir (str): Directory holding the entries
+        max_entries (int): Max number of stored responses
+        mode (str): "readwrite" to read and store, "readonly" to never
+            write, "refresh" to skip lookups and overwrite with fresh results
+        evict_to (float): Share of max_entries kept after an eviction
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_entries=1000, mode="readwrite", evict_to=0.9):
+        if mode not in CACHE_MODES:
+            raise ValueError(f"Unknown cache mode {mode!r}, expected one of {CACHE_MODES}")
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.evict_to = evict_to
+        self.mode = mode
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        # Entries on disk as far as this process knows; other writers make
+        # it an underestimate, which only delays eviction until the next scan
+        self._entries = len(self._scan())
+
+    def _scan(self):
+        return [e for e in os.scandir(self.cache_dir) if e.name.endswith(".json")]
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, text, model, temperature, prompt_version):
+        """
+        Returns the cached parsed response, or None on a miss.
+        """
+        if self.mode == "refresh":
+            self.misses += 1
+            count("llm_cache_lookups", result="miss")
+            return None
+        path = self._path(make_key(text, model, temperature, prompt_version))
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            self.misses += 1
+            count("llm_cache_lookups", result="miss")
+            return None
+        if self.mode != "readonly":
+            # Touch the entry so eviction sees it as recently used
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+        self.hits += 1
+        count("llm_cache_lookups", result="hit")
+        return data
+
+    def put(self, text, model, temperature, prompt_version, data):
+        """
+        Stores a parsed response. Does nothing in readonly mode.
+        """
+        if self.mode == "readonly":
+            return
+        path = self._path(make_key(text, model, temperature, prompt_version))
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        is_new = not os.path.exists(path)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._entries += is_new
+            if self._entries > self.max_entries:
+                self._evict()
+
+    def _evict(self):
+        # Other processes may delete entries while we scan; skip those
+        entries = []
+        for entry in self._scan():
+            try:
+                entries.append((entry.stat().st_mtime, entry.path))
+            except FileNotFoundError:
+                continue
+        keep = int(self.max_entries * self.evict_to)
+        entries.sort()
+        removed = 0
+        for _, path in entries[:max(0, len(entries) - keep)]:
+            try:
+                os.remove(path)
+                removed += 1
+            except OSError:
+                pass
+        self._entries = len(entries) - removed
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hit_rate()}
@@ -0,0 +1,304 @@
+import asyncio
+import json
+import os
+import random
+import time
+import urllib.error
+import urllib.request
+
+from instrumentation import count, span
+
+
+class LLMError(Exception):
+    """
+    Error returned by an LLM backend.
+
+    Args:
+        message (str): Error description
+        status (int): HTTP status code if known
+        retryable (bool): Whether the request may succeed if repeated
+    """
+
+    def __init__(self, message, status=None, retryable=False):
+        super().__init__(message)
+        self.status = status
+        self.retryable = retryable
+
+
+def is_retryable_status(status):
+    return status == 429 or (status is not None and status >= 500)
+
+
+def estimate_tokens(text):
+    """
+    Rough token count for a prompt without loading a tokenizer.
+
+    GPT tokenizers average about 4 characters per token on English text
+    but split Cyrillic much finer, so Cyrillic characters are counted at
+    roughly 2 per token.
+    """
+    cyrillic = sum(1 for ch in text if 'Ѐ' <= ch <= 'ӿ')
+    return int((len(text) - cyrillic) / 4 + cyrillic / 2) + 1
+
+
+# Context window sizes in tokens for the models we use
+MODEL_CONTEXT_WINDOWS = {
+    "gpt-4": 8192,
+    "gpt-4-32k": 32768,
+    "gpt-4-turbo": 128000,
+    "gpt-4o": 128000,
+    "gpt-4o-mini": 128000,
+    "gpt-3.5-turbo": 16385,
+}
+
+
+def prompt_token_budget(model, completion_tokens=1500, safety_margin=0.1):
+    """
+    Returns how many prompt tokens fit in the model's context window.
+
+    Leaves room for the completion and a safety margin for the error of
+    estimate_tokens. Unknown models are treated like gpt-4.
+    """
+    window = MODEL_CONTEXT_WINDOWS.get(model, MODEL_CONTEXT_WINDOWS["gpt-4"])
+    return int((window - completion_tokens) * (1 - safety_margin))
+
+
+def pack_by_token_budget(texts, budget):
+    """
+    Splits texts into consecutive chunks whose estimated size fits the budget.
+
+    A single text larger than the budget gets a chunk of its own.
+
+    Returns:
+        list: Lists of texts, in input order
+    """
+    chunks, current, used = [], [], 0
+    for text in texts:
+        tokens = estimate_tokens(text)
+        if current and used + tokens > budget:
+            chunks.append(current)
+            current, used = [], 0
+        current.append(text)
+        used += tokens
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+_OPENAI = None
+
+
+def load_openai():
+    """
+    Imports and configures the openai module on first use.
+
+    The API key is read from the environment or a .env file. openai and
+    dotenv take a noticeable part of a second to import, so scripts that
+    never call the API do not pay for them.
+    """
+    global _OPENAI
+    if _OPENAI is None:
+        import openai
+        from dotenv import load_dotenv
+
+        load_dotenv()
+        openai.api_key = os.getenv("OPENAI_API_KEY")
+        _OPENAI = openai
+    return _OPENAI
+
+
+class OpenAIBackend:
+    """
+    Backend that calls the OpenAI ChatCompletion API (openai==0.28).
+    """
+
+    async def complete(self, messages, model, temperature):
+        openai = load_openai()
+
+        try:
+            res = await openai.ChatCompletion.acreate(
+                model=model,
+                messages=messages,
+                temperature=temperature,
+            )
+        except (openai.error.RateLimitError, openai.error.ServiceUnavailableError,
+                openai.error.Timeout, openai.error.APIConnectionError, openai.error.TryAgain) as e:
+            raise LLMError(str(e), getattr(e, 'http_status', None), retryable=True) from e
+        except openai.error.OpenAIError as e:
+            status = getattr(e, 'http_status', None)
+            raise LLMError(str(e), status, retryable=is_retryable_status(status)) from e
+        return res['choices'][0]['message']['content']
+
+
+class HTTPBackend:
+    """
+    Backend for any OpenAI-compatible /chat/completions endpoint.
+
+    Uses only the standard library, so it can be pointed at the local stub
+    server in stub_llm_server.py to measure throughput without network.
+
+    Args:
+        base_url (str): Server root, e.g. "http://127.0.0.1:8011/v1"
+        api_key (str): Optional bearer token
+        timeout (float): Per-request timeout in seconds
+    """
+
+    def __init__(self, base_url, api_key=None, timeout=120.0):
+        self.url = base_url.rstrip('/') + '/chat/completions'
+        self.api_key = api_key
+        self.timeout = timeout
+
+    def _post(self, payload):
+        headers = {'Content-Type': 'application/json'}
+        if self.api_key:
+            headers['Authorization'] = f'Bearer {self.api_key}'
+        request = urllib.request.Request(self.url, data=json.dumps(payload).encode('utf-8'),
+                                         headers=headers, method='POST')
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return json.loads(response.read().decode('utf-8'))
+        except urllib.error.HTTPError as e:
+            raise LLMError(f"HTTP {e.code}: {e.reason}", e.code, is_retryable_status(e.code)) from e
+        except (urllib.error.URLError, TimeoutError, ConnectionError) as e:
+            raise LLMError(str(e), retryable=True) from e
+
+    async def complete(self, messages, model, temperature):
+        payload = {'model': model, 'messages': messages, 'temperature': temperature}
+        res = await asyncio.to_thread(self._post, payload)
+        return res['choices'][0]['message']['content']
+
+
+class TokenBucket:
+    """
+    Token-per-minute budget shared by all concurrent requests.
+
+    The bucket refills continuously; a request waits until enough tokens
+    are available. Requests larger than the whole budget are let through
+    once the bucket is full, so they cannot block forever.
+    """
+
+    def __init__(self, tokens_per_minute):
+        self.capacity = float(tokens_per_minute)
+        self.tokens = self.capacity
+        self.rate = self.capacity / 60.0
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, tokens):
+        tokens = min(float(tokens), self.capacity)
+        async with self._lock:
+            self._refill()
+            while self.tokens < tokens:
+                await asyncio.sleep((tokens - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= tokens
+
+
+class AsyncLLMClient:
+    """
+    Runs many chat completions concurrently within rate limits.
+
+    Args:
+        backend: Object with an async complete(messages, model, temperature)
+            method; defaults to OpenAIBackend
+        concurrency (int): Max requests in flight
+        tokens_per_minute (int): Prompt+completion token budget, None for no limit
+        max_retries (int): Retries for rate-limit, 5xx and connection errors
+        base_delay (float): First backoff delay in seconds, doubled per retry
+        max_delay (float): Cap for a single backoff delay
+        completion_tokens (int): Expected completion size, charged against
+            the token budget up front
+    """
+
+    def __init__(self, backend=None, concurrency=8, tokens_per_minute=None, max_retries=5,
+                 base_delay=1.0, max_delay=30.0, completion_tokens=800):
+        self.backend = backend or OpenAIBackend()
+        self.concurrency = concurrency
+        self.tokens_per_minute = tokens_per_minute
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.completion_tokens = completion_tokens
+        self.latencies = []
+        self.retries = 0
+        self.failures = 0
+        # Created lazily so that they bind to the running event loop
+        self._loop = None
+        self._semaphore = None
+        self._bucket = None
+
+    def _limits(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # A new asyncio.run() needs fresh primitives
+            self._loop = loop
+            self._bucket = None
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+            if self.tokens_per_minute:
+                self._bucket = TokenBucket(self.tokens_per_minute)
+        return self._semaphore, self._bucket
+
+    async def complete(self, messages, model="gpt-4", temperature=0.3):
+        """
+        Sends one chat completion, retrying with exponential backoff.
+
+        Returns:
+            str: Message content of the first choice
+        """
+        semaphore, bucket = self._limits()
+        prompt_tokens = sum(estimate_tokens(m['content']) for m in messages)
+        count("llm_prompt_tokens", prompt_tokens)
+        async with semaphore:
+            for attempt in range(self.max_retries + 1):
+                if bucket is not None:
+                    await bucket.acquire(prompt_tokens + self.completion_tokens)
+                start = time.perf_counter()
+                try:
+                    with span("llm.request", model=model, attempt=attempt):
+                        content = await self.backend.complete(messages, model, temperature)
+                except LLMError as e:
+                    if not e.retryable or attempt == self.max_retries:
+                        self.failures += 1
+                        raise
+                    self.retries += 1
+                    delay = min(self.max_delay, self.base_delay * 2 ** attempt)
+                    # Full jitter keeps retries from many requests from lining up
+                    await asyncio.sleep(random.uniform(0, delay))
+                    continue
+                self.latencies.append(time.perf_counter() - start)
+                return content
+
+    async def complete_many(self, message_lists, model="gpt-4", temperature=0.3):
+        """
+        Runs one completion per message list concurrently.
+
+        Returns:
+            list: Contents in input order; failed requests hold the exception
+        """
+        tasks = [self.complete(messages, model, temperature) for messages in message_lists]
+        return await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self):
+        """
+        Returns request counts and latency percentiles in seconds.
+        """
+        latencies = sorted(self.latencies)
+
+        def percentile(q):
+            if not latencies:
+                return None
+            return latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+
+        return {
+            'requests': len(latencies),
+            'failures': self.failures,
+            'retries': self.retries,
+            'mean_latency': sum(latencies) / len(latencies) if latencies else None,
+            'p50_latency': percentile(0.50),
+            'p95_latency': percentile(0.95),
+        }
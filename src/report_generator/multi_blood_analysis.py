@@ -1,10 +1,42 @@
+import asyncio
+import json
 import os
-import openai
-from dotenv import load_dotenv
 
-# Load API key
-load_dotenv()
-openai.api_key = os.getenv("OPENAI_API_KEY")
+from .blood_analysis_extractor import (NORMAL_RANGES, analyze_blood_reports_async, compute_health_score,
+                                      normalize_value)
+from .compaction import compact_text, format_stats, sibling_ocr_json
+from .llm_cache import CACHE_MODES, DEFAULT_CACHE_DIR, LLMCache
+from .llm_client import AsyncLLMClient, estimate_tokens, load_openai, pack_by_token_budget, prompt_token_budget
+from .rule_extractor import MIN_CONFIDENCE, MIN_COVERAGE, MIN_PARAMETERS, extract_parameters
+
+# Bump whenever the prompt below changes so cached answers are not reused
+PROMPT_VERSION = "1"
+REDUCE_PROMPT_VERSION = "mr1"
+
+# Tokens of the single-prompt instructions around the reports
+SINGLE_PROMPT_OVERHEAD_TOKENS = 600
+# Reduce passes before partial advice is returned as it is
+MAX_REDUCE_ROUNDS = 4
+# Calls per reduce chunk before a malformed answer is given up on
+REDUCE_ATTEMPTS = 2
+
+REDUCE_PROMPT = """
+    You are a medical assistant AI. Below are compact digests of a patient's blood test reports,
+    in date order. Each digest lists the health score (0-100, computed from z-scores against
+    reference values) and the parameters that are notably outside the reference range.
+
+    Give ONE unified recommendation for follow-up or next steps, considering all the reports
+    collectively and the trends between them.
+
+    Respond ONLY in this JSON format:
+    {{
+      "overall_follow_up_advice": "Combined advice based on all reports"
+    }}
+
+    Here are the report digests:
+
+    {digests}
+"""
 
 
 def read_all_txt_files(directory):
@@ -17,9 +49,36 @@ def read_all_txt_files(directory):
     return reports
 
 
-def analyze_multiple_blood_reports(report_dict):
+def compact_reports(report_dict, directory=None):
+    """
+    Compacts every raw OCR report with compaction.compact_text.
+
+    Stored single-report results are left as they are. When directory is
+    given, the OCR .json saved next to each .txt supplies confidences.
+
+    Returns:
+        tuple: (compacted report_dict, {name: stats})
+    """
+    compacted, stats = {}, {}
+    for name, content in report_dict.items():
+        if _parse_single_result(content) is not None:
+            compacted[name] = content
+            continue
+        ocr_json = sibling_ocr_json(os.path.join(directory, name)) if directory else None
+        compacted[name], stats[name] = compact_text(content, ocr_json)
+    return compacted, stats
+
+
+def analyze_multiple_blood_reports(report_dict, model="gpt-4", temperature=0.3, cache=None, compact=True):
+    if compact:
+        report_dict, _ = compact_reports(report_dict)
     report_blocks = "\n\n".join([f"Report: {name}\n{content}" for name, content in report_dict.items()])
 
+    if cache is not None:
+        cached = cache.get(report_blocks, model, temperature, PROMPT_VERSION)
+        if cached is not None:
+            return json.dumps(cached, indent=2, ensure_ascii=False)
+
     prompt = f"""
     You are a medical assistant AI. A user has provided multiple blood test reports. Each report is from a different day. 
 
@@ -58,21 +117,246 @@ def analyze_multiple_blood_reports(report_dict):
     {report_blocks}
     """
 
-    response = openai.ChatCompletion.create(
-        model="gpt-4",   # or "gpt-3.5-turbo"
+    response = load_openai().ChatCompletion.create(
+        model=model,   # or "gpt-3.5-turbo"
         messages=[{"role": "user", "content": prompt}],
-        temperature=0.3,
+        temperature=temperature,
     )
-    return response["choices"][0]["message"]["content"]
+    content = response["choices"][0]["message"]["content"]
+
+    if cache is not None:
+        # Only well-formed answers are worth keeping
+        try:
+            cache.put(report_blocks, model, temperature, PROMPT_VERSION, json.loads(content))
+        except json.JSONDecodeError:
+            pass
+    return content
+
+
+def _parse_single_result(content):
+    """
+    Returns an existing single-report result (blood_analysis_extractor
+    output) stored in content, or None if content is raw report text.
+    """
+    try:
+        data = json.loads(content)
+    except json.JSONDecodeError:
+        return None
+    if isinstance(data, dict) and "parameters" in data:
+        return data
+    return None
+
 
+def report_digest(report):
+    """
+    Builds a compact one-paragraph digest of an analyzed report.
+
+    Only parameters more than two standard deviations from the reference
+    mean are listed, so the digest stays small however long the report is.
+    """
+    abnormal = []
+    for p in report.get("parameters", []):
+        info = NORMAL_RANGES.get(p.get("name"))
+        if not info or not info["sd"]:
+            continue
+        try:
+            value, _ = normalize_value(p["name"], float(p["value"]), p.get("unit", ""))
+        except (TypeError, ValueError):
+            continue
+        z = (value - info["mean"]) / info["sd"]
+        if abs(z) > 2:
+            abnormal.append(f"{p['name']} {p['value']} {p.get('unit', '')} (z={z:+.1f})")
+    return (f"{report.get('report_date') or 'unknown date'} | {report.get('gender', 'Unknown')} | "
+            f"score {report.get('general_health_score')} | "
+            f"abnormal: {'; '.join(abnormal) if abnormal else 'none'} | "
+            f"{report.get('summary', '')}")
+
+
+async def _map_reports(report_dict, client, model, temperature, cache, compact):
+    reports, pending = {}, []
+    for name, content in report_dict.items():
+        result = _parse_single_result(content)
+        if result is None:
+            rules_result, coverage, confidence = extract_parameters(content)
+            if (len(rules_result["parameters"]) >= MIN_PARAMETERS and coverage >= MIN_COVERAGE
+                    and confidence >= MIN_CONFIDENCE):
+                result = rules_result
+        if result is None:
+            pending.append(name)
+        else:
+            reports[name] = result
+
+    extracted = await analyze_blood_reports_async([report_dict[name] for name in pending],
+                                                  client, model, temperature, cache, compact)
+    for name, result in zip(pending, extracted):
+        if isinstance(result, Exception):
+            print(f"⚠️ Skipping {name}: {result}")
+            continue
+        reports[name] = result
+    return reports
 
-def main(directory="report_generator/reports", output_path="report_generator/combined_report_analysis.txt"):
+
+def _parse_advice(content):
+    try:
+        return json.loads(content)["overall_follow_up_advice"]
+    except (json.JSONDecodeError, KeyError, TypeError):
+        return None
+
+
+def _date_range(first, last):
+    first, last = first or "unknown date", last or "unknown date"
+    return first if first == last else f"{first} to {last}"
+
+
+async def _reduce_digests(digests, dates, client, model, temperature, cache, budget):
+    """
+    Reduces report digests to one piece of follow-up advice.
+
+    dates holds the (first, last) report date covered by each digest. A
+    chunk whose request fails or whose answer is malformed is retried up
+    to REDUCE_ATTEMPTS times; after that its digests are carried into the
+    next pass unreduced. If a pass does not shrink the number of chunks,
+    or after MAX_REDUCE_ROUNDS passes, what is left (partial advice
+    labelled with the dates it covers, and any unreduced digests) is
+    returned joined.
+
+    Returns:
+        tuple: (advice, complete) where complete is False if the advice
+            is such a partial result
+    """
+    overhead = estimate_tokens(REDUCE_PROMPT)
+    previous = None
+    for _ in range(MAX_REDUCE_ROUNDS):
+        chunks = pack_by_token_budget(digests, budget - overhead)
+        prompts = [REDUCE_PROMPT.format(digests="\n".join(chunk)) for chunk in chunks]
+
+        answers, pending = [None] * len(prompts), []
+        for i, prompt in enumerate(prompts):
+            cached = cache.get(prompt, model, temperature, REDUCE_PROMPT_VERSION) if cache is not None else None
+            if cached is not None:
+                answers[i] = cached.get("overall_follow_up_advice")
+            if answers[i] is None:
+                pending.append(i)
+        for _ in range(REDUCE_ATTEMPTS):
+            if not pending:
+                break
+            contents = await client.complete_many(
+                [[{"role": "user", "content": prompts[i]}] for i in pending], model, temperature)
+            failed = []
+            for i, content in zip(pending, contents):
+                # A failed request is retried like a malformed answer
+                answers[i] = None if isinstance(content, Exception) else _parse_advice(content)
+                if answers[i] is None:
+                    failed.append(i)
+                elif cache is not None:
+                    cache.put(prompts[i], model, temperature, REDUCE_PROMPT_VERSION,
+                              {"overall_follow_up_advice": answers[i]})
+            pending = failed
+
+        # Chunks are consecutive, so each covers a contiguous date range
+        carried, start = [], 0
+        for chunk, answer in zip(chunks, answers):
+            chunk_dates = dates[start:start + len(chunk)]
+            start += len(chunk)
+            span = (chunk_dates[0][0], chunk_dates[-1][1])
+            if answer is not None:
+                carried.append((f"Advice for reports {_date_range(*span)}: {answer}", span, answer))
+            else:
+                print(f"⚠️ No usable advice for reports {_date_range(*span)}, keeping their digests")
+                carried.extend((digest, digest_dates, None) for digest, digest_dates in zip(chunk, chunk_dates))
+        if len(carried) == 1 and carried[0][2] is not None:
+            return carried[0][2], True
+        digests = [text for text, _, _ in carried]
+        dates = [span for _, span, _ in carried]
+        if previous is not None and len(chunks) >= previous:
+            break
+        previous = len(chunks)
+    # Partial advice and digests that cannot be merged further
+    return "\n\n".join(digests), False
+
+
+def analyze_multiple_blood_reports_mapreduce(report_dict, model="gpt-4", temperature=0.3, cache=None,
+                                             client=None, completion_tokens=1500, compact=True):
+    """
+    Analyzes many reports without ever putting all of them in one prompt.
+
+    Map: every report is extracted on its own, concurrently. Files that
+    already hold a single-report result are reused as is, and well-formed
+    reports go through the local rule-based extractor first. Health scores
+    are computed locally with compute_health_score. Reports sent to the
+    model are compacted to the prompt budget first unless compact is False.
+
+    Reduce: a compact digest per report is sent to the model for
+    overall_follow_up_advice. Digests are packed into as few calls as the
+    model's context window allows (see prompt_token_budget); if more than
+    one call is needed, their answers are reduced again. Failed reduce
+    calls do not lose the map results: see _reduce_digests.
+
+    Returns:
+        dict: Same shape as the analyze_multiple_blood_reports JSON, with
+            reports in date order, plus advice_complete, which is False when
+            overall_follow_up_advice holds partial advice and unreduced digests
+    """
+    client = client or AsyncLLMClient()
+    budget = prompt_token_budget(model, completion_tokens)
+
+    async def run():
+        reports = await _map_reports(report_dict, client, model, temperature, cache, compact)
+        ordered = []
+        for name, report in reports.items():
+            report = dict(report, file=name)
+            report["general_health_score"] = compute_health_score(report.get("parameters", []))
+            ordered.append(report)
+        ordered.sort(key=lambda r: (r.get("report_date") is None, r.get("report_date") or "", r["file"]))
+
+        digests = [report_digest(r) for r in ordered]
+        dates = [(r.get("report_date"), r.get("report_date")) for r in ordered]
+        advice, complete = ((await _reduce_digests(digests, dates, client, model, temperature, cache, budget))
+                            if digests else (None, True))
+        return ordered, advice, complete
+
+    ordered, advice, complete = asyncio.run(run())
+    keys = ("file", "report_date", "gender", "parameters", "summary", "general_health_score")
+    return {
+        "reports": [{k: r.get(k) for k in keys} for r in ordered],
+        "overall_follow_up_advice": advice,
+        "advice_complete": complete,
+    }
+
+
+def needs_map_reduce(report_dict, model="gpt-4", completion_tokens=1500):
+    """
+    Tells whether the single-prompt analysis would overflow the context window.
+    """
+    total = sum(estimate_tokens(content) for content in report_dict.values())
+    return total + SINGLE_PROMPT_OVERHEAD_TOKENS > prompt_token_budget(model, completion_tokens)
+
+
+def main(directory="report_generator/reports", output_path="report_generator/combined_report_analysis.txt",
+         cache=None, map_reduce=None, compact=True):
     reports = read_all_txt_files(directory)
     if not reports:
         print(f"No .txt files found in {directory}")
         return
+    if compact:
+        reports, stats = compact_reports(reports, directory)
+        for name, report_stats in stats.items():
+            print(format_stats(name, report_stats))
+        print(f"Tokens saved by compaction: {sum(s['tokens_saved'] for s in stats.values())}")
 
-    result = analyze_multiple_blood_reports(reports)
+    # By default switch to map-reduce only when one prompt would not fit
+    if map_reduce is None:
+        map_reduce = needs_map_reduce(reports)
+    if map_reduce:
+        # The reports were compacted above when compact is set
+        analysis = analyze_multiple_blood_reports_mapreduce(reports, cache=cache, compact=False)
+        if not analysis["advice_complete"]:
+            print("⚠️ Follow-up advice is partial: some reduce calls failed")
+        result = json.dumps(analysis, indent=2, ensure_ascii=False)
+    else:
+        result = analyze_multiple_blood_reports(reports, cache=cache, compact=False)
+    if cache is not None:
+        print(f"LLM cache hit rate: {cache.hit_rate():.0%}")
 
     with open(output_path, "w", encoding="utf-8") as f:
         f.write(result)
@@ -81,8 +365,18 @@ def main(directory="report_generator/reports", output_path="report_generator/com
 
 
 if __name__ == "__main__":
-    import sys
-    if len(sys.argv) < 2:
-        main()
-    else:
-        main(sys.argv[1])
+    import argparse
+    parser = argparse.ArgumentParser(description="Analyze all LLM report outputs in a directory together.")
+    parser.add_argument("directory", nargs="?", default="report_generator/reports")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR, help="Directory of cached LLM responses")
+    parser.add_argument("--cache-mode", choices=CACHE_MODES + ("off",), default="readwrite",
+                        help="readwrite, readonly, refresh (ignore cached answers) or off")
+    parser.add_argument("--mode", choices=("auto", "single-prompt", "map-reduce"), default="auto",
+                        help="auto uses map-reduce only when the reports do not fit in one prompt")
+    parser.add_argument("--no-compact", action="store_true",
+                        help="Send the OCR texts as they are instead of compacting them first")
+    args = parser.parse_args()
+    cache = None if args.cache_mode == "off" else LLMCache(args.cache_dir, mode=args.cache_mode)
+    map_reduce = {"auto": None, "single-prompt": False, "map-reduce": True}[args.mode]
+    main(args.directory, cache=cache, map_reduce=map_reduce, compact=not args.no_compact)
+
@@ -0,0 +1,338 @@
+import re
+
+from .blood_analysis_extractor import NORMAL_RANGES, analyze_blood_report, normalize_value
+from .units import UNIT_SPELLINGS
+from instrumentation import traced
+
+# Names and abbreviations that appear on lab sheets, per NORMAL_RANGES key.
+# Matching is case-insensitive and tolerant to Latin/Cyrillic look-alikes.
+PARAMETER_ALIASES = {
+    "Hemoglobin": ["гемоглобин", "hemoglobin", "hgb", "hb"],
+    "White Blood Cells": ["лейкоциты", "white blood cells", "wbc"],
+    "Red Blood Cells": ["эритроциты", "red blood cells", "rbc"],
+    "Platelets": ["тромбоциты", "platelets", "plt"],
+    "Hematocrit": ["гематокрит", "hematocrit", "hct"],
+    "Mean Corpuscular Volume": ["средний объем эритроцита", "средний объем эритроцитов",
+                                "mean corpuscular volume", "mcv"],
+    "Mean Corpuscular Hemoglobin": ["среднее содержание гемоглобина в эритроците",
+                                    "среднее содержание гемоглобина", "mean corpuscular hemoglobin", "mch"],
+    "Mean Corpuscular Hemoglobin Concentration": ["средняя концентрация гемоглобина в эритроците",
+                                                  "средняя концентрация гемоглобина",
+                                                  "mean corpuscular hemoglobin concentration", "mchc"],
+    "Red Cell Distribution Width": ["ширина распределения эритроцитов", "rdw-cv", "rdw"],
+    "Blasts": ["бласты", "blasts"],
+    "Promyelocytes": ["промиелоциты", "promyelocytes"],
+    "Myelocytes": ["миелоциты", "myelocytes"],
+    "Metamyelocytes": ["метамиелоциты", "metamyelocytes"],
+    "Band Neutrophils": ["палочкоядерные нейтрофилы", "палочкоядерные", "band neutrophils"],
+    "Segmented Neutrophils": ["сегментоядерные нейтрофилы", "сегментоядерные", "segmented neutrophils"],
+    "Lymphocytes": ["лимфоциты", "lymphocytes", "lym%", "lymph%"],
+    "Monocytes": ["моноциты", "monocytes", "mon%", "mono%"],
+    "Eosinophils": ["эозинофилы", "eosinophils", "eos%"],
+    "Basophils": ["базофилы", "basophils", "bas%", "baso%"],
+    "Plasma Cells": ["плазматические клетки", "плазмоциты", "plasma cells"],
+    "Absolute Neutrophils": ["нейтрофилы абс", "абсолютное количество нейтрофилов", "нейтрофилы",
+                             "neu#", "neut#"],
+    "Absolute Lymphocytes": ["лимфоциты абс", "абсолютное количество лимфоцитов", "lym#", "lymph#"],
+    "Absolute Monocytes": ["моноциты абс", "абсолютное количество моноцитов", "mon#", "mono#"],
+    "Absolute Eosinophils": ["эозинофилы абс", "абсолютное количество эозинофилов", "eos#"],
+    "Absolute Basophils": ["базофилы абс", "абсолютное количество базофилов", "bas#", "baso#"],
+    "Mean Platelet Volume": ["средний объем тромбоцитов", "mean platelet volume", "mpv"],
+    "ESR": ["скорость оседания эритроцитов", "соэ", "esr"],
+    "LDL": ["холестерин лпнп", "лпнп", "ldl"],
+    "HDL": ["холестерин лпвп", "лпвп", "hdl"],
+    "Glucose": ["глюкоза", "glucose", "glu"],
+    "CRP": ["с-реактивный белок", "срб", "crp"],
+}
+
+# A differential count printed as a cell count belongs to the absolute parameter
+ABSOLUTE_COUNTERPARTS = {
+    "Lymphocytes": "Absolute Lymphocytes",
+    "Monocytes": "Absolute Monocytes",
+    "Eosinophils": "Absolute Eosinophils",
+    "Basophils": "Absolute Basophils",
+    "Segmented Neutrophils": "Absolute Neutrophils",
+}
+PERCENT_COUNTERPARTS = {v: k for k, v in ABSOLUTE_COUNTERPARTS.items()}
+
+# Latin letters that OCR confuses with Cyrillic ones
+_LOOKALIKES = str.maketrans("aceopxykmthb", "асеорхукмтнв")
+
+
+def _fold(text):
+    return text.lower().replace("ё", "е").translate(_LOOKALIKES)
+
+
+def _compile_alias_index():
+    alias_to_name = {}
+    for name, aliases in PARAMETER_ALIASES.items():
+        for alias in aliases:
+            alias_to_name[_fold(alias)] = name
+    # Longest aliases first so that "лимфоциты абс" wins over "лимфоциты"
+    ordered = sorted(alias_to_name, key=len, reverse=True)
+    pattern = re.compile(r"(?<![а-яa-z0-9])(" + "|".join(re.escape(a) for a in ordered) + r")")
+    return pattern, alias_to_name
+
+
+# Spacing and the OCR slips tolerated inside a unit spelling
+_UNIT_TOLERANCES = {
+    "^": r"\s*[\^*]?\s*",
+    "*": r"\s*[\^*]?\s*",
+    "/": r"\s*/\s*",
+    " ": r"\s*",
+    "л": "[лl]",
+    "u": "[uµμ]",
+}
+
+
+def _compile_unit_patterns():
+    # One pattern per units.UNIT_SPELLINGS spelling, so both extractors
+    # know the same units; "10^9/л" and "10*9/л" give the same pattern
+    patterns = {}
+    for unit, spellings in UNIT_SPELLINGS.items():
+        for spelling in spellings:
+            folded = _fold(spelling)
+            pattern = "".join(_UNIT_TOLERANCES.get(c, re.escape(c)) for c in folded)
+            patterns.setdefault(pattern, unit)
+    return [(re.compile(pattern), unit) for pattern, unit in patterns.items()]
+
+
+ALIAS_PATTERN, ALIAS_TO_NAME = _compile_alias_index()
+UNIT_PATTERNS = _compile_unit_patterns()
+NUMBER_PATTERN = re.compile(r"(?<![\d.,^*])[-+]?\d+(?:[.,]\d+)?")
+POWER_PATTERN = re.compile(r"10\s*[\^*]\s*\d+")
+DATE_PATTERN = re.compile(r"(\d{2})[./-](\d{2})[./-](\d{4})|(\d{4})-(\d{2})-(\d{2})")
+BIRTH_DATE_PATTERN = re.compile(r"рожд|birth|(?<![а-яa-z])dob(?![а-яa-z])")
+COLLECTION_DATE_PATTERN = re.compile(r"взят|забор|collect|sampl")
+ISSUE_DATE_PATTERN = re.compile(r"выдач|issue")
+GENDER_LABEL_PATTERN = re.compile(r"(?<![а-яa-z])(пол|sex|gender)(?![а-яa-z])")
+FEMALE_PATTERN = re.compile(r"(?<![а-яa-z])(ж|жен|женский|female|f)(?![а-яa-z])")
+MALE_PATTERN = re.compile(r"(?<![а-яa-z])(м|муж|мужской|male|m)(?![а-яa-z])")
+
+# Below any of these the rules are not trusted and the LLM extracts the report
+MIN_PARAMETERS = 3
+MIN_COVERAGE = 0.8
+MIN_CONFIDENCE = 0.9
+# Taken off the confidence when the report date cannot be told apart from
+# other dates on the sheet, so the hybrid extractor asks the LLM
+AMBIGUOUS_DATE_PENALTY = 0.5
+
+
+def boxes_to_lines(ocr_json):
+    """
+    Groups easyocr_to_json boxes into text lines, top to bottom.
+
+    Lines come from ocr.utils.layout_lines, so skewed scans are grouped
+    the same way as the structured OCR text.
+    """
+    if not ocr_json:
+        return []
+    # Imported here so that extracting from text does not load numpy
+    from ocr.utils import layout_lines
+
+    ocr_result = [(item["bbox"], item["text"], item.get("confidence", 1.0)) for item in ocr_json]
+    _, texts, lines = layout_lines(ocr_result)
+    return [" ".join(texts[i] for i in line) for line in lines]
+
+
+def _parse_number(token):
+    return float(token.replace(",", "."))
+
+
+def _find_unit(text):
+    # The first unit in the text; of spellings starting there, the longest
+    best = None
+    for pattern, unit in UNIT_PATTERNS:
+        match = pattern.search(text)
+        if match and (best is None or (match.start(), -match.end()) < best[0]):
+            best = ((match.start(), -match.end()), unit)
+    return best[1] if best else None
+
+
+def _plausible(name, value):
+    info = NORMAL_RANGES[name]
+    if info["sd"] == 0:
+        return 0 <= value <= 5
+    return abs(value - info["mean"]) <= 10 * info["sd"]
+
+
+def parse_line(line):
+    """
+    Extracts one parameter from a report line.
+
+    Returns:
+        dict: {"name", "value", "unit", "confidence"} or None if the line
+            does not hold a known parameter with a numeric value
+    """
+    folded = _fold(line)
+    match = ALIAS_PATTERN.search(folded)
+    if not match:
+        return None
+    name = ALIAS_TO_NAME[match.group(1)]
+    rest = folded[match.end():]
+
+    # Powers of ten belong to the unit, not the value
+    number = NUMBER_PATTERN.search(POWER_PATTERN.sub(" ", rest))
+    if not number:
+        return None
+    value = _parse_number(number.group(0))
+    unit = _find_unit(rest[number.start():]) or _find_unit(rest)
+
+    if unit == "%" and name in PERCENT_COUNTERPARTS:
+        name = PERCENT_COUNTERPARTS[name]
+    elif unit == "10^9/L" and name in ABSOLUTE_COUNTERPARTS:
+        name = ABSOLUTE_COUNTERPARTS[name]
+
+    expected_unit = NORMAL_RANGES[name]["unit"]
+    confidence = 1.0
+    if unit is None:
+        confidence -= 0.3
+        unit = expected_unit
+    elif unit != expected_unit:
+        converted, converted_unit = normalize_value(name, value, unit)
+        if converted_unit == expected_unit:
+            value, unit = round(converted, 4), converted_unit
+        else:
+            # No conversion between these units
+            confidence -= 0.5
+    if not _plausible(name, value):
+        confidence -= 0.5
+    return {"name": name, "value": value, "unit": unit, "confidence": max(confidence, 0.0)}
+
+
+def _looks_like_parameter_row(folded):
+    return bool(NUMBER_PATTERN.search(POWER_PATTERN.sub(" ", folded))) and \
+        any(pattern.search(folded) for pattern, _ in UNIT_PATTERNS)
+
+
+def _extract_date(lines):
+    """
+    Returns (date, ambiguous) for the report's sampling date.
+
+    Birth dates are skipped. Dates labelled as the collection date win
+    over the issue date, which wins over any other "date" label, which
+    wins over unlabelled dates. ambiguous is True when the best rank
+    holds several different dates with no collection or issue label.
+    """
+    candidates = []
+    for line in lines:
+        texts = (_fold(line), line.lower())
+        if any(BIRTH_DATE_PATTERN.search(t) for t in texts):
+            continue
+        if any(COLLECTION_DATE_PATTERN.search(t) for t in texts):
+            priority = 0
+        elif any(ISSUE_DATE_PATTERN.search(t) for t in texts):
+            priority = 1
+        elif "дата" in texts[0] or "date" in texts[1]:
+            priority = 2
+        else:
+            priority = 3
+        for match in DATE_PATTERN.finditer(line):
+            if match.group(1):
+                day, month, year = match.group(1), match.group(2), match.group(3)
+            else:
+                year, month, day = match.group(4), match.group(5), match.group(6)
+            if 1 <= int(month) <= 12 and 1 <= int(day) <= 31:
+                candidates.append((priority, f"{year}-{month}-{day}"))
+    if not candidates:
+        return None, False
+    best = min(candidates)
+    ambiguous = best[0] >= 2 and len({date for priority, date in candidates if priority == best[0]}) > 1
+    return best[1], ambiguous
+
+
+def _extract_gender(lines):
+    # Cyrillic words match the folded line, where Latin look-alikes from OCR
+    # are already Cyrillic; Latin ones (sex, female) the lower-cased line
+    for line in lines:
+        texts = (_fold(line), line.lower())
+        if not any(GENDER_LABEL_PATTERN.search(t) for t in texts):
+            continue
+        if any(FEMALE_PATTERN.search(t) for t in texts):
+            return "Female"
+        if any(MALE_PATTERN.search(t) for t in texts):
+            return "Male"
+    return "Unknown"
+
+
+@traced("extract.rules")
+def extract_parameters(text=None, ocr_json=None):
+    """
+    Extracts a report without an LLM.
+
+    Args:
+        text (str): Structured OCR text (one report line per line)
+        ocr_json (list): easyocr_to_json boxes, used when text is not given
+
+    Returns:
+        tuple: (result, coverage, confidence) where result has the same
+            shape as analyze_blood_report output, coverage is the share of
+            parameter-looking rows that were understood and confidence is
+            the mean per-parameter confidence
+    """
+    lines = text.splitlines() if text is not None else boxes_to_lines(ocr_json)
+
+    parameters, confidences = {}, {}
+    candidate_rows, understood_rows = 0, 0
+    for line in lines:
+        folded = _fold(line)
+        is_candidate = _looks_like_parameter_row(folded)
+        candidate_rows += is_candidate
+        parsed = parse_line(line)
+        if parsed is None:
+            continue
+        understood_rows += is_candidate
+        name = parsed["name"]
+        # Keep the most confident reading if a parameter appears twice
+        if name not in parameters or parsed["confidence"] > confidences[name]:
+            parameters[name] = {"name": name, "value": parsed["value"], "unit": parsed["unit"]}
+            confidences[name] = parsed["confidence"]
+
+    coverage = understood_rows / candidate_rows if candidate_rows else 0.0
+    confidence = sum(confidences.values()) / len(confidences) if confidences else 0.0
+    report_date, ambiguous_date = _extract_date(lines)
+    if ambiguous_date:
+        confidence = max(confidence - AMBIGUOUS_DATE_PENALTY, 0.0)
+
+    out_of_range = []
+    for name, p in parameters.items():
+        info = NORMAL_RANGES[name]
+        if info["sd"] and abs(p["value"] - info["mean"]) > 2 * info["sd"]:
+            out_of_range.append(name)
+    summary = (f"Extracted {len(parameters)} parameters locally. "
+               + (f"Outside the usual range: {', '.join(out_of_range)}." if out_of_range
+                  else "No parameters outside the usual range."))
+
+    result = {
+        "report_date": report_date,
+        "gender": _extract_gender(lines),
+        "parameters": list(parameters.values()),
+        "summary": summary,
+    }
+    return result, coverage, confidence
+
+
+def analyze_blood_report_hybrid(text, min_coverage=MIN_COVERAGE, min_confidence=MIN_CONFIDENCE,
+                                min_parameters=MIN_PARAMETERS, ocr_json=None, **llm_kwargs):
+    """
+    Extracts a report with the local rules and falls back to the LLM.
+
+    The LLM is only called when the rules find fewer than min_parameters
+    parameters, understand less than min_coverage of the parameter rows,
+    or their mean confidence is below min_confidence.
+
+    Args:
+        text (str): Structured OCR text
+        ocr_json (list): Optional easyocr_to_json boxes used instead of text
+        **llm_kwargs: Passed to analyze_blood_report (model, temperature, cache, compact)
+
+    Returns:
+        dict: Result in the analyze_blood_report format
+    """
+    result, coverage, confidence = extract_parameters(text if ocr_json is None else None, ocr_json)
+    if (len(result["parameters"]) >= min_parameters and coverage >= min_coverage
+            and confidence >= min_confidence):
+        return result
+    print(f"Rule-based extraction not confident enough (coverage {coverage:.0%}, "
+          f"confidence {confidence:.2f}), falling back to LLM")
+    return analyze_blood_report(text, **llm_kwargs)
@@ -0,0 +1,160 @@
+import json
+
+
+class StreamAborted(ValueError):
+    """
+    Raised when a streamed response is clearly broken.
+
+    Attributes:
+        partial (list): Parameters that were complete before the abort
+    """
+
+    def __init__(self, message, partial=None):
+        super().__init__(message)
+        self.partial = partial or []
+
+
+class IncrementalParametersParser:
+    """
+    Pulls complete entries of the "parameters" array out of a JSON stream.
+
+    Text is fed chunk by chunk as it arrives from the model. The parser
+    tracks strings, escapes and nesting, so each parameter object is
+    handed out as soon as its closing brace arrives, long before the
+    whole response is valid JSON.
+
+    Args:
+        expected_units (dict): Parameter name -> expected unit, used to
+            flag unknown names and wrong units
+        max_invalid (int): Abort once more than this many parameters are
+            invalid and they make up more than half of those seen
+        max_chars (int): Abort if the response grows past this size
+        normalize (callable): Optional parameter -> parameter hook applied
+            to each entry before it is validated, e.g. unit conversion
+    """
+
+    def __init__(self, expected_units=None, max_invalid=5, max_chars=50000, normalize=None):
+        self.expected_units = expected_units or {}
+        self.normalize = normalize
+        self.max_invalid = max_invalid
+        self.max_chars = max_chars
+        self.buffer = []
+        self.parameters = []
+        self.invalid = 0
+        self._length = 0
+        self._started = False
+        self._in_string = False
+        self._escape = False
+        self._depth = 0
+        self._last_key = None
+        self._key_start = None
+        self._array_depth = None
+        self._item_start = None
+
+    def validate(self, parameter):
+        """
+        Returns a list of problems with one parameter entry.
+        """
+        issues = []
+        if not isinstance(parameter, dict):
+            return ["entry is not an object"]
+        name = parameter.get("name")
+        if self.expected_units:
+            if name not in self.expected_units:
+                issues.append(f"unknown parameter name {name!r}")
+            elif str(parameter.get("unit", "")).lower() != self.expected_units[name].lower():
+                issues.append(f"unit {parameter.get('unit')!r} instead of {self.expected_units[name]!r}")
+        if not isinstance(parameter.get("value"), (int, float)):
+            issues.append(f"non-numeric value {parameter.get('value')!r}")
+        return issues
+
+    def _text(self, start, end):
+        return "".join(self.buffer[start:end])
+
+    def feed(self, chunk):
+        """
+        Consumes a chunk of the response.
+
+        Returns:
+            list: (parameter, issues) pairs completed by this chunk
+        """
+        completed = []
+        for ch in chunk:
+            index = self._length
+            self.buffer.append(ch)
+            self._length += 1
+
+            if not self._started:
+                if ch == "{":
+                    self._started = True
+                    self._depth = 1
+                elif self._length > 20 and not ch.isspace():
+                    # Allow a short prefix such as a ```json fence, nothing more
+                    raise StreamAborted("Response does not start with a JSON object")
+                continue
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._key_start is not None:
+                        self._last_key = self._text(self._key_start + 1, index)
+                        self._key_start = None
+                continue
+
+            if ch == '"':
+                self._in_string = True
+                if self._depth == 1:
+                    self._key_start = index
+            elif ch in "{[":
+                self._depth += 1
+                if ch == "[" and self._depth == 2 and self._last_key == "parameters":
+                    self._array_depth = self._depth
+                elif ch == "{" and self._array_depth is not None and self._depth == self._array_depth + 1:
+                    self._item_start = index
+            elif ch in "}]":
+                if ch == "}" and self._item_start is not None and self._depth == self._array_depth + 1:
+                    completed.append(self._complete_item(index))
+                elif ch == "]" and self._depth == self._array_depth:
+                    self._array_depth = None
+                self._depth -= 1
+            elif ch == "," and self._depth == 1:
+                self._last_key = None
+
+        if self._length > self.max_chars:
+            raise StreamAborted(f"Response exceeded {self.max_chars} characters", self.parameters)
+        return completed
+
+    def _complete_item(self, end):
+        raw = self._text(self._item_start, end + 1)
+        self._item_start = None
+        try:
+            parameter = json.loads(raw)
+        except json.JSONDecodeError as e:
+            raise StreamAborted(f"Malformed parameter entry: {e}\n{raw}", self.parameters)
+
+        if self.normalize is not None:
+            parameter = self.normalize(parameter)
+        issues = self.validate(parameter)
+        self.parameters.append(parameter)
+        if issues:
+            self.invalid += 1
+            if self.invalid > self.max_invalid and self.invalid * 2 > len(self.parameters):
+                raise StreamAborted(f"Too many invalid parameters ({self.invalid}/{len(self.parameters)})",
+                                    self.parameters)
+        return parameter, issues
+
+    def result(self):
+        """
+        Parses the complete response once the stream has ended.
+        """
+        text = "".join(self.buffer).strip()
+        start, end = text.find("{"), text.rfind("}")
+        try:
+            return json.loads(text[start:end + 1])
+        except json.JSONDecodeError as e:
+            raise StreamAborted(f"Model did not return valid JSON. Error: {e}\nResponse:\n{text}",
+                                self.parameters)
@@ -0,0 +1,108 @@
+import argparse
+import asyncio
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .llm_client import AsyncLLMClient, HTTPBackend
+
+# Canned answer in the format analyze_blood_report expects
+STUB_RESPONSE = {
+    "report_date": "2025-03-04",
+    "gender": "Female",
+    "parameters": [
+        {"name": "Hemoglobin", "value": 126, "unit": "g/L"},
+        {"name": "White Blood Cells", "value": 6.1, "unit": "10^9/L"},
+        {"name": "Platelets", "value": 250, "unit": "10^9/L"},
+    ],
+    "summary": "Stub response",
+}
+
+
+def make_handler(latency=0.5, error_rate=0.0, response=None, responder=None):
+    """
+    Builds a request handler that mimics /v1/chat/completions.
+
+    Args:
+        latency (float): Seconds to sleep before answering
+        error_rate (float): Fraction of requests answered with HTTP 429
+        response (dict): JSON object returned as the message content
+        responder: Optional callable taking the request payload and
+            returning the JSON object to answer with, instead of response
+    """
+    fixed_content = json.dumps(response or STUB_RESPONSE, ensure_ascii=False)
+
+    class StubHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length', 0))
+            payload = self.rfile.read(length)
+            content = fixed_content
+            if responder is not None:
+                content = json.dumps(responder(json.loads(payload.decode('utf-8'))), ensure_ascii=False)
+            time.sleep(latency)
+            if random.random() < error_rate:
+                self.send_response(429)
+                self.end_headers()
+                return
+            body = json.dumps({"choices": [{"message": {"role": "assistant", "content": content}}]})
+            body = body.encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return StubHandler
+
+
+def serve(port=8011, latency=0.5, error_rate=0.0, responder=None):
+    """
+    Starts the stub server in a background thread.
+
+    Returns:
+        ThreadingHTTPServer: Call shutdown() on it when done
+    """
+    server = ThreadingHTTPServer(('127.0.0.1', port), make_handler(latency, error_rate, responder=responder))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+async def measure_throughput(base_url, n_reports=200, concurrency=16, tokens_per_minute=None):
+    from .blood_analysis_extractor import analyze_blood_reports_async
+
+    client = AsyncLLMClient(HTTPBackend(base_url), concurrency=concurrency,
+                            tokens_per_minute=tokens_per_minute, base_delay=0.1)
+    texts = [f"Report {i}: Гемоглобин 126 г/л" for i in range(n_reports)]
+    start = time.perf_counter()
+    results = await analyze_blood_reports_async(texts, client)
+    elapsed = time.perf_counter() - start
+
+    ok = sum(1 for r in results if isinstance(r, dict))
+    stats = client.stats()
+    print(f"{ok}/{n_reports} reports in {elapsed:.2f}s ({ok / elapsed:.1f} reports/sec), "
+          f"concurrency={concurrency}, retries={stats['retries']}, "
+          f"p50={stats['p50_latency']:.3f}s, p95={stats['p95_latency']:.3f}s")
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure extraction throughput against a local stub LLM server.")
+    parser.add_argument('--port', type=int, default=8011)
+    parser.add_argument('--latency', type=float, default=0.5, help="Simulated model latency in seconds")
+    parser.add_argument('--error-rate', type=float, default=0.05, help="Fraction of 429 responses")
+    parser.add_argument('--reports', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32])
+    args = parser.parse_args()
+
+    server = serve(args.port, args.latency, args.error_rate)
+    try:
+        for concurrency in args.concurrency:
+            asyncio.run(measure_throughput(f"http://127.0.0.1:{args.port}/v1",
+                                           args.reports, concurrency))
+    finally:
+        server.shutdown()
@@ -0,0 +1,266 @@
+import math
+import re
+
+import numpy as np
+
+from .blood_analysis_extractor import NORMAL_RANGES
+
+# Unit -> (dimension, scale). Units of one dimension convert by the ratio
+# of their scales: 1 g/dL = 10 g/L, 1 /uL = 1e6 /L.
+UNITS = {
+    "g/L": ("mass_concentration", 1.0),
+    "g/dL": ("mass_concentration", 10.0),
+    "mg/L": ("mass_concentration", 0.001),
+    "mg/dL": ("mass_concentration", 0.01),
+    "mmol/L": ("molar_concentration", 1.0),
+    "10^9/L": ("count", 1e9),
+    "10^12/L": ("count", 1e12),
+    "/uL": ("count", 1e6),
+    "%": ("fraction", 1.0),
+    "L/L": ("fraction", 100.0),
+    "fL": ("volume", 1.0),
+    "pg": ("mass", 1.0),
+    "mm/h": ("rate", 1.0),
+}
+
+# How units are printed on Russian and English lab sheets
+UNIT_SPELLINGS = {
+    "g/L": ["g/L", "г/л", "гр/л"],
+    "g/dL": ["g/dL", "г/дл", "g/100mL", "г/100мл"],
+    "mg/L": ["mg/L", "мг/л"],
+    "mg/dL": ["mg/dL", "мг/дл", "мг%"],
+    "mmol/L": ["mmol/L", "ммоль/л"],
+    "10^9/L": ["10^9/L", "10^9/л", "×10^9/л", "10⁹/л", "×10⁹/л", "10*9/л", "тыс/мкл", "тыс./мкл", "10^3/мкл",
+               "10^3/uL", "10³/мкл", "K/uL"],
+    "10^12/L": ["10^12/L", "10^12/л", "×10^12/л", "10¹²/л", "×10¹²/л", "10*12/л", "млн/мкл", "млн./мкл",
+                "10^6/мкл", "10^6/uL", "10⁶/мкл", "M/uL"],
+    "/uL": ["/uL", "/мкл", "кл/мкл", "cells/uL"],
+    "%": ["%"],
+    "L/L": ["L/L", "л/л"],
+    "fL": ["fL", "фл", "мкм3", "мкм^3", "мкм³", "um3", "um^3"],
+    "pg": ["pg", "пг"],
+    "mm/h": ["mm/h", "mm/hr", "мм/ч", "мм/час"],
+}
+
+# How each NORMAL_RANGES unit is printed on Russian lab sheets
+RUSSIAN_UNITS = {
+    "g/L": "г/л",
+    "10^9/L": "10^9/л",
+    "10^12/L": "10^12/л",
+    "%": "%",
+    "fL": "фл",
+    "pg": "пг",
+    "mm/h": "мм/ч",
+    "mmol/L": "ммоль/л",
+    "mg/L": "мг/л",
+}
+
+# g/mol, for mass <-> molar concentration; LDL and HDL are reported as cholesterol
+MOLAR_MASSES = {
+    "Glucose": 180.16,
+    "LDL": 386.65,
+    "HDL": 386.65,
+}
+
+_SUPERSCRIPTS = (("10¹²", "10^12"), ("10⁹", "10^9"), ("10⁶", "10^6"), ("10³", "10^3"), ("³", "3"))
+_PREFIX = re.compile(r"^[x×*·]")
+
+
+def unit_key(unit):
+    """
+    Folds a printed unit into the form used for lookups: lower case, no
+    spaces or multiplication sign, superscripts and 10*9 written as 10^9.
+    """
+    key = str(unit).strip().lower().replace(" ", "").replace("ё", "е").replace("µ", "u").replace("μ", "u")
+    for superscript, plain in _SUPERSCRIPTS:
+        key = key.replace(superscript, plain)
+    key = _PREFIX.sub("", key)
+    return re.sub(r"10\*(\d)", r"10^\1", key)
+
+
+def _conversion(name, unit, canonical):
+    # Factor and offset from unit to canonical, or None if they do not convert
+    dimension, scale = UNITS[unit]
+    canonical_dimension, canonical_scale = UNITS[canonical]
+    if dimension == canonical_dimension:
+        return scale / canonical_scale, 0.0
+    molar_mass = MOLAR_MASSES.get(name)
+    if molar_mass is None:
+        return None
+    if (dimension, canonical_dimension) == ("mass_concentration", "molar_concentration"):
+        return scale * 1000.0 / molar_mass / canonical_scale, 0.0
+    if (dimension, canonical_dimension) == ("molar_concentration", "mass_concentration"):
+        return scale * molar_mass / 1000.0 / canonical_scale, 0.0
+    return None
+
+
+class UnitTable:
+    """
+    Unit conversions for every NORMAL_RANGES parameter, compiled into matrices.
+
+    A value in unit column u of parameter row p converts to the parameter's
+    canonical (NORMAL_RANGES) unit as value * factors[p, u] + offsets[p, u].
+    Unconvertible pairs hold NaN.
+
+    Attributes:
+        names (list): Parameter names, one per row
+        index (dict): Parameter name -> row
+        units (list): Unit tokens, one per column
+        canonical (list): Canonical unit per row
+        factors (np.ndarray): (parameters x units) multipliers
+        offsets (np.ndarray): (parameters x units) offsets
+    """
+
+    def __init__(self, normal_ranges=NORMAL_RANGES):
+        self.names = list(normal_ranges)
+        self.index = {name: i for i, name in enumerate(self.names)}
+        self.units = list(UNITS)
+        self.canonical = [normal_ranges[name]["unit"] for name in self.names]
+        self.factors = np.full((len(self.names), len(self.units)), np.nan)
+        self.offsets = np.zeros((len(self.names), len(self.units)))
+        for p, (name, canonical) in enumerate(zip(self.names, self.canonical)):
+            if canonical not in UNITS:
+                continue
+            for u, unit in enumerate(self.units):
+                conversion = _conversion(name, unit, canonical)
+                if conversion is not None:
+                    self.factors[p, u], self.offsets[p, u] = conversion
+        self._spellings = {unit_key(spelling): self.units.index(unit)
+                           for unit, spellings in UNIT_SPELLINGS.items() for spelling in spellings}
+        self._columns = {}
+
+    def unit_column(self, unit):
+        """
+        Returns the column of a printed unit, or -1 if it is not known.
+        """
+        if not isinstance(unit, str):
+            return -1
+        column = self._columns.get(unit)
+        if column is None:
+            column = self._spellings.get(unit_key(unit), -1)
+            self._columns[unit] = column
+        return column
+
+    def convert(self, name, value, unit):
+        """
+        Converts one value to its parameter's canonical unit.
+
+        Values printed as text ("13,5") are parsed. Unknown parameters,
+        units, unconvertible pairs and values that are not numbers are
+        returned as they are.
+
+        Returns:
+            tuple: (value, unit)
+        """
+        p = self.index.get(name)
+        u = self.unit_column(unit)
+        number = parse_number(value)
+        if p is None or u < 0 or number is None or math.isnan(self.factors[p, u]):
+            return value, unit
+        factor, offset = float(self.factors[p, u]), float(self.offsets[p, u])
+        if factor == 1.0 and offset == 0.0:
+            # Numbers keep their type; only text is replaced by its value
+            return (value if number == value else number), self.canonical[p]
+        return number * factor + offset, self.canonical[p]
+
+    def convert_batch(self, names, cols, units, values):
+        """
+        Converts many values at once, exactly like convert does one by one.
+
+        Args:
+            names (list): Parameter name of every column index in cols
+            cols (np.ndarray): Column index into names per value
+            units (list): Printed unit per value
+            values (np.ndarray): float64 values, converted in place
+
+        Returns:
+            tuple: (values, converted) where converted marks values whose
+                unit was recognized and now is the canonical one
+        """
+        rows = np.array([self.index.get(name, -1) for name in names], dtype=np.intp)[cols]
+        columns = np.fromiter(map(self.unit_column, units), dtype=np.intp, count=len(units))
+        known = (rows >= 0) & (columns >= 0)
+        factors = np.full(len(values), np.nan)
+        offsets = np.zeros(len(values))
+        factors[known] = self.factors[rows[known], columns[known]]
+        offsets[known] = self.offsets[rows[known], columns[known]]
+        converted = ~np.isnan(factors)
+        # Identity conversions leave the value untouched, as convert does
+        scale = converted & ((factors != 1.0) | (offsets != 0.0))
+        values[scale] = values[scale] * factors[scale] + offsets[scale]
+        return values, converted
+
+
+_DEFAULT_TABLE = None
+
+
+def default_table():
+    global _DEFAULT_TABLE
+    if _DEFAULT_TABLE is None:
+        _DEFAULT_TABLE = UnitTable()
+    return _DEFAULT_TABLE
+
+
+def parse_number(value):
+    """
+    Returns value as a float, or None if it is not a finite number.
+
+    Text with a decimal comma ("13,5") is parsed; qualified results such
+    as "<5" or "negative" are not numbers.
+    """
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        number = float(value)
+    else:
+        try:
+            number = float(str(value).replace(",", ".").strip())
+        except ValueError:
+            return None
+    return number if math.isfinite(number) else None
+
+
+def normalize_parameters(parameters, table=None):
+    """
+    Converts extracted {"name", "value", "unit"} dicts to canonical units.
+
+    Values printed as text are parsed (decimal comma included). A value
+    that is not a number ("<5", "negative") becomes None and is kept as
+    printed in raw_value, so scoring and plotting can skip it. Entries
+    whose unit is unknown keep their unit.
+
+    Returns:
+        list: New parameter dicts in the same order
+    """
+    table = table or default_table()
+    normalized = list(parameters)
+    numeric = []
+    for i, p in enumerate(parameters):
+        if not isinstance(p, dict):
+            continue
+        value = parse_number(p.get("value"))
+        if value is not None:
+            numeric.append((i, value))
+        elif p.get("value") is not None:
+            normalized[i] = dict(p, value=None, raw_value=p["value"])
+    if not numeric:
+        return normalized
+
+    names = [parameters[i].get("name") for i, _ in numeric]
+    units = [parameters[i].get("unit") for i, _ in numeric]
+    values = np.array([value for _, value in numeric], dtype=np.float64)
+    values, converted = table.convert_batch(names, np.arange(len(names)), units, values)
+
+    for k, (i, value) in enumerate(numeric):
+        original = parameters[i]["value"]
+        if not isinstance(original, (int, float)):
+            original = value
+        if not converted[k]:
+            if original is not parameters[i]["value"]:
+                normalized[i] = dict(parameters[i], value=original)
+            continue
+        if float(values[k]) != value:
+            # Drop float noise such as 4.99560000000001 from the conversion
+            original = round(float(values[k]), 4)
+        normalized[i] = dict(parameters[i], value=original, unit=table.canonical[table.index[names[k]]])
+    return normalized